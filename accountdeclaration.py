@@ -1,10 +1,12 @@
 import collections
 from dataclasses import dataclass
+from typing import Tuple
 import unittest
 
 from accountingsystemerror import AccountingSystemError
  
 allowed_account_categories = {"Asset", "Liability", "Equity", "Revenue", "Expense"}
+account_separator = ':'  # separates the levels of a sub-account name, as in Utilities:Electric
 
 @dataclass(frozen=True)
 class AccountDeclaration:
@@ -15,6 +17,11 @@ class AccountDeclaration:
         assert isinstance(self.category, str)
         assert isinstance(self.name, str)
         assert self.category in allowed_account_categories
+        assert all(len(part) > 0 for part in self.path())
+
+    # the levels of the account name, from the top group down to the account itself
+    def path(self) -> Tuple[str, ...]:
+        return tuple(self.name.split(account_separator))
 
     @classmethod
     def allowed_account_categories(cls):
@@ -26,6 +33,9 @@ class Test(unittest.TestCase):
         x = AccountDeclaration(category='Asset', name='Cash')
         self.assertEqual(x.category, 'Asset')
         self.assertEqual(x.name, 'Cash')
+        self.assertEqual(('Cash',), x.path())
+        x = AccountDeclaration(category='Expense', name='Utilities:Electric')
+        self.assertEqual(('Utilities', 'Electric'), x.path())
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
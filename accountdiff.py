@@ -0,0 +1,134 @@
+# Find the accounts that differ between two AccountingSystems
+# Each AccountingSystem keeps a hash of every account's ledger and a root hash over all accounts, updated on
+# each join, so identical books compare in O(1) and otherwise only the accounts whose hashes differ are examined.
+# Ledgers are in date order, so a back-dated posting lands in the middle of one; the postings of an account are compared
+# as multisets by posting_key, in O(length of the ledgers), rather than position by position. Books whose ledgers have
+# been flushed no longer have the postings, so for them only the accounts that differ are found.
+from dataclasses import dataclass
+from typing import List, Tuple, Union
+import collections
+import datetime
+import unittest
+
+from accountdeclaration import AccountDeclaration
+from accountingsystem import AccountingSystem, posting_key
+from amount import Amount
+from journalentry import JournalEntry
+from ledgerentry import LedgerEntry
+
+@dataclass(frozen=True)
+class AccountDiff:
+    account: str
+    status: str                                     # 'added', 'removed' or 'changed'
+    category: str                                   # in b, or in a if removed
+    new_postings: Union[Tuple[LedgerEntry, ...], None]           # postings in b and not in a, in date order; None if unknown
+    removed_postings: Union[Tuple[LedgerEntry, ...], None] = ()  # postings in a and not in b, in date order; None if unknown
+
+    def __post_init__(self):
+        assert self.status in {'added', 'removed', 'changed'}
+
+# Return the accounts that differ from a to b, in account name order
+def diff(a: AccountingSystem, b: AccountingSystem) -> List[AccountDiff]:
+    if a.root_hash == b.root_hash: return []
+    flushed = a.ledgers_flushed or b.ledgers_flushed
+    r = []
+    for account in sorted(a.ledger_hashes.keys() | b.ledger_hashes.keys()):
+        a_hash = a.ledger_hashes.get(account, None)
+        b_hash = b.ledger_hashes.get(account, None)
+        if a_hash == b_hash and a.category_for.get(account) == b.category_for.get(account): continue
+        if a_hash is None:
+            r.append(AccountDiff(account, 'added', b.category_for[account], None if flushed else tuple(b.ledgers.get(account, []))))
+        elif b_hash is None:
+            r.append(AccountDiff(account, 'removed', a.category_for[account], (), None if flushed else tuple(a.ledgers.get(account, []))))
+        elif flushed:
+            r.append(AccountDiff(account, 'changed', b.category_for[account], None, None))
+        else:
+            a_ledger = a.ledgers.get(account, [])
+            b_ledger = b.ledgers.get(account, [])
+            r.append(AccountDiff(
+                account,
+                'changed',
+                b.category_for[account],
+                _postings_not_in(b_ledger, a_ledger),
+                _postings_not_in(a_ledger, b_ledger)))
+    return r
+
+# Return the postings of ledger that other does not have, counting repeated postings, in the order of ledger
+def _postings_not_in(ledger: List[LedgerEntry], other: List[LedgerEntry]) -> Tuple[LedgerEntry, ...]:
+    unmatched = collections.Counter(posting_key(e) for e in other)
+    r = []
+    for e in ledger:
+        key = posting_key(e)
+        if unmatched[key] > 0:
+            unmatched[key] -= 1
+        else:
+            r.append(e)
+    return tuple(r)
+
+
+class Test(unittest.TestCase):
+    def test_diff(self):
+        def je(day, dollars, debit_account, credit_account):
+            return JournalEntry(
+                date=datetime.date(2025, 1, day),
+                amount=Amount(dollars=dollars, cents=0),
+                debit_account=debit_account,
+                credit_account=credit_account,
+                description='',
+                source='book.txt',
+                source_location=f'line {day}')
+        def build(commands):
+            x = AccountingSystem.empty()
+            for command in commands:
+                x = x.join(command)
+            return x
+        declarations = [
+            AccountDeclaration(category='Asset', name='cash'),
+            AccountDeclaration(category='Equity', name='owners equity'),
+            AccountDeclaration(category='Expense', name='supplies'),
+        ]
+        january = declarations + [je(1, 100, 'cash', 'owners equity')]
+        a = build(january)
+        self.assertEqual([], diff(a, build(january)))
+
+        # a back-dated entry is the only new posting, though it lands before others in the ledgers
+        february = january + [je(5, 1, 'supplies', 'cash'), je(5, 1, 'supplies', 'cash'), je(9, 2, 'supplies', 'cash')]
+        backdated = build(february + [je(3, 7, 'supplies', 'cash'), je(5, 1, 'supplies', 'cash')])
+        changes = {x.account: x for x in diff(build(february), backdated)}
+        self.assertEqual({'cash', 'supplies'}, changes.keys())
+        self.assertEqual([(3, 7), (5, 1)], [(e.date.day, e.balance.amount.dollars) for e in changes['cash'].new_postings])
+        self.assertEqual((), changes['cash'].removed_postings)
+        self.assertEqual([(3, 7), (5, 1)], [(e.date.day, e.balance.amount.dollars) for e in diff(backdated, build(february))[0].removed_postings])
+
+        b = build(january + [je(2, 10, 'supplies', 'cash'), AccountDeclaration(category='Expense', name='rent')])
+        changes = {x.account: x for x in diff(a, b)}
+        self.assertEqual({'cash', 'supplies', 'rent'}, changes.keys())
+        self.assertEqual('changed', changes['cash'].status)
+        self.assertEqual(1, len(changes['cash'].new_postings))
+        self.assertEqual('credit', changes['cash'].new_postings[0].balance.side)
+        self.assertEqual('added', changes['rent'].status)
+        self.assertEqual(['removed'], [x.status for x in diff(b, a) if x.account == 'rent'])
+        # a removed account lists the postings it had
+        removed = {x.account: x for x in diff(b, build([x for x in january if getattr(x, 'name', None) != 'supplies']))}['supplies']
+        self.assertEqual(('removed', (), tuple(b.ledgers['supplies'])), (removed.status, removed.new_postings, removed.removed_postings))
+        self.assertEqual(1, len(removed.removed_postings))
+
+        # the hashes ignore where the postings were read from
+        moved = [x if isinstance(x, AccountDeclaration) else JournalEntry(**{**vars(x), 'source_location': 'line 99'}) for x in january]
+        self.assertEqual([], diff(a, build(moved)))
+        b.verify()
+
+        # a system kept from before a join is unchanged by it
+        c = a.join(je(3, 5, 'supplies', 'cash'))
+        a.verify()
+        self.assertEqual(['cash', 'supplies'], [x.account for x in diff(a, c)])
+        self.assertEqual([], diff(a, build(january)))
+
+        # once a's ledgers are flushed the accounts that differ are still found, but not the postings
+        changes = diff(a.flush_ledgers(), c)
+        self.assertEqual(['cash', 'supplies'], [x.account for x in changes])
+        self.assertEqual([(None, None)] * 2, [(x.new_postings, x.removed_postings) for x in changes])
+        self.assertEqual([], diff(a.flush_ledgers(), build(january)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,14 +2,15 @@
 import collections.abc
 from dataclasses import dataclass
 import dataclasses
-import copy
 import datetime
-from typing import Dict, List, Self, Union
+import hashlib
+from typing import Dict, List, Self, Tuple, Union
 import unittest
 
 from pprint import pprint
 
-from accountdeclaration import AccountDeclaration
+from accountdeclaration import AccountDeclaration, account_separator
+from activity import Activity, Month, month_of, next_month
 from amount import Amount
 from accountingsystemerror import AccountingSystemError
 from balance import Balance
@@ -17,39 +18,219 @@ from journalentry import JournalEntry
 from ledgerentry import LedgerEntry
 from line import Line
 
+import utility as u
+
 @dataclass(frozen=True)
 class AccountingSystem:
     category_for: Dict[str, str]
-    ledgers: Dict[str, List[LedgerEntry]]  # account_name : [LedgerEntry]
+    ledgers: Dict[str, List[LedgerEntry]]  # account_name : [LedgerEntry] in date order, then in the order joined
     balances: Dict[str, Balance]           # account_name: Balance
+    debit_total_cents: int = 0             # sum of the amounts of all debit postings
+    credit_total_cents: int = 0            # sum of the amounts of all credit postings
+    ledger_hashes: Dict[str, bytes] = dataclasses.field(default_factory=dict)  # account_name: hash of the postings in its ledger
+    root_hash: int = 0                     # XOR over the accounts of _leaf_hash
+    monthly_activity: Dict[Tuple[str, int, int], Activity] = dataclasses.field(default_factory=dict)  # (account_name, year, month): Activity
+    yearly_activity: Dict[Tuple[str, int], Activity] = dataclasses.field(default_factory=dict)        # (account_name, year): Activity
+    rollup: Dict[Tuple[str, ...], int] = dataclasses.field(default_factory=dict)  # (category,) + a prefix of an account path: signed cents of the accounts under it
+    ledgers_flushed: bool = False          # whether postings have been dropped from the ledgers by flush_ledgers
 
     def __post_init__(self):
         assert isinstance(self.category_for, dict)
         assert isinstance(self.ledgers, dict)
         assert isinstance(self.balances, dict)
+        assert isinstance(self.debit_total_cents, int)
+        assert isinstance(self.credit_total_cents, int)
 
     @classmethod
     def empty(cls) -> 'AccountingSystem':
         return AccountingSystem(category_for={}, ledgers={}, balances={})
 
     def render(self) -> List[str]:
-        r = []
-        r.append('AccountingSystem')
+        return list(self.iter_render())
+
+    # Yield the lines of render one at a time, each ledger entry formatted once
+    # With accounts, only those accounts are shown; with start or end, only the ledger entries dated start through end.
+    def iter_render(
+            self,
+            accounts: Union[collections.abc.Collection, None] = None,
+            start: Union[datetime.date, None] = None,
+            end: Union[datetime.date, None] = None):
+        def in_range(v):
+            date = getattr(v, 'date', None)
+            if date is None: return True
+            return (start is None or start <= date) and (end is None or date <= end)
         def show(name, value):
-            r.append(f'  {name}')
+            yield f'  {name}'
             for k, v in value.items():
-                if isinstance(v, collections.abc.Sequence):
-                    r.append(f'    {k}')
+                if accounts is not None and k not in accounts: continue
+                if isinstance(v, collections.abc.Sequence) and not isinstance(v, str):
+                    yield f'    {k}'
                     for v1 in v:
-                        r.append(f'      {v}')
+                        if in_range(v1):
+                            yield f'      {v1}'
                 else:
-                    r.append(f'    {k}: {v}')
-        show('category_for', self.category_for)
-        show('ledgers', self.ledgers)
-        show('balances', self.balances)
+                    yield f'    {k}: {v}'
+        yield 'AccountingSystem'
+        yield from show('category_for', self.category_for)
+        yield from show('ledgers', self.ledgers)
+        yield from show('balances', self.balances)
+
+    # Return the system with an account declaration or a journal entry joined; self is unchanged
+    # A join copies the dicts of the books and the ledgers of the accounts it posts to, so loops that join many items
+    # join them to a Builder and freeze it once.
+    def join(self, other) -> Self:
+        return Builder(self).join(other).freeze()
+
+    # Return the books with empty ledgers, keeping the balances, hashes, activity, totals and rollup of every posting, as
+    # when the ledger entries have been written out and memory is to be bounded by the accounts and months
+    def flush_ledgers(self) -> Self:
+        return dataclasses.replace(self, ledgers={}, ledgers_flushed=True)
+
+    # Return the balance in signed cents of a node of the rollup tree: a category, a group of accounts in it, or an
+    # account, as in rollup_cents('Expense', 'Utilities')
+    def rollup_cents(self, category: str, *path: str) -> int:
+        node = (category,) + path
+        if node not in self.rollup:
+            raise ValueError(f'no account or group {account_separator.join(node)}')
+        return self.rollup[node]
+
+    # Return (node, signed cents) for the nodes of the rollup tree down to max_depth, where a category has depth 1
+    # Categories are in the usual order, and each node is followed by its children in name order.
+    def rollup_rows(self, max_depth: Union[int, None] = None) -> List[Tuple[Tuple[str, ...], int]]:
+        nodes = [node for node in self.rollup.keys() if max_depth is None or len(node) <= max_depth]
+        nodes.sort(key=lambda node: (rollup_categories.index(node[0]), node[1:]))
+        return [(node, self.rollup[node]) for node in nodes]
+
+    # Return the ledger entries of an account dated start through end, found by binary search on the date order
+    def ledger_between(self, account: str, start: datetime.date, end: datetime.date) -> List[LedgerEntry]:
+        if account not in self.category_for:
+            raise ValueError(f'account {account} not previously defined')
+        return u.slice_in_order(self.ledgers.get(account, []), start, end, key=_ledger_date)
+
+    # Return the activity of an account in the months first through last, inclusive
+    # Whole calendar years in the range are read from the yearly buckets, so a range costs at most 22 monthly lookups
+    # plus one lookup per year, however many postings it covers.
+    def activity(self, account: str, first: Month, last: Month) -> Activity:
+        if account not in self.category_for:
+            raise ValueError(f'account {account} not previously defined')
+        r = Activity.zero()
+        month = first
+        while month <= last:
+            year, m = month
+            if m == 1 and (year, 12) <= last:
+                r = r.add(self.yearly_activity.get((account, year), Activity.zero()))
+                month = (year + 1, 1)
+            else:
+                r = r.add(self.monthly_activity.get((account, year, m), Activity.zero()))
+                month = next_month(month)
         return r
 
+    # Return the activity of an account from start through end, which must be the first and last days of months
+    def activity_between(self, account: str, start: datetime.date, end: datetime.date) -> Activity:
+        if start.day != 1:
+            raise ValueError(f'start date {start} is not the first day of a month')
+        if (end + datetime.timedelta(days=1)).day != 1:
+            raise ValueError(f'end date {end} is not the last day of a month')
+        return self.activity(account, month_of(start), month_of(end))
+
+    # Recompute the balances and the debit and credit totals from the ledgers and check them against the balances
+    # and totals maintained by join. Raise AccountingSystemError describing every difference. Once the ledgers have
+    # been flushed, only what does not need the postings is checked: the root hash against the ledger hashes, the
+    # debit total against the credit total and the rollup against the balances.
+    def verify(self) -> None:
+        problems = []
+        if self.ledgers_flushed:
+            root_hash = 0
+            for account, category in self.category_for.items():
+                root_hash ^= _leaf_hash(account, category, self.ledger_hashes.get(account, empty_ledger_hash))
+            if root_hash != self.root_hash:
+                problems.append('the root hash does not match the ledger hashes')
+            if self.debit_total_cents != self.credit_total_cents:
+                problems.append(f'debits total {self.debit_total_cents} cents but credits total {self.credit_total_cents} cents')
+        else:
+            problems.extend(self._ledger_problems())
+        rollup = {}
+        for account, category in self.category_for.items():
+            for node in _rollup_nodes(category, account):
+                rollup[node] = rollup.get(node, 0) + _signed_cents(self.balances, account)
+        if rollup != self.rollup:
+            problems.append('the rollup tree does not match the balances')
+        if len(problems) > 0:
+            raise AccountingSystemError('; '.join(problems))
+
+    # Return the differences between the ledgers and the balances, hashes, activity and totals maintained by join
+    def _ledger_problems(self) -> List[str]:
+        problems = []
+        debit_total_cents = 0
+        credit_total_cents = 0
+        for account, ledger in self.ledgers.items():
+            debits = sum(e.balance.amount.to_cents() for e in ledger if e.balance.side == 'debit')
+            credits = sum(e.balance.amount.to_cents() for e in ledger if e.balance.side == 'credit')
+            debit_total_cents += debits
+            credit_total_cents += credits
+            balance = self.balances.get(account, None)
+            if not isinstance(balance, Balance):
+                problems.append(f'account {account} has a ledger but its balance is {balance!r}')
+            elif balance.signed_cents() != debits - credits:
+                problems.append(f'account {account} has balance {balance.signed_cents()} cents but its ledger sums to {debits - credits} cents')
+        for account in self.balances.keys() - self.ledgers.keys():
+            problems.append(f'account {account} has a balance but no ledger')
+        root_hash = 0
+        for account, category in self.category_for.items():
+            ledger_hash = empty_ledger_hash
+            for ledger_entry in self.ledgers.get(account, []):
+                ledger_hash = _hash_posting(ledger_hash, ledger_entry)
+            if ledger_hash != self.ledger_hashes.get(account, None):
+                problems.append(f'account {account} has a ledger hash that does not match its ledger')
+            root_hash ^= _leaf_hash(account, category, ledger_hash)
+        if root_hash != self.root_hash:
+            problems.append('the root hash does not match the ledgers')
+        monthly_activity = {}
+        yearly_activity = {}
+        for account, ledger in self.ledgers.items():
+            for e in ledger:
+                posted = Activity.posting(e.balance.side, e.balance.amount.to_cents())
+                month_key = (account, e.date.year, e.date.month)
+                year_key = (account, e.date.year)
+                monthly_activity[month_key] = monthly_activity.get(month_key, Activity.zero()).add(posted)
+                yearly_activity[year_key] = yearly_activity.get(year_key, Activity.zero()).add(posted)
+        if monthly_activity != self.monthly_activity:
+            problems.append('the monthly activity does not match the ledgers')
+        if yearly_activity != self.yearly_activity:
+            problems.append('the yearly activity does not match the ledgers')
+        if debit_total_cents != credit_total_cents:
+            problems.append(f'debits total {debit_total_cents} cents but credits total {credit_total_cents} cents')
+        if debit_total_cents != self.debit_total_cents:
+            problems.append(f'ledger debits total {debit_total_cents} cents but the running total is {self.debit_total_cents} cents')
+        if credit_total_cents != self.credit_total_cents:
+            problems.append(f'ledger credits total {credit_total_cents} cents but the running total is {self.credit_total_cents} cents')
+        return problems
+
+# A mutable AccountingSystem for loops that join many items: join updates the books in place, in O(depth of the
+# accounts) plus a ledger insertion, and freeze returns them as an AccountingSystem. The books are shared with the
+# AccountingSystem a builder is made from or frozen to, and a dict or a ledger is copied the first time the builder
+# changes it after that, so an AccountingSystem is never changed and a builder can go on joining after freeze.
+class Builder:
+    def __init__(self, x: Union[AccountingSystem, None] = None):
+        self._thaw(AccountingSystem.empty() if x is None else x)
+
+    def _thaw(self, x: AccountingSystem) -> None:
+        self.category_for = dict(x.category_for)
+        self.ledgers = dict(x.ledgers)
+        self.balances = dict(x.balances)
+        self.debit_total_cents = x.debit_total_cents
+        self.credit_total_cents = x.credit_total_cents
+        self.ledger_hashes = dict(x.ledger_hashes)
+        self.root_hash = x.root_hash
+        self.monthly_activity = dict(x.monthly_activity)
+        self.yearly_activity = dict(x.yearly_activity)
+        self.rollup = dict(x.rollup)
+        self.ledgers_flushed = x.ledgers_flushed
+        self._owned_ledgers = set()  # the accounts whose ledgers have been copied since the thaw
+        self._frozen = None          # the AccountingSystem the books were last frozen to, until the next join
+
     def join(self, other) -> Self:
+        if self._frozen is not None: self._thaw(self._frozen)
         if isinstance(other, AccountDeclaration): return self._join_account_declaration(other)
         if isinstance(other, JournalEntry): return self._join_journal_entry(other)
         assert False, f'attempt to join a {type(other)}'
@@ -57,56 +238,150 @@ class AccountingSystem:
     def _join_account_declaration(self, ad: AccountDeclaration) -> Self:
         existing_category = self.category_for.get(ad.name, None)
         if existing_category is None:
-            new_category_for = copy.deepcopy(self.category_for)
-            new_category_for[ad.name] = ad.category
-            return dataclasses.replace(self, category_for=new_category_for)
+            self.category_for[ad.name] = ad.category
+            open_account(self, ad)
         else:
             assert existing_category == ad.category
-            return self
+        return self
 
     def _join_journal_entry(self, je: JournalEntry) -> Self:
         if je.debit_account not in self.category_for:
             raise ValueError(f'account {je.debit_account} not previously defined')
         if je.credit_account not in self.category_for:
             raise ValueError(f'account {je.credit_account} not previously defined')
-        debit_ledger_entry = LedgerEntry(
-                date=je.date,
-                balance=Balance(side='debit', amount=je.amount),
-                description=je.description,
-                source=je.source,
-                source_location=je.source_location
-            )
-        credit_ledger_entry = LedgerEntry(
-                date=je.date,
-                balance=Balance(side='credit', amount=je.amount),
-                description=je.description,
-                source=je.source,
-                source_location=je.source_location)
-        def make_new_ledgers():  # the dict values are lists of ledger entries
-            new_ledgers = copy.deepcopy(self.ledgers)
-            if je.debit_account not in new_ledgers:
-                new_ledgers[je.debit_account] = []
-            if je.credit_account not in new_ledgers:
-                new_ledgers[je.credit_account] = []
-            new_ledgers[je.debit_account].append(debit_ledger_entry)
-            new_ledgers[je.credit_account].append(credit_ledger_entry)
-            return new_ledgers
-        def make_new_balances():  # the dict values are a single ledger entry
-            new_balances = copy.deepcopy(self.balances)
-            if je.debit_account in new_balances:
-                new_balances[je.debit_account] = new_balances[je.debit_account].add(Balance(side='debit', amount=je.amount))
-            else:
-                new_balances[je.debit_account] = Balance(side='debit', amount=je.amount)
-            if je.credit_account in new_balances:
-                new_balances[je.credit_account] = new_balances[je.credit_account].add(Balance(side='credit', amount=je.amount))
-            else:
-                new_balances[je.credit_account] = new_balances
-            return new_balances
-        return dataclasses.replace(
-            self,
-            ledgers=make_new_ledgers(),
-            balances=make_new_balances()
-        )
+        new_balances = checked_balances_after(self.balances, je)  # before anything is changed
+        for account, side in ((je.debit_account, 'debit'), (je.credit_account, 'credit')):
+            post(self, self._owned_ledger(account), account, self.category_for[account], side, je, new_balances[account])
+        return self
+
+    def _owned_ledger(self, account: str) -> List[LedgerEntry]:
+        if account not in self._owned_ledgers:
+            self.ledgers[account] = list(self.ledgers.get(account, []))
+            self._owned_ledgers.add(account)
+        return self.ledgers[account]
+
+    def freeze(self) -> AccountingSystem:
+        if self._frozen is None:
+            self._frozen = AccountingSystem(
+                category_for=self.category_for,
+                ledgers=self.ledgers,
+                balances=self.balances,
+                debit_total_cents=self.debit_total_cents,
+                credit_total_cents=self.credit_total_cents,
+                ledger_hashes=self.ledger_hashes,
+                root_hash=self.root_hash,
+                monthly_activity=self.monthly_activity,
+                yearly_activity=self.yearly_activity,
+                rollup=self.rollup,
+                ledgers_flushed=self.ledgers_flushed)
+        return self._frozen
+
+# Return the balances that the accounts of a journal entry have after it is posted, given balances before it
+# They are checked against signed cents computed in O(1), independently of Balance.add, and AccountingSystemError is
+# raised if they differ, as when a balance has been corrupted.
+def checked_balances_after(balances: Dict[str, Balance], je: JournalEntry) -> Dict[str, Balance]:
+    cents = je.amount.to_cents()
+    expected = {je.debit_account: _signed_cents(balances, je.debit_account)}
+    expected[je.credit_account] = _signed_cents(balances, je.credit_account)
+    expected[je.debit_account] += cents
+    expected[je.credit_account] -= cents
+    r = {}
+    for account, side in ((je.debit_account, 'debit'), (je.credit_account, 'credit')):
+        balance = r.get(account, balances.get(account, None))
+        posted = Balance(side=side, amount=je.amount)
+        r[account] = posted if balance is None else balance.add(posted)
+    _check_signed_cents(r, expected, je)
+    return r
+
+# Books are updated in place by open_account and post. They have the dicts of an AccountingSystem other than
+# category_for, and its debit and credit totals and root hash; a Builder is one, and so is a share of one, as a stripe
+# of a ConcurrentAccountingSystem, whose totals, root hash and rollup are summed over the shares.
+
+# Start the ledger hash and the rollup nodes of a declared account
+def open_account(books, ad: AccountDeclaration) -> None:
+    books.ledger_hashes[ad.name] = empty_ledger_hash
+    books.root_hash ^= _leaf_hash(ad.name, ad.category, empty_ledger_hash)
+    for node in _rollup_nodes(ad.category, ad.name):
+        books.rollup.setdefault(node, 0)
+
+# Post one side of a journal entry to an account, inserting it into ledger, the account's ledger in the books, and
+# setting the account's balance, which checked_balances_after returned
+def post(books, ledger: List[LedgerEntry], account: str, category: str, side: str, je: JournalEntry, balance: Balance) -> None:
+    ledger_entry = LedgerEntry(
+        date=je.date,
+        balance=Balance(side=side, amount=je.amount),
+        description=je.description,
+        source=je.source,
+        source_location=je.source_location)
+    u.insert_in_order(ledger, ledger_entry, key=_ledger_date)
+    books.balances[account] = balance
+    old_hash = books.ledger_hashes.get(account, empty_ledger_hash)
+    new_hash = _hash_posting(old_hash, ledger_entry)
+    books.ledger_hashes[account] = new_hash
+    books.root_hash ^= _leaf_hash(account, category, old_hash) ^ _leaf_hash(account, category, new_hash)
+    cents = je.amount.to_cents()
+    posted = Activity.posting(side, cents)
+    month_key = (account, je.date.year, je.date.month)
+    year_key = (account, je.date.year)
+    books.monthly_activity[month_key] = books.monthly_activity.get(month_key, Activity.zero()).add(posted)
+    books.yearly_activity[year_key] = books.yearly_activity.get(year_key, Activity.zero()).add(posted)
+    if side == 'debit':
+        books.debit_total_cents += cents
+    else:
+        books.credit_total_cents += cents
+    signed_cents = cents if side == 'debit' else -cents
+    for node in _rollup_nodes(category, account):  # the nodes along the path of the account, O(depth)
+        books.rollup[node] = books.rollup.get(node, 0) + signed_cents
+
+# The ledger hashes depend only on the accounting content of the postings, not on where they were read from, and are
+# stable across processes, so that the ledger hashes of books built in different runs can be compared.
+# A ledger hash is the sum, modulo 2**128, of the hashes of its postings, so it does not depend on where a posting that
+# arrives out of date order is inserted, and identical postings do not cancel.
+empty_ledger_hash = bytes(16)
+
+def _ledger_date(ledger_entry: LedgerEntry) -> datetime.date:
+    return ledger_entry.date
+
+def posting_key(ledger_entry: LedgerEntry) -> bytes:
+    return '\x1f'.join((
+        ledger_entry.date.isoformat(),
+        ledger_entry.balance.side,
+        str(ledger_entry.balance.amount.to_cents()),
+        ledger_entry.description)).encode('utf-8')
+
+def _hash_posting(ledger_hash: bytes, ledger_entry: LedgerEntry) -> bytes:
+    posting_hash = hashlib.blake2b(posting_key(ledger_entry), digest_size=16).digest()
+    total = (int.from_bytes(ledger_hash, 'little') + int.from_bytes(posting_hash, 'little')) % 2**128
+    return total.to_bytes(16, 'little')
+
+def _leaf_hash(account: str, category: str, ledger_hash: bytes) -> int:
+    digest = hashlib.blake2b(f'{category}\x1f{account}'.encode('utf-8') + ledger_hash, digest_size=16).digest()
+    return int.from_bytes(digest, 'little')
+
+rollup_categories = ('Asset', 'Liability', 'Equity', 'Revenue', 'Expense')
+
+# Yield the nodes of the rollup tree that an account is under, from its category down to the account itself
+def _rollup_nodes(category: str, account: str):
+    node = (category,)
+    yield node
+    for part in account.split(account_separator):
+        node = node + (part,)
+        yield node
+
+def _signed_cents(balances: Dict[str, Balance], account: str) -> int:
+    balance = balances.get(account, None)
+    if balance is None: return 0
+    if not isinstance(balance, Balance):
+        raise AccountingSystemError(f'balance of account {account} is a {type(balance)}, not a Balance')
+    return balance.signed_cents()
+
+def _check_signed_cents(balances: Dict[str, Balance], expected: Dict[str, int], je: JournalEntry) -> None:
+    for account, expected_cents in expected.items():
+        actual_cents = _signed_cents(balances, account)
+        if actual_cents != expected_cents:
+            raise AccountingSystemError(
+                f'balance of account {account} is {actual_cents} cents, expected {expected_cents} cents, '
+                f'after posting {je.source} {je.source_location}')
 
 class Test(unittest.TestCase):
     def test_join(self):
@@ -136,9 +411,169 @@ class Test(unittest.TestCase):
             journal_entry, expected_cash_balance = test
             x = x.join(journal_entry)
             self.assertEqual(expected_cash_balance, x.balances['cash'].amount.dollars)
+        self.assertEqual(Balance(side='credit', amount=Amount(dollars=100, cents=0)), x.balances['owners equity'])
+        self.assertEqual(11000, x.debit_total_cents)
+        self.assertEqual(11000, x.credit_total_cents)
+        x.verify()
+
+        # a corrupted balance is detected by verify, and by join when the account is next posted to
+        corrupted = dataclasses.replace(x, balances={**x.balances, 'supplies': Balance(side='debit', amount=Amount(dollars=11, cents=0))})
+        with self.assertRaises(AccountingSystemError):
+            corrupted.verify()
+        corrupted = dataclasses.replace(x, balances={**x.balances, 'supplies': {}})
+        with self.assertRaises(AccountingSystemError):
+            corrupted.join(je(1, 'supplies', 'cash'))
+
+        # join leaves the system joined to as it was, and so does freezing a builder that goes on joining
+        y = x.join(je(1, 'supplies', 'cash'))
+        y.verify()
+        x.verify()
+        self.assertEqual(11, y.balances['supplies'].amount.dollars)
+        self.assertEqual(10, x.balances['supplies'].amount.dollars)
+        self.assertEqual(2, len(x.ledgers['cash']))
+        builder = Builder(x)
+        with self.assertRaises(ValueError):
+            builder.join(je(1, 'supplies', 'rent'))
+        frozen = builder.join(je(1, 'supplies', 'cash')).freeze()
+        builder.join(je(2, 'supplies', 'cash'))
+        self.assertEqual(y, frozen)
+        self.assertEqual(13, builder.freeze().balances['supplies'].amount.dollars)
+        frozen.verify()
+        builder.freeze().verify()
+        x.verify()
+
+        # flushed books go on joining, and verify checks what does not need the dropped postings
+        flushed = x.flush_ledgers().join(je(1, 'supplies', 'cash'))
+        flushed.verify()
+        self.assertEqual(y.ledger_hashes, flushed.ledger_hashes)
+        self.assertEqual(1, len(flushed.ledgers['cash']))
+        with self.assertRaises(AccountingSystemError):
+            dataclasses.replace(flushed, root_hash=y.root_hash ^ 1).verify()
+        with self.assertRaises(AccountingSystemError):
+            dataclasses.replace(flushed, ledgers_flushed=False).verify()
         if False:
             for line in x.render():
                 print(line)
 
+    def test_iter_render(self):
+        x = AccountingSystem.empty()
+        x = x.join(AccountDeclaration(category='Asset', name='cash'))
+        x = x.join(AccountDeclaration(category='Equity', name='owners equity'))
+        for day in (1, 2, 3):
+            x = x.join(JournalEntry(
+                date=datetime.date(2025, 1, day),
+                amount=Amount(dollars=day, cents=0),
+                debit_account='cash',
+                credit_account='owners equity',
+                description=f'day {day}',
+                source='',
+                source_location=''))
+        lines = x.render()
+        self.assertEqual(lines, list(x.iter_render()))
+        self.assertEqual(['AccountingSystem', '  category_for', '    cash: Asset', '    owners equity: Equity', '  ledgers', '    cash'], lines[0:6])
+        self.assertEqual(1 + 3 + 1 + 2 * 4 + 1 + 2, len(lines))  # each ledger entry is one line
+        self.assertTrue(lines[6].startswith('      LedgerEntry(') and "description='day 1'" in lines[6])
+        lines = list(x.iter_render(accounts={'cash'}, start=datetime.date(2025, 1, 2), end=datetime.date(2025, 1, 2)))
+        self.assertEqual(['AccountingSystem', '  category_for', '    cash: Asset', '  ledgers', '    cash'], lines[0:5])
+        self.assertEqual(1, sum(1 for line in lines if 'LedgerEntry(' in line))
+        self.assertTrue("description='day 2'" in lines[5])
+        self.assertEqual(['  balances', '    cash: Balance(side=\'debit\', amount=Amount(dollars=6, cents=0))'], lines[6:])
+
+    def test_activity(self):
+        x = AccountingSystem.empty()
+        x = x.join(AccountDeclaration(category='Asset', name='cash'))
+        x = x.join(AccountDeclaration(category='Revenue', name='sales'))
+        def je(date, cents, debit_account, credit_account):
+            return JournalEntry(
+                date=date,
+                amount=Amount.from_cents(cents),
+                debit_account=debit_account,
+                credit_account=credit_account,
+                description='',
+                source='',
+                source_location='')
+        for date, cents in (('2023-12-31', 1), ('2024-01-01', 10), ('2024-01-31', 20), ('2024-07-04', 300), ('2025-02-01', 4000)):
+            x = x.join(je(datetime.date.fromisoformat(date), cents, 'cash', 'sales'))
+        x = x.join(je(datetime.date(2024, 7, 5), 50, 'sales', 'cash'))
+        x.verify()
+        self.assertEqual(Activity(debit_cents=30, credit_cents=0, n_postings=2), x.activity('cash', (2024, 1), (2024, 1)))
+        self.assertEqual(Activity(debit_cents=330, credit_cents=50, n_postings=4), x.activity('cash', (2024, 1), (2024, 12)))
+        self.assertEqual(Activity(debit_cents=331, credit_cents=50, n_postings=5), x.activity('cash', (2023, 12), (2025, 1)))
+        self.assertEqual(Activity(debit_cents=50, credit_cents=4330, n_postings=5), x.activity('sales', (2024, 1), (2025, 12)))
+        self.assertEqual(Activity.zero(), x.activity('cash', (2024, 8), (2025, 1)))
+        self.assertEqual(x.activity('cash', (2024, 2), (2024, 7)), x.activity_between('cash', datetime.date(2024, 2, 1), datetime.date(2024, 7, 31)))
+        with self.assertRaises(ValueError):
+            x.activity_between('cash', datetime.date(2024, 2, 2), datetime.date(2024, 7, 31))
+        with self.assertRaises(ValueError):
+            x.activity_between('cash', datetime.date(2024, 2, 1), datetime.date(2024, 2, 28))
+        with self.assertRaises(ValueError):
+            x.activity('no such account', (2024, 1), (2024, 1))
+
+    def test_ledger_order(self):
+        def build(days):
+            x = AccountingSystem.empty()
+            x = x.join(AccountDeclaration(category='Asset', name='cash'))
+            x = x.join(AccountDeclaration(category='Revenue', name='sales'))
+            for day, description in days:
+                x = x.join(JournalEntry(
+                    date=datetime.date(2025, 1, day),
+                    amount=Amount.from_cents(day),
+                    debit_account='cash',
+                    credit_account='sales',
+                    description=description,
+                    source='',
+                    source_location=''))
+            return x
+        days = ((5, 'a'), (9, 'b'), (2, 'c'), (5, 'd'), (9, 'e'), (1, 'f'))  # two files interleaved
+        x = build(days)
+        x.verify()
+        self.assertEqual(['f', 'c', 'a', 'd', 'b', 'e'], [e.description for e in x.ledgers['cash']])
+        self.assertEqual(['c', 'a', 'd'], [e.description for e in x.ledger_between('cash', datetime.date(2025, 1, 2), datetime.date(2025, 1, 8))])
+        self.assertEqual([], x.ledger_between('sales', datetime.date(2025, 1, 10), datetime.date(2025, 1, 31)))
+        self.assertEqual(x.root_hash, build(sorted(days)).root_hash)
+
+    def test_rollup(self):
+        x = AccountingSystem.empty()
+        for category, name in (
+                ('Expense', 'Utilities:Electric'),
+                ('Expense', 'Utilities:Water'),
+                ('Expense', 'Rent'),
+                ('Asset', 'Bank:Checking'),
+                ('Asset', 'Cash')):
+            x = x.join(AccountDeclaration(category=category, name=name))
+        def je(cents, debit_account, credit_account):
+            return JournalEntry(
+                date=datetime.date(2025, 1, 1),
+                amount=Amount.from_cents(cents),
+                debit_account=debit_account,
+                credit_account=credit_account,
+                description='',
+                source='',
+                source_location='')
+        x = x.join(je(100_00, 'Utilities:Electric', 'Bank:Checking'))
+        x = x.join(je(20_00, 'Utilities:Water', 'Cash'))
+        x = x.join(je(5_00, 'Bank:Checking', 'Utilities:Electric'))  # a refund
+        x.verify()
+        self.assertEqual(95_00, x.rollup_cents('Expense', 'Utilities', 'Electric'))
+        self.assertEqual(115_00, x.rollup_cents('Expense', 'Utilities'))
+        self.assertEqual(0, x.rollup_cents('Expense', 'Rent'))
+        self.assertEqual(115_00, x.rollup_cents('Expense'))
+        self.assertEqual(-115_00, x.rollup_cents('Asset'))
+        with self.assertRaises(ValueError):
+            x.rollup_cents('Expense', 'Utilities', 'Gas')
+        self.assertEqual(
+            [
+                (('Asset',), -115_00),
+                (('Asset', 'Bank'), -95_00),
+                (('Asset', 'Cash'), -20_00),
+                (('Expense',), 115_00),
+                (('Expense', 'Rent'), 0),
+                (('Expense', 'Utilities'), 115_00),
+            ],
+            x.rollup_rows(max_depth=2))
+        self.assertEqual(
+            [('Asset',), ('Asset', 'Bank'), ('Asset', 'Bank', 'Checking'), ('Asset', 'Cash'), ('Expense',)],
+            [node for node, _ in x.rollup_rows()][0:5])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,69 @@
+# The postings to an account in some period: debit and credit totals in cents and the number of postings
+from typing import Self, Tuple
+
+import dataclasses
+import datetime
+import unittest
+
+@dataclasses.dataclass(frozen=True)
+class Activity:
+    debit_cents: int = 0
+    credit_cents: int = 0
+    n_postings: int = 0
+
+    def __post_init__(self):
+        assert isinstance(self.debit_cents, int)
+        assert isinstance(self.credit_cents, int)
+        assert isinstance(self.n_postings, int)
+
+    @classmethod
+    def zero(cls) -> 'Activity':
+        return Activity()
+
+    # the activity of one posting of cents to the side
+    @classmethod
+    def posting(cls, side: str, cents: int) -> 'Activity':
+        if side == 'debit': return Activity(debit_cents=cents, n_postings=1)
+        assert side == 'credit'
+        return Activity(credit_cents=cents, n_postings=1)
+
+    def add(self, other: Self) -> Self:
+        assert isinstance(other, Activity)
+        return Activity(
+            debit_cents=self.debit_cents + other.debit_cents,
+            credit_cents=self.credit_cents + other.credit_cents,
+            n_postings=self.n_postings + other.n_postings)
+
+    # the change in the balance, positive for a net debit and negative for a net credit
+    def net_cents(self) -> int:
+        return self.debit_cents - self.credit_cents
+
+# A calendar month as (year, month)
+Month = Tuple[int, int]
+
+def month_of(date: datetime.date) -> Month:
+    return (date.year, date.month)
+
+def next_month(month: Month) -> Month:
+    year, m = month
+    return (year + 1, 1) if m == 12 else (year, m + 1)
+
+def month_str(month: Month) -> str:
+    return f'{month[0]:04d}-{month[1]:02d}'
+
+
+class Test(unittest.TestCase):
+    def test_add(self):
+        x = Activity.posting('debit', 100).add(Activity.posting('credit', 30)).add(Activity.posting('debit', 5))
+        self.assertEqual(Activity(debit_cents=105, credit_cents=30, n_postings=3), x)
+        self.assertEqual(75, x.net_cents())
+        self.assertEqual(x, x.add(Activity.zero()))
+
+    def test_months(self):
+        self.assertEqual((2024, 2), month_of(datetime.date(2024, 2, 29)))
+        self.assertEqual((2025, 1), next_month((2024, 12)))
+        self.assertEqual((2024, 7), next_month((2024, 6)))
+        self.assertEqual('2024-06', month_str((2024, 6)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,20 +2,20 @@
 from dataclasses import dataclass
 from typing import Any, Sequence, Self, List, Tuple
 
-import copy
 import unittest
 
 @dataclass(frozen=True, kw_only=True)
 class AlignedCSV:
     alignments: Sequence[str]
     _max_widths: Sequence[int] = None
-    _data: Sequence[Sequence[str]] = None
+    _data: Tuple = None  # (last row, the _data of the rows before it), so that a join shares the rows before it
+    _n_rows: int = 0
 
     def __post_init__(self):
         for alignment in self.alignments:
             assert alignment in ('left', 'right')
     
-    # just save the data
+    # just save the data, in O(number of columns)
     def join(self, row: Sequence) -> Self:
         if self._max_widths is not None:
             assert len(self._max_widths) == len(row)
@@ -32,12 +32,20 @@ class AlignedCSV:
             s = f'{x}'
             new_max_widths.append(max(len(s), old_max_widths[i]))
             new_row_s.append(s)
-        new_data = [] if self._data is None else list(copy.deepcopy(self._data))
-        new_data.append(new_row_s)
         return AlignedCSV(
             alignments=self.alignments,
             _max_widths=tuple(new_max_widths),
-            _data=tuple(new_data))
+            _data=(tuple(new_row_s), self._data),
+            _n_rows=self._n_rows + 1)
+
+    def rows(self) -> List[Tuple[str, ...]]:
+        r = []
+        data = self._data
+        while data is not None:
+            row, data = data
+            r.append(row)
+        r.reverse()
+        return r
 
     # align the columns
     def cast(self, to: str) -> Any:
@@ -46,7 +54,7 @@ class AlignedCSV:
 
     def _cast_to_tuple_tuple(self) -> Tuple[Tuple]:
         r = []
-        for row in self._data:
+        for row in self.rows():
             line = []
             for i, item in enumerate(row):
                 width = self._max_widths[i]
@@ -62,7 +70,10 @@ class Test(unittest.TestCase):
         r = AlignedCSV(alignments=('left', 'right'))
         r = r.join(('field name', 'value'))  # header
         r = r.join(('abc', 0.13))
+        header = r
         r = r.join(('a long field value', 1234.56))
+        self.assertEqual([('field name', 'value'), ('abc', '0.13')], header.rows())  # unchanged by the later join
+        self.assertEqual(('abc'.ljust(18), '0.13'.rjust(7)), r.cast('tuple(tuple)')[1])
         if verbose:
             for line in r.cast('tuple(tuple)'):
                 print(line)
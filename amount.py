@@ -23,6 +23,15 @@ class Amount:
     def zero() -> 'Amount':
         return Amount(dollars=0, cents=0)
 
+    @staticmethod
+    def from_cents(cents: int) -> 'Amount':
+        assert isinstance(cents, int)
+        return Amount(dollars=cents // 100, cents=cents % 100)
+
+    # the amount as a whole number of cents
+    def to_cents(self) -> int:
+        return self.dollars * 100 + self.cents
+
     def add(self, other: 'Amount') -> 'Amount':
         assert isinstance(other, Amount)
         return Amount(dollars=self.dollars+other.dollars, cents=self.cents+other.cents)._normalize()
@@ -41,7 +50,36 @@ class Amount:
         if self.cents < 0: return Amount(dollars=self.dollars-1, cents=self.cents+100)._normalize()
         return self
 
+# Return the signed number of cents in a string like -1,234.5 or 12
+def parse_cents(s: str) -> int:
+    s = s.strip().replace(',', '')
+    sign = 1
+    if s.startswith('-') or s.startswith('+'):
+        sign = -1 if s[0] == '-' else 1
+        s = s[1:]
+    dollars, _, cents = s.partition('.')
+    ok = (len(dollars) > 0 or len(cents) > 0) and \
+        (len(dollars) == 0 or dollars.isdigit()) and \
+        (len(cents) == 0 or (len(cents) <= 2 and cents.isdigit()))
+    if not ok: raise ValueError(f'amount {s} is not like -123.45')
+    return sign * (int(dollars or '0') * 100 + int(cents.ljust(2, '0')))
+
 class Test(unittest.TestCase):
+    def test_parse_cents(self):
+        tests = (
+            ('0', 0),
+            ('12', 1200),
+            ('12.3', 1230),
+            ('-12.34', -1234),
+            ('+.05', 5),
+            (' 1,234.56 ', 123456),
+        )
+        for s, expected in tests:
+            self.assertEqual(expected, parse_cents(s))
+        for s in ('', '-', '1.234', 'abc', '1.x'):
+            with self.assertRaises(ValueError):
+                parse_cents(s)
+
     def test_str(self):
         tests = (
             (Amount(dollars=0, cents=1), '0.01'),
@@ -100,6 +138,19 @@ class Test(unittest.TestCase):
             self.assertEqual(amount.dollars, expected_d)
             self.assertEqual(amount.cents, expected_c)
 
+    def test_cents(self):
+        tests = (
+            ((0, 0), 0),
+            ((1, 2), 102),
+            ((-1, 90), -10),
+            ((-102, 8), -10192),
+        )
+        for test in tests:
+            a, expected = test
+            x = Amount(a[0], a[1])
+            self.assertEqual(expected, x.to_cents())
+            self.assertEqual(x, Amount.from_cents(expected))
+
     def test_add(self):
         tests = (
             ((100, 99), (0, 0), (100, 99)),
@@ -25,6 +25,11 @@ class Balance:
             return self.replace(side=other.side, amount=other.amount.subtract(self.amount))
 
 
+    # the balance in cents, positive for a debit and negative for a credit
+    def signed_cents(self) -> int:
+        cents = self.amount.to_cents()
+        return cents if self.side == 'debit' else -cents
+
     def replace(self, **kwargs) -> Self:
         return dataclasses.replace(self, **kwargs)
 
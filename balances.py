@@ -2,10 +2,8 @@
 from typing import Any, List, Union
 
 import collections
-import copy
 import csv
 import datetime
-import fileinput
 import os
 import sys
 
@@ -15,12 +13,14 @@ from sac import AccountDeclaration, Amount, Balance, JournalEntry, InputError, L
 import sac
 import utility as u
 
+# join_state_ledger_entry updates the dicts of a state in place, so that joining a line does not copy the balances;
+# keep the state that join returns, as in state = join(state, line).
 State = collections.namedtuple('State', 'balance_for_account category_for_account line source location')
 def empty_state(): return State({}, {}, None, None, None)
 
-verbose = True
+verbose = False
 def vp(*args, **kwargs):
-    if True: print(*args, **kwargs)
+    if verbose: print(*args, **kwargs)
 
 def add(x, y): return sac.add(x, y)
 def cast(x, y): return sac.cast(x, y)
@@ -46,22 +46,13 @@ def join_state_ledger_entry(state: State, le: LedgerEntry) -> State:
 
     category, account, _, balance, _, _, _ = le
     if account not in state.balance_for_account:
-        new_balance_for_account = copy.deepcopy(state.balance_for_account)
-        new_balance_for_account[account] = make('Balance', 'debit', make('Amount', 0, 0))
-        return join_state_ledger_entry(state._replace(balance_for_account=new_balance_for_account), le)
-    new_balance_for_account = copy.deepcopy(state.balance_for_account)
-    new_balance_for_account[account] = add(state.balance_for_account[account], balance)
-
-    new_category_for_account = copy.deepcopy(state.category_for_account)
-    new_category_for_account[account] = category
-    
-    return state._replace(balance_for_account=new_balance_for_account,
-                          category_for_account=new_category_for_account,
-    )
+        state.balance_for_account[account] = make('Balance', 'debit', make('Amount', 0, 0))
+    state.balance_for_account[account] = add(state.balance_for_account[account], balance)
+    state.category_for_account[account] = category
+    return state
 
 # write ledgers to stdout formated as a CSV file
 def produce_output(state: State) -> None:
-    breakpoint()
     # to-do: rewrite me
     writer = csv.writer(sys.stdout, quoting=csv.QUOTE_MINIMAL)
     writer.writerow(('category', 'account', 'side', 'amount'))
@@ -102,13 +93,13 @@ def main():
     if len(sys.argv) > 1:  # process files on the command line
         for filename in sys.argv[1:]:
             state = state._replace(source=filename)
-            with open(filename, 'r') as f:
+            with u.open_text(filename) as f:
                 for i, line in enumerate(f):
                     if i == 0: continue  # skip the header line
                     state = process_line(state, line, filename, i)
     else:  # read from standard in
         state = state._replace(source='(stdin)')
-        for i, line in enumerate(fileinput.input()):
+        for i, line in enumerate(u.open_text('-')):
             if i == 0: continue  # skip the header line
             state = process_line(state, line, '(stdin)', i)
     assert isinstance(state, State)
@@ -0,0 +1,324 @@
+# Convert a bank's CSV export into journal entries, as described by a column-mapping spec
+# usage: python3 bankimport.py SPEC-FILE BANK-FILE [--output JOURNAL-FILE] [--rules RULES-FILE]
+# The spec is a JSON object; columns are given by header name, or by 0-based index when there is no header:
+#   {
+#     "account": "Cash",                      the account the export is for
+#     "counter_account": "Uncategorized",     the other account of every entry
+#     "header": true,                         the first row names the columns (default true)
+#     "delimiter": ",",                       (default ",")
+#     "date": {"column": "Date", "format": "%m/%d/%Y"},
+#     "amount": {"column": "Amount", "sign": "deposit-positive"},   or "deposit-negative"
+#            or {"deposit": "Credit", "withdrawal": "Debit"},       two unsigned columns, one of them blank
+#     "description": ["Payee", "Memo"]        columns joined by a space to form the description
+#   }
+# A deposit debits the account and credits the counter account; a withdrawal does the reverse. Rows with a zero
+# amount are skipped. With a rules file (see categorize.py), the counter account of each entry is the account its
+# description selects, if any. The journal is written in the syntax read by parse.py, one complete line per entry.
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Tuple, Union
+
+import argparse
+import csv
+import datetime
+import io
+import itertools
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+from amount import Amount, parse_cents
+from categorize import Categorizer
+from journalentry import JournalEntry
+
+import categorize
+import utility as u
+
+@dataclass(frozen=True)
+class ImportSpec:
+    account: str
+    counter_account: str
+    date_column: Union[str, int]
+    date_format: str
+    description_columns: Tuple[Union[str, int], ...]
+    amount_column: Union[str, int, None] = None  # a signed amount
+    deposit_positive: bool = True
+    deposit_column: Union[str, int, None] = None  # or an unsigned deposit and withdrawal
+    withdrawal_column: Union[str, int, None] = None
+    header: bool = True
+    delimiter: str = ','
+
+    @classmethod
+    def from_json(cls, x: Dict[str, Any]) -> 'ImportSpec':
+        amount = x['amount']
+        description = x.get('description', [])
+        if not isinstance(description, list): description = [description]
+        sign = amount.get('sign', 'deposit-positive')
+        if sign not in ('deposit-positive', 'deposit-negative'):
+            raise ValueError(f'amount sign {sign} is not deposit-positive or deposit-negative')
+        if ('column' in amount) == ('deposit' in amount or 'withdrawal' in amount):
+            raise ValueError('amount needs either a column or deposit and withdrawal columns')
+        return ImportSpec(
+            account=x['account'],
+            counter_account=x['counter_account'],
+            date_column=x['date']['column'],
+            date_format=x['date'].get('format', '%Y-%m-%d'),
+            description_columns=tuple(description),
+            amount_column=amount.get('column', None),
+            deposit_positive=sign == 'deposit-positive',
+            deposit_column=amount.get('deposit', None),
+            withdrawal_column=amount.get('withdrawal', None),
+            header=x.get('header', True),
+            delimiter=x.get('delimiter', ','))
+
+def read_spec(path: str) -> ImportSpec:
+    with open(path, 'r') as f:
+        return ImportSpec.from_json(json.load(f))
+
+# The converted columns of a batch of rows; cents are positive for deposits
+@dataclass(frozen=True)
+class Batch:
+    line_numbers: List[int]
+    dates: List[datetime.date]
+    cents: List[int]
+    descriptions: List[str]
+
+def make_date_parser(date_format: str) -> Callable[[str], datetime.date]:
+    if date_format == '%Y-%m-%d': return datetime.date.fromisoformat
+    return lambda s: datetime.datetime.strptime(s, date_format).date()
+
+# Parse a bank amount, which may have a currency sign or be negated by parentheses, as in ($1,234.56)
+def parse_bank_cents(s: str) -> int:
+    s = s.strip().replace('$', '')
+    if s.startswith('(') and s.endswith(')'):
+        return -parse_cents(s[1:-1])
+    return parse_cents(s)
+
+def parse_unsigned_cents(s: str) -> int:
+    return 0 if len(s) == 0 else parse_bank_cents(s)
+
+# Convert a column's values, each distinct value once however many rows have it
+# Exports repeat dates heavily, so a date column costs a few conversions and a dictionary lookup per row.
+def convert_column(values: List[str], convert: Callable[[str], Any], what: str, line_numbers: List[int]) -> List[Any]:
+    converted = {}
+    for value in set(values):
+        try:
+            converted[value] = convert(value.strip())
+        except ValueError as e:
+            line_number = line_numbers[values.index(value)]
+            raise ValueError(f'line {line_number}: {what} {value!r}: {e}') from None
+    return [converted[value] for value in values]
+
+class Importer:
+    def __init__(self, spec: ImportSpec, header: Union[List[str], None] = None):
+        self.spec = spec
+        self._parse_date = make_date_parser(spec.date_format)
+        def index(column):
+            if column is None: return None
+            if isinstance(column, int): return column
+            if header is None: raise ValueError(f'column {column!r} is named but the file has no header')
+            if column not in header: raise ValueError(f'column {column!r} is not in the header {header}')
+            return header.index(column)
+        self._date = index(spec.date_column)
+        self._amount = index(spec.amount_column)
+        self._deposit = index(spec.deposit_column)
+        self._withdrawal = index(spec.withdrawal_column)
+        self._descriptions = [index(column) for column in spec.description_columns]
+
+    # Convert rows, column by column
+    def convert(self, rows: List[List[str]], line_numbers: List[int]) -> Batch:
+        n_columns = 1 + max(i for i in [self._date, self._amount, self._deposit, self._withdrawal] + self._descriptions if i is not None)
+        for row, line_number in zip(rows, line_numbers):
+            if len(row) < n_columns:
+                raise ValueError(f'line {line_number}: expected at least {n_columns} columns, found {len(row)}')
+        def column(i): return [row[i] for row in rows]
+        dates = convert_column(column(self._date), self._parse_date, 'date', line_numbers)
+        if self._amount is not None:
+            cents = convert_column(column(self._amount), parse_bank_cents, 'amount', line_numbers)
+            if not self.spec.deposit_positive:
+                cents = [-x for x in cents]
+        else:
+            deposits = convert_column(column(self._deposit), parse_unsigned_cents, 'deposit', line_numbers)
+            withdrawals = convert_column(column(self._withdrawal), parse_unsigned_cents, 'withdrawal', line_numbers)
+            cents = [deposit - abs(withdrawal) for deposit, withdrawal in zip(deposits, withdrawals)]
+        if len(self._descriptions) == 0:
+            descriptions = [''] * len(rows)
+        elif len(self._descriptions) == 1:
+            descriptions = [value.strip() for value in column(self._descriptions[0])]
+        else:
+            descriptions = [' '.join(part.strip() for part in parts if len(part.strip()) > 0)
+                            for parts in zip(*(column(i) for i in self._descriptions))]
+        return Batch(line_numbers=line_numbers, dates=dates, cents=cents, descriptions=descriptions)
+
+    # Return the debit and credit accounts of an entry of cents
+    def accounts(self, cents: int, description: str, categorizer: Union[Categorizer, None]) -> Tuple[str, str]:
+        counter_account = self.spec.counter_account
+        if categorizer is not None:
+            counter_account = categorizer.account_for(description, counter_account)
+        return (self.spec.account, counter_account) if cents > 0 else (counter_account, self.spec.account)
+
+# Yield a Batch for each batch_rows rows of a bank file, and the Importer for the file first
+def yield_batches(spec: ImportSpec, path: str, batch_rows: int = 100_000):
+    with u.open_text(path) as f:
+        reader = csv.reader(f, delimiter=spec.delimiter)
+        header = [name.strip() for name in next(reader, [])] if spec.header else None
+        importer = Importer(spec, header)
+        yield importer
+        lines = enumerate(reader, 2 if spec.header else 1)
+        while True:
+            numbered = list(itertools.islice(lines, batch_rows))
+            if len(numbered) == 0: return
+            numbered = [(line_number, row) for line_number, row in numbered if len(row) > 0]
+            if len(numbered) > 0:
+                yield importer.convert([row for _, row in numbered], [line_number for line_number, _ in numbered])
+
+# Return the journal entries of a bank file
+def import_file(spec: ImportSpec, path: str, categorizer: Union[Categorizer, None] = None, batch_rows: int = 100_000) -> List[JournalEntry]:
+    r = []
+    batches = yield_batches(spec, path, batch_rows)
+    importer = next(batches)
+    source = os.path.basename(path)
+    for batch in batches:
+        for line_number, date, cents, description in zip(batch.line_numbers, batch.dates, batch.cents, batch.descriptions):
+            if cents == 0: continue
+            debit_account, credit_account = importer.accounts(cents, description, categorizer)
+            r.append(JournalEntry(
+                date=date,
+                amount=Amount.from_cents(abs(cents)),
+                debit_account=debit_account,
+                credit_account=credit_account,
+                description=description,
+                source=source,
+                source_location=f'line {line_number}'))
+    return r
+
+# Write the journal lines of a bank file, straight from the converted columns, and return the number written
+# An empty description is written as the bank file's line number, as a blank one would repeat the previous line's.
+def write_journal(spec: ImportSpec, path: str, output, categorizer: Union[Categorizer, None] = None, batch_rows: int = 100_000) -> int:
+    writer = csv.writer(output, lineterminator='\n')
+    n = 0
+    batches = yield_batches(spec, path, batch_rows)
+    importer = next(batches)
+    source = os.path.basename(path)
+    output.write(f'# imported from {source}\n')
+    date_strs = {}
+    for batch in batches:
+        for date in set(batch.dates):
+            if date not in date_strs: date_strs[date] = date.strftime('%Y%m%d')
+        rows = []
+        for line_number, date, cents, description in zip(batch.line_numbers, batch.dates, batch.cents, batch.descriptions):
+            if cents == 0: continue
+            debit_account, credit_account = importer.accounts(cents, description, categorizer)
+            unsigned = abs(cents)
+            rows.append((
+                date_strs[date],
+                f'{unsigned // 100}.{unsigned % 100:02d}',
+                debit_account,
+                credit_account,
+                description if len(description) > 0 else f'{source} line {line_number}'))
+        writer.writerows(rows)
+        n += len(rows)
+    return n
+
+def main():
+    parser = argparse.ArgumentParser(description='convert a bank CSV export into a journal file')
+    parser.add_argument('spec_file')
+    parser.add_argument('bank_file')
+    parser.add_argument('--output', default='-', help='journal file to write; - for stdout')
+    parser.add_argument('--rules', default=None, help='rules file choosing counter accounts from descriptions')
+    args = parser.parse_args()
+    spec = read_spec(args.spec_file)
+    categorizer = None if args.rules is None else Categorizer(categorize.read_rules(args.rules))
+    if args.output == '-':
+        n = write_journal(spec, args.bank_file, sys.stdout, categorizer)
+    else:
+        with open(args.output, 'w', newline='') as f:
+            n = write_journal(spec, args.bank_file, f, categorizer)
+    u.eprint(f'{n} journal entries')
+    if categorizer is not None:
+        u.eprint(f'{categorizer.n_unmatched} entries matched no rule')
+        for rule, hits in categorizer.hit_counts():
+            u.eprint(f'{hits:10d} {rule.source_location} {rule.pattern} -> {rule.account}')
+
+
+class Test(unittest.TestCase):
+    def write(self, text: str) -> str:
+        path = os.path.join(tempfile.mkdtemp(), 'bank.csv')
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_signed_amount(self):
+        spec = ImportSpec.from_json({
+            'account': 'Cash',
+            'counter_account': 'Uncategorized',
+            'date': {'column': 'Date', 'format': '%m/%d/%Y'},
+            'amount': {'column': 'Amount'},
+            'description': ['Payee', 'Memo'],
+        })
+        path = self.write(
+            'Date,Payee,Memo,Amount\n'
+            '01/02/2025,ACME,payroll,"$1,000.00"\n'
+            '01/02/2025,Grocer,,(12.34)\n'
+            '01/03/2025,Bank,fee waived,0.00\n'
+            '01/04/2025,Power Co, ,-80\n'
+            '\n')
+        entries = import_file(spec, path, batch_rows=2)
+        self.assertEqual(3, len(entries))
+        self.assertEqual(('Cash', 'Uncategorized', 100000, 'ACME payroll'), (entries[0].debit_account, entries[0].credit_account, entries[0].amount.to_cents(), entries[0].description))
+        self.assertEqual(('Uncategorized', 'Cash', 1234, 'Grocer'), (entries[1].debit_account, entries[1].credit_account, entries[1].amount.to_cents(), entries[1].description))
+        self.assertEqual((datetime.date(2025, 1, 4), 'line 5'), (entries[2].date, entries[2].source_location))
+
+        output = io.StringIO()
+        self.assertEqual(3, write_journal(spec, path, output, batch_rows=2))
+        lines = output.getvalue().splitlines()
+        self.assertEqual('20250102,1000.00,Cash,Uncategorized,ACME payroll', lines[1])
+        self.assertEqual('20250104,80.00,Uncategorized,Cash,Power Co', lines[3])
+
+    def test_deposit_and_withdrawal_columns(self):
+        spec = ImportSpec.from_json({
+            'account': 'Checking',
+            'counter_account': 'Suspense',
+            'header': False,
+            'date': {'column': 0},
+            'amount': {'deposit': 2, 'withdrawal': 3},
+            'description': 1,
+        })
+        path = self.write('2025-02-01,Deposit,25.00,\n2025-02-02,,,7.5\n')
+        entries = import_file(spec, path)
+        self.assertEqual([2500, 750], [x.amount.to_cents() for x in entries])
+        self.assertEqual(['Checking', 'Suspense'], [x.debit_account for x in entries])
+        output = io.StringIO()
+        write_journal(spec, path, output)
+        self.assertTrue(output.getvalue().endswith('20250202,7.50,Suspense,Checking,bank.csv line 2\n'))
+
+    def test_rules(self):
+        spec = ImportSpec.from_json({
+            'account': 'Cash',
+            'counter_account': 'Uncategorized',
+            'date': {'column': 'Date'},
+            'amount': {'column': 'Amount'},
+            'description': 'Description',
+        })
+        path = self.write('Date,Amount,Description\n2025-03-01,-40,SHELL OIL 57\n2025-03-02,900,Payroll ACME\n2025-03-03,-3,coffee\n')
+        categorizer = Categorizer(categorize.parse_rules(['shell,Fuel', '/payroll/,Salary']))
+        entries = import_file(spec, path, categorizer)
+        self.assertEqual([('Fuel', 'Cash'), ('Cash', 'Salary'), ('Uncategorized', 'Cash')], [(x.debit_account, x.credit_account) for x in entries])
+        self.assertEqual([1, 1], categorizer.hits)
+
+    def test_errors(self):
+        spec = ImportSpec.from_json({
+            'account': 'Cash',
+            'counter_account': 'Uncategorized',
+            'date': {'column': 'Date'},
+            'amount': {'column': 'Amount', 'sign': 'deposit-negative'},
+        })
+        with self.assertRaisesRegex(ValueError, 'line 3: date'):
+            import_file(spec, self.write('Date,Amount\n2025-01-01,1\n2025-13-01,1\n'))
+        with self.assertRaisesRegex(ValueError, 'not in the header'):
+            import_file(spec, self.write('When,Amount\n2025-01-01,1\n'))
+        self.assertEqual('Uncategorized', import_file(spec, self.write('Date,Amount\n2025-01-01,1\n'))[0].debit_account)
+
+if __name__ == '__main__':
+    main()
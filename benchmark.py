@@ -0,0 +1,62 @@
+# Microbenchmarks for the hot paths in parsing input lines
+# usage: python3 benchmark.py [input-file]   (default: regression-test.txt)
+from typing import Callable, List
+
+import csv
+import sys
+import timeit
+
+import parse
+import tokencache as tc
+import utility as u
+
+def read_lines(path: str) -> List[str]:
+    with open(path, 'r') as f:
+        return [line.strip() for line in f if len(line.strip()) > 0 and not line.strip().startswith('#')]
+
+# Print the best time per line over several repeats of calling f on every line
+def report(name: str, f: Callable, lines: List[str], number: int = 100) -> float:
+    seconds = min(timeit.repeat(lambda: [f(line) for line in lines], number=number, repeat=5))
+    per_line_ns = seconds / (number * len(lines)) * 1e9
+    print(f'{name:40} {per_line_ns:10.0f} ns/line')
+    return per_line_ns
+
+def benchmark_tokenizer(lines: List[str]) -> None:
+    def csv_reader_per_line(line): return list(map(str.strip, next(csv.reader([line]))))
+    def csv_reader_per_line_with_comment(line):
+        front, _, _ = line.partition('#')
+        return list(map(str.strip, next(csv.reader([front]))))
+    before = report('csv.reader per line', csv_reader_per_line, lines)
+    after = report('utility.split_csvline', u.split_csvline, lines)
+    print(f'{"speedup":40} {before / after:10.1f} x')
+    before = report('partition + csv.reader per line', csv_reader_per_line_with_comment, lines)
+    after = report("utility.split_csvline(comment='#')", lambda line: u.split_csvline(line, comment='#'), lines)
+    print(f'{"speedup":40} {before / after:10.1f} x')
+
+def benchmark_token_cache(lines: List[str]) -> None:
+    rows = [u.split_csvline(line) for line in lines]
+    rows = [row for row in rows if len(row) > 1]
+    amounts = [row[1] for row in rows if len(row[1]) > 0]
+    def uncached_amounts(): return [parse._make_amount(s) for s in amounts]
+    def cached_amounts(): return [parse.make_amount(s) for s in amounts]
+    dates = [f'2019{i % 12 + 1:02}{i % 28 + 1:02}' for i in range(len(amounts))]
+    def uncached_dates(): return [parse._make_date(s) for s in dates]
+    def cached_dates(): return [parse.make_date(s) for s in dates]
+    for name, f in (
+            ('parse amounts', uncached_amounts),
+            ('parse amounts through token cache', cached_amounts),
+            ('parse dates', uncached_dates),
+            ('parse dates through token cache', cached_dates)):
+        seconds = min(timeit.repeat(f, number=100, repeat=5))
+        print(f'{name:40} {seconds / (100 * len(amounts)) * 1e9:10.0f} ns/token')
+    print(tc.render_stats())
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else 'regression-test.txt'
+    lines = read_lines(path)
+    print(f'{len(lines)} lines from {path}')
+    benchmark_tokenizer(lines)
+    benchmark_token_cache(lines)
+
+if __name__ == '__main__':
+    main()
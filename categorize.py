@@ -0,0 +1,200 @@
+# Choose the account of a journal entry from its description, by rules compiled into one matcher
+# A rules file has one rule a line, as pattern,account[,priority]; blank lines and lines starting with # are ignored.
+# A pattern is a keyword, which matches a description containing it, or /regex/, which matches a description that
+# re.search finds it in. Matching ignores case and runs of whitespace. When several rules match, the one with the
+# highest priority (default 0) wins, and among those the earliest in the file.
+# The keywords are compiled into an Aho-Corasick automaton, which finds every keyword in a description in one pass
+# however many keywords there are. The regexes are tried one by one in rank order, and only those that outrank the
+# best keyword found: Python's re searches a single pattern by its literal prefix, but a combined alternation of
+# patterns position by position, which is several times slower. Descriptions repeat, so the rule chosen for each
+# normalized description is cached.
+from dataclasses import dataclass
+from typing import Dict, List, Tuple, Union
+
+import csv
+import dataclasses
+import datetime
+import functools
+import re
+import unittest
+
+from amount import Amount
+from journalentry import JournalEntry
+
+import utility as u
+
+@dataclass(frozen=True)
+class Rule:
+    pattern: str
+    account: str
+    priority: int = 0
+    source_location: str = ''
+
+    def is_regex(self) -> bool:
+        return len(self.pattern) > 1 and self.pattern.startswith('/') and self.pattern.endswith('/')
+
+def normalize(description: str) -> str:
+    return ' '.join(description.casefold().split())
+
+def parse_rules(lines) -> List[Rule]:
+    r = []
+    for line_index, line in enumerate(lines):
+        if len(line.strip()) == 0 or line.lstrip().startswith('#'): continue
+        fields = next(csv.reader([line]))
+        location = f'line {line_index+1}'
+        if len(fields) not in (2, 3): raise ValueError(f'{location}: expected pattern,account[,priority]')
+        pattern, account = fields[0].strip(), fields[1].strip()
+        if len(pattern) == 0 or len(account) == 0: raise ValueError(f'{location}: empty pattern or account')
+        try:
+            priority = int(fields[2]) if len(fields) == 3 else 0
+        except ValueError:
+            raise ValueError(f'{location}: priority {fields[2]!r} is not an integer') from None
+        r.append(Rule(pattern=pattern, account=account, priority=priority, source_location=location))
+    return r
+
+def read_rules(path: str) -> List[Rule]:
+    with u.open_text(path) as f:
+        return parse_rules(f)
+
+# An Aho-Corasick automaton over keywords, each with a rank; search returns the least rank of the keywords found
+class KeywordMatcher:
+    def __init__(self, keywords: List[Tuple[str, int]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._rank: List[Union[int, None]] = [None]  # least rank of a keyword ending at the state or its fail chain
+        for keyword, rank in keywords:
+            state = 0
+            for ch in keyword:
+                next_state = self._goto[state].get(ch, None)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][ch] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._rank.append(None)
+                state = next_state
+            if self._rank[state] is None or rank < self._rank[state]:
+                self._rank[state] = rank
+        # breadth first, so a state's fail state is complete before the state's
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail != 0 and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(ch, 0)
+                self._fail[next_state] = fail
+                if self._rank[fail] is not None and (self._rank[next_state] is None or self._rank[fail] < self._rank[next_state]):
+                    self._rank[next_state] = self._rank[fail]
+
+    def search(self, text: str) -> Union[int, None]:
+        goto, fail, ranks = self._goto, self._fail, self._rank
+        best = None
+        state = 0
+        for ch in text:
+            while state != 0 and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            rank = ranks[state]
+            if rank is not None and (best is None or rank < best):
+                best = rank
+        return best
+
+class Categorizer:
+    def __init__(self, rules: List[Rule], cache_size: int = 65536):
+        # rank rules by priority, highest first, then by position
+        self.rules = sorted(rules, key=lambda rule: -rule.priority)
+        self.hits = [0] * len(self.rules)  # by rank
+        self.n_unmatched = 0
+        self._keywords = KeywordMatcher([(normalize(rule.pattern), rank) for rank, rule in enumerate(self.rules) if not rule.is_regex()])
+        self._regexes = [(rank, re.compile(rule.pattern[1:-1], re.IGNORECASE)) for rank, rule in enumerate(self.rules) if rule.is_regex()]
+        self._rank_of = functools.lru_cache(maxsize=cache_size)(self._match)
+
+    def _match(self, normalized_description: str) -> Union[int, None]:
+        best = self._keywords.search(normalized_description)
+        for rank, regex in self._regexes:
+            if best is not None and rank > best: break
+            if regex.search(normalized_description) is not None: return rank
+        return best
+
+    # Return the rule that wins for a description, or None
+    def rule_for(self, description: str) -> Union[Rule, None]:
+        rank = self._rank_of(normalize(description))
+        if rank is None:
+            self.n_unmatched += 1
+            return None
+        self.hits[rank] += 1
+        return self.rules[rank]
+
+    def account_for(self, description: str, default_account: str) -> str:
+        rule = self.rule_for(description)
+        return default_account if rule is None else rule.account
+
+    # Return the entry with default_account, on whichever side it is, replaced by the account its description selects
+    def categorize(self, journal_entry: JournalEntry, default_account: str) -> JournalEntry:
+        account = self.account_for(journal_entry.description, default_account)
+        if account == default_account: return journal_entry
+        if journal_entry.debit_account == default_account:
+            return dataclasses.replace(journal_entry, debit_account=account)
+        if journal_entry.credit_account == default_account:
+            return dataclasses.replace(journal_entry, credit_account=account)
+        return journal_entry
+
+    def cache_info(self):
+        return self._rank_of.cache_info()
+
+    # Return (rule, hits) for each rule, in rank order
+    def hit_counts(self) -> List[Tuple[Rule, int]]:
+        return list(zip(self.rules, self.hits))
+
+
+class Test(unittest.TestCase):
+    def test_keyword_matcher(self):
+        matcher = KeywordMatcher([('he', 3), ('she', 1), ('his', 2), ('hers', 0)])
+        self.assertEqual(1, matcher.search('ushe'))    # she, and he through the fail link
+        self.assertEqual(0, matcher.search('ushers'))
+        self.assertEqual(2, matcher.search('this'))
+        self.assertIsNone(matcher.search('xyz'))
+        self.assertIsNone(KeywordMatcher([]).search('anything'))
+
+    def test_categorize(self):
+        rules = parse_rules([
+            '# pattern,account,priority',
+            'shell,Auto',
+            'SHELL  OIL,Fuel,5',
+            '/^amzn\\s+mktp/,Shopping',
+            'amazon,Shopping',
+            '/payroll|direct dep/,Salary,1',
+            '',
+            'acme,Salary',
+        ])
+        categorizer = Categorizer(rules)
+        self.assertEqual('Fuel', categorizer.account_for('Shell Oil 12345', 'Uncategorized'))
+        self.assertEqual('Auto', categorizer.account_for('SHELL SERVICE', 'Uncategorized'))
+        self.assertEqual('Shopping', categorizer.account_for('AMZN Mktp US*1A2B', 'Uncategorized'))
+        self.assertEqual('Uncategorized', categorizer.account_for('paid to amzn mktp', 'Uncategorized'))
+        self.assertEqual('Salary', categorizer.account_for('ACME DIRECT DEP', 'Uncategorized'))
+        self.assertEqual('Salary', categorizer.account_for('acme   direct   dep', 'Uncategorized'))
+        self.assertEqual('Uncategorized', categorizer.account_for('coffee', 'Uncategorized'))
+        hits = {rule.source_location: n for rule, n in categorizer.hit_counts()}
+        self.assertEqual({'line 2': 1, 'line 3': 1, 'line 4': 1, 'line 5': 0, 'line 6': 2, 'line 8': 0}, hits)
+        self.assertEqual(2, categorizer.n_unmatched)
+        self.assertEqual(1, categorizer.cache_info().hits)  # the two spellings of acme direct dep normalize alike
+
+        je = JournalEntry(
+            date=datetime.date(2025, 1, 2),
+            amount=Amount.from_cents(4000),
+            debit_account='Uncategorized',
+            credit_account='Cash',
+            description='SHELL OIL 57',
+            source='',
+            source_location='')
+        categorized = categorizer.categorize(je, 'Uncategorized')
+        self.assertEqual(('Fuel', 'Cash'), (categorized.debit_account, categorized.credit_account))
+
+        with self.assertRaisesRegex(ValueError, 'line 1: priority'):
+            parse_rules(['x,Auto,high'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,224 @@
+# Write the ledgers of an AccountingSystem as one column file per field, and open them again without parsing
+# The column files use the NumPy .npy format, so np.load(path, mmap_mode='r') maps them without copying. They are
+# written with the array module, so exporting does not need NumPy; loading uses NumPy if it is installed and
+# otherwise maps the files as memoryviews.
+#
+# A directory written by export holds
+#   schema.json         row count, column files and dtypes, accounts in id order
+#   date.npy            int32 date ordinals (datetime.date.toordinal)
+#   cents.npy           int64 signed cents, positive for debits and negative for credits
+#   account.npy         int32 account ids, indexes into schema['accounts']
+#   side.npy            uint8 0 for debit, 1 for credit
+#   description.npy     int32 string ids
+#   source.npy          int32 string ids
+#   source_location.npy int32 string ids
+#   string_offsets.npy  int64 offsets into strings.bin; string i is strings.bin[offsets[i]:offsets[i+1]] in UTF-8
+#   strings.bin         the distinct strings, concatenated
+from typing import Any, Dict, List, Tuple
+
+import array
+import ast
+import datetime
+import json
+import mmap
+import os
+import sys
+import tempfile
+import unittest
+
+from accountdeclaration import AccountDeclaration
+from accountingsystem import AccountingSystem
+from amount import Amount
+from balance import Balance
+from journalentry import JournalEntry
+from ledgerentry import LedgerEntry
+
+import utility as u
+
+schema_version = 1
+
+# column name: (.npy descr, array typecode)
+column_types = {
+    'date': ('<i4', 'i'),
+    'cents': ('<i8', 'q'),
+    'account': ('<i4', 'i'),
+    'side': ('|u1', 'B'),
+    'description': ('<i4', 'i'),
+    'source': ('<i4', 'i'),
+    'source_location': ('<i4', 'i'),
+    'string_offsets': ('<i8', 'q'),
+}
+categories = ('Asset', 'Liability', 'Equity', 'Revenue', 'Expense')  # the order in which accounts are written
+sides = ('debit', 'credit')
+
+# Write a one-dimensional .npy file (format version 1.0)
+# ref: https://numpy.org/doc/stable/reference/generated/numpy.lib.format.html
+def write_npy(path: str, descr: str, values: array.array) -> None:
+    header = "{'descr': '%s', 'fortran_order': False, 'shape': (%d,), }" % (descr, len(values))
+    preamble_len = 6 + 2 + 2  # magic string, version, header length
+    padding = 64 - (preamble_len + len(header) + 1) % 64
+    header = header + ' ' * (padding % 64) + '\n'
+    if sys.byteorder == 'big' and values.itemsize > 1:
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    with open(path, 'wb', buffering=1 << 20) as f:
+        f.write(b'\x93NUMPY\x01\x00')
+        f.write(len(header).to_bytes(2, 'little'))
+        f.write(header.encode('latin1'))
+        values.tofile(f)
+
+# Map a .npy file written by write_npy as a read-only memoryview of its values
+def map_npy(path: str, typecode: str) -> memoryview:
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    assert mm[0:8] == b'\x93NUMPY\x01\x00', f'{path} is not a version 1.0 .npy file'
+    header_len = int.from_bytes(mm[8:10], 'little')
+    header = ast.literal_eval(mm[10:10+header_len].decode('latin1'))
+    assert sys.byteorder == 'little' or header['descr'][0] == '|', f'{path} is little-endian'
+    (n,) = header['shape']
+    if n == 0: return memoryview(b'').cast(typecode)
+    return memoryview(mm)[10+header_len:].cast(typecode)
+
+# Write the ledgers of an accounting system as columns in a directory, creating it if needed
+# Accounts are written in category order, then by name; each account's entries stay in ledger order.
+def export(accounting_system: AccountingSystem, directory: str) -> int:
+    os.makedirs(directory, exist_ok=True)
+    columns = {name: array.array(typecode) for name, (_, typecode) in column_types.items()}
+    string_id = {}
+    pool = []
+    offset = 0
+    columns['string_offsets'].append(0)
+    def intern(s: str) -> int:
+        nonlocal offset
+        i = string_id.get(s, None)
+        if i is None:
+            i = len(pool)
+            string_id[s] = i
+            encoded = s.encode('utf-8')
+            pool.append(encoded)
+            offset += len(encoded)
+            columns['string_offsets'].append(offset)
+        return i
+    accounts = []
+    accounts_for_category = u.invert_dict(accounting_system.category_for)
+    for category in categories:
+        for account in sorted(accounts_for_category.get(category, set())):
+            account_id = len(accounts)
+            accounts.append({'name': account, 'category': category})
+            for ledger_entry in accounting_system.ledgers.get(account, []):
+                columns['date'].append(ledger_entry.date.toordinal())
+                columns['cents'].append(ledger_entry.balance.signed_cents())
+                columns['account'].append(account_id)
+                columns['side'].append(sides.index(ledger_entry.balance.side))
+                columns['description'].append(intern(ledger_entry.description))
+                columns['source'].append(intern(ledger_entry.source))
+                columns['source_location'].append(intern(ledger_entry.source_location))
+    for name, (descr, _) in column_types.items():
+        write_npy(os.path.join(directory, f'{name}.npy'), descr, columns[name])
+    with open(os.path.join(directory, 'strings.bin'), 'wb') as f:
+        f.write(b''.join(pool))
+    n_rows = len(columns['date'])
+    schema = {
+        'version': schema_version,
+        'n_rows': n_rows,
+        'columns': {name: {'file': f'{name}.npy', 'dtype': descr} for name, (descr, _) in column_types.items()},
+        'strings': 'strings.bin',
+        'sides': list(sides),
+        'accounts': accounts,
+    }
+    with open(os.path.join(directory, 'schema.json'), 'w') as f:
+        json.dump(schema, f, indent=1)
+    return n_rows
+
+# The columns of an exported directory, mapped into memory
+# Each column is a NumPy memmap when NumPy is installed and a memoryview otherwise; both index like sequences.
+class ColumnarLedgers:
+    def __init__(self, directory: str, use_numpy: bool = True):
+        with open(os.path.join(directory, 'schema.json'), 'r') as f:
+            self.schema = json.load(f)
+        assert self.schema['version'] == schema_version
+        np = None
+        if use_numpy:
+            try:
+                import numpy as np
+            except ImportError:
+                np = None
+        self.columns: Dict[str, Any] = {}
+        for name, column in self.schema['columns'].items():
+            path = os.path.join(directory, column['file'])
+            if np is not None:
+                self.columns[name] = np.load(path, mmap_mode='r')
+            else:
+                self.columns[name] = map_npy(path, column_types[name][1])
+        strings_path = os.path.join(directory, self.schema['strings'])
+        if os.path.getsize(strings_path) == 0:
+            self._strings = b''
+        else:
+            with open(strings_path, 'rb') as f:
+                self._strings = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.accounts: List[Tuple[str, str]] = [(x['category'], x['name']) for x in self.schema['accounts']]
+
+    def __len__(self) -> int:
+        return self.schema['n_rows']
+
+    def string(self, string_id: int) -> str:
+        offsets = self.columns['string_offsets']
+        return self._strings[int(offsets[string_id]):int(offsets[string_id+1])].decode('utf-8')
+
+    # Return row i as (category, account, LedgerEntry), decoding it from the columns
+    def row(self, i: int) -> Tuple[str, str, LedgerEntry]:
+        c = self.columns
+        category, account = self.accounts[int(c['account'][i])]
+        side = sides[int(c['side'][i])]
+        cents = int(c['cents'][i])
+        ledger_entry = LedgerEntry(
+            date=datetime.date.fromordinal(int(c['date'][i])),
+            balance=Balance(side=side, amount=Amount.from_cents(cents if side == 'debit' else -cents)),
+            description=self.string(int(c['description'][i])),
+            source=self.string(int(c['source'][i])),
+            source_location=self.string(int(c['source_location'][i])))
+        return category, account, ledger_entry
+
+
+class Test(unittest.TestCase):
+    def test_export_load(self):
+        x = AccountingSystem.empty()
+        x = x.join(AccountDeclaration(category='Asset', name='cash'))
+        x = x.join(AccountDeclaration(category='Revenue', name='sales'))
+        x = x.join(AccountDeclaration(category='Revenue', name='fees'))
+        def je(date, dollars, cents, credit_account, description):
+            return JournalEntry(
+                date=date,
+                amount=Amount(dollars=dollars, cents=cents),
+                debit_account='cash',
+                credit_account=credit_account,
+                description=description,
+                source='book.txt',
+                source_location='line 1')
+        x = x.join(je(datetime.date(2025, 1, 2), 100, 5, 'sales', 'first sale'))
+        x = x.join(je(datetime.date(2025, 1, 3), 0, 99, 'fees', 'fee ünicode'))
+        directory = tempfile.mkdtemp()
+        self.assertEqual(4, export(x, directory))
+        for use_numpy in (True, False):
+            y = ColumnarLedgers(directory, use_numpy=use_numpy)
+            self.assertEqual(4, len(y))
+            self.assertEqual([('Asset', 'cash'), ('Revenue', 'fees'), ('Revenue', 'sales')], y.accounts)
+            self.assertEqual([10005, 99, -99, -10005], [int(c) for c in y.columns['cents']])
+            rows = [y.row(i) for i in range(len(y))]
+            self.assertEqual(('Asset', 'cash'), rows[0][0:2])
+            self.assertEqual(x.ledgers['cash'][0], rows[0][2])
+            self.assertEqual(x.ledgers['cash'][1], rows[1][2])
+            self.assertEqual(x.ledgers['fees'][0], rows[2][2])
+            self.assertEqual(x.ledgers['sales'][0], rows[3][2])
+
+    def test_npy_header(self):
+        path = os.path.join(tempfile.mkdtemp(), 'x.npy')
+        write_npy(path, '<i8', array.array('q', [1, -2, 3]))
+        with open(path, 'rb') as f:
+            contents = f.read()
+        header_len = int.from_bytes(contents[8:10], 'little')
+        self.assertEqual(0, (10 + header_len) % 64)
+        self.assertEqual([1, -2, 3], list(map_npy(path, 'q')))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,281 @@
+# A mutable AccountingSystem that several threads can post to at once, as when feeds are ingested concurrently
+# The accounts are divided among stripes by the crc32 of their names, so that every run stripes them alike. A stripe's
+# lock guards the ledgers, balances, ledger hashes and activity of its accounts, and the stripe's shares of the
+# totals, the root hash and the rollup tree, which are summed over the stripes when a snapshot is made. Posting a
+# journal entry locks the stripes of its two accounts, in stripe order so that two posts cannot deadlock, and applies
+# both postings before unlocking, so entries whose accounts are in different stripes never wait for each other.
+# Declarations take a lock of their own and set up an account's stripe before the account can be posted to. A stripe
+# is books for accountingsystem.open_account and post, which apply declarations and postings as Builder does, and the
+# new balances are checked as there.
+from typing import Dict, List, Self, Tuple
+
+import datetime
+import random
+import threading
+import time
+import unittest
+import zlib
+
+from accountdeclaration import AccountDeclaration
+from accountingsystem import AccountingSystem, checked_balances_after, open_account, post
+from accountingsystemerror import AccountingSystemError
+from activity import Activity
+from amount import Amount
+from balance import Balance
+from journalentry import JournalEntry
+from ledgerentry import LedgerEntry
+
+
+class _Stripe:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ledgers: Dict[str, List[LedgerEntry]] = {}
+        self.balances: Dict[str, Balance] = {}
+        self.ledger_hashes: Dict[str, bytes] = {}
+        self.monthly_activity: Dict[Tuple[str, int, int], Activity] = {}
+        self.yearly_activity: Dict[Tuple[str, int], Activity] = {}
+        self.debit_total_cents = 0
+        self.credit_total_cents = 0
+        self.root_hash = 0                     # XOR of the leaf hashes of the stripe's accounts
+        self.rollup: Dict[Tuple[str, ...], int] = {}  # the stripe's accounts' shares of the rollup nodes
+
+class ConcurrentAccountingSystem:
+    def __init__(self, n_stripes: int = 64):
+        assert n_stripes > 0
+        self.category_for: Dict[str, str] = {}
+        self.n_contended = 0  # stripe locks that were held by another thread when requested
+        self._declaration_lock = threading.Lock()
+        self._stripes = [_Stripe() for _ in range(n_stripes)]
+
+    def _stripe_index(self, account: str) -> int:
+        return zlib.crc32(account.encode('utf-8')) % len(self._stripes)
+
+    # Join an account declaration or a journal entry, as AccountingSystem.join does, and return self
+    def join(self, other) -> Self:
+        if isinstance(other, AccountDeclaration): return self._join_account_declaration(other)
+        if isinstance(other, JournalEntry): return self._join_journal_entry(other)
+        assert False, f'attempt to join a {type(other)}'
+
+    def _join_account_declaration(self, ad: AccountDeclaration) -> Self:
+        with self._declaration_lock:
+            existing_category = self.category_for.get(ad.name, None)
+            if existing_category is not None:
+                assert existing_category == ad.category
+                return self
+            stripe = self._stripes[self._stripe_index(ad.name)]
+            with stripe.lock:
+                open_account(stripe, ad)
+            self.category_for[ad.name] = ad.category  # posts can use the account from here on
+        return self
+
+    def _join_journal_entry(self, je: JournalEntry) -> Self:
+        if je.debit_account not in self.category_for:
+            raise ValueError(f'account {je.debit_account} not previously defined')
+        if je.credit_account not in self.category_for:
+            raise ValueError(f'account {je.credit_account} not previously defined')
+        indices = sorted({self._stripe_index(je.debit_account), self._stripe_index(je.credit_account)})
+        for i in indices:
+            self._acquire(self._stripes[i].lock)
+        try:
+            postings = [
+                (self._stripes[self._stripe_index(account)], account, side)
+                for account, side in ((je.debit_account, 'debit'), (je.credit_account, 'credit'))]
+            balances = {account: stripe.balances[account] for stripe, account, _ in postings if account in stripe.balances}
+            new_balances = checked_balances_after(balances, je)  # before anything is changed
+            for stripe, account, side in postings:
+                ledger = stripe.ledgers.setdefault(account, [])
+                post(stripe, ledger, account, self.category_for[account], side, je, new_balances[account])
+        finally:
+            for i in reversed(indices):
+                self._stripes[i].lock.release()
+        return self
+
+    def _acquire(self, lock: threading.Lock) -> None:
+        if not lock.acquire(blocking=False):
+            self.n_contended += 1  # not exact under contention, which is all it measures
+            lock.acquire()
+
+    # Return an AccountingSystem with the postings made so far, taken with every stripe locked
+    def snapshot(self) -> AccountingSystem:
+        with self._declaration_lock:
+            for stripe in self._stripes:
+                stripe.lock.acquire()
+            try:
+                ledgers, balances, ledger_hashes, monthly_activity, yearly_activity, rollup = {}, {}, {}, {}, {}, {}
+                debit_total_cents, credit_total_cents, root_hash = 0, 0, 0
+                for stripe in self._stripes:
+                    ledgers.update((account, list(ledger)) for account, ledger in stripe.ledgers.items())
+                    balances.update(stripe.balances)
+                    ledger_hashes.update(stripe.ledger_hashes)
+                    monthly_activity.update(stripe.monthly_activity)
+                    yearly_activity.update(stripe.yearly_activity)
+                    debit_total_cents += stripe.debit_total_cents
+                    credit_total_cents += stripe.credit_total_cents
+                    root_hash ^= stripe.root_hash
+                    for node, cents in stripe.rollup.items():
+                        rollup[node] = rollup.get(node, 0) + cents
+                return AccountingSystem(
+                    category_for=dict(self.category_for),
+                    ledgers=ledgers,
+                    balances=balances,
+                    debit_total_cents=debit_total_cents,
+                    credit_total_cents=credit_total_cents,
+                    ledger_hashes=ledger_hashes,
+                    root_hash=root_hash,
+                    monthly_activity=monthly_activity,
+                    yearly_activity=yearly_activity,
+                    rollup=rollup)
+            finally:
+                for stripe in reversed(self._stripes):
+                    stripe.lock.release()
+
+
+class Test(unittest.TestCase):
+    accounts = [('Asset', f'Bank:Account {i}') for i in range(8)] + [('Expense', f'Spending:Category {i}') for i in range(24)]
+
+    def make_feeds(self, n_feeds: int, n_entries: int) -> List[List[JournalEntry]]:
+        rng = random.Random(n_feeds * 1000 + n_entries)
+        feeds = []
+        for feed in range(n_feeds):
+            entries = []
+            for i in range(n_entries):
+                debit_account, credit_account = rng.sample([name for _, name in self.accounts], 2)
+                entries.append(JournalEntry(
+                    date=datetime.date(2025, 1, 1) + datetime.timedelta(days=rng.randrange(365)),
+                    amount=Amount.from_cents(rng.randrange(1, 100_000)),
+                    debit_account=debit_account,
+                    credit_account=credit_account,
+                    description=f'feed {feed} entry {i}',
+                    source=f'feed {feed}',
+                    source_location=f'line {i+1}'))
+            feeds.append(entries)
+        return feeds
+
+    def declared(self, x):
+        for category, name in self.accounts:
+            x = x.join(AccountDeclaration(category=category, name=name))
+        return x
+
+    def ingest(self, feeds: List[List[JournalEntry]]) -> ConcurrentAccountingSystem:
+        x = self.declared(ConcurrentAccountingSystem(n_stripes=8))
+        def run(entries):
+            for entry in entries:
+                x.join(entry)
+        threads = [threading.Thread(target=run, args=(entries,)) for entries in feeds]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return x
+
+    def test_stress(self):
+        feeds = self.make_feeds(n_feeds=8, n_entries=1000)
+        x = self.ingest(feeds)
+        snapshot = x.snapshot()
+        snapshot.verify()  # the hashes, activity and rollup agree with the ledgers
+        expected_cents = {}
+        for entries in feeds:
+            for entry in entries:
+                expected_cents[entry.debit_account] = expected_cents.get(entry.debit_account, 0) + entry.amount.to_cents()
+                expected_cents[entry.credit_account] = expected_cents.get(entry.credit_account, 0) - entry.amount.to_cents()
+        self.assertEqual(expected_cents, {account: balance.signed_cents() for account, balance in snapshot.balances.items()})
+        self.assertEqual(8000, sum(len(ledger) for ledger in snapshot.ledgers.values()) // 2)
+        for ledger in snapshot.ledgers.values():
+            self.assertEqual(sorted(ledger, key=lambda e: e.date), ledger)
+        small = self.make_feeds(n_feeds=2, n_entries=40)
+        serial = self.declared(AccountingSystem.empty())
+        for entries in small:
+            for entry in entries:
+                serial = serial.join(entry)
+        self.assertEqual(serial.root_hash, self.ingest(small).snapshot().root_hash)
+
+    def test_posts_overlap(self):
+        # a post that waits on a stripe does not hold up posts to other stripes, which go ahead while it waits
+        x = self.declared(ConcurrentAccountingSystem(n_stripes=8))
+        names = [name for _, name in self.accounts]
+        def entry(debit_account, credit_account):
+            return JournalEntry(
+                date=datetime.date(2025, 1, 1),
+                amount=Amount.from_cents(100),
+                debit_account=debit_account,
+                credit_account=credit_account,
+                description='',
+                source='',
+                source_location='')
+        held, partner = next((a, b) for a in names for b in names if a != b and x._stripe_index(a) == x._stripe_index(b))
+        blocked_entry = entry(held, partner)
+        others = [name for name in names if x._stripe_index(name) != x._stripe_index(held)]
+        other_entries = [entry(a, b) for a, b in zip(others, others[1:]) if x._stripe_index(a) != x._stripe_index(b)][0:4]
+        self.assertGreater(len(other_entries), 0)
+        with x._stripes[x._stripe_index(held)].lock:
+            blocked = threading.Thread(target=x.join, args=(blocked_entry,))
+            blocked.start()
+            while x.n_contended == 0:  # until the post is waiting on the held stripe
+                time.sleep(0.001)
+            threads = [threading.Thread(target=x.join, args=(e,)) for e in other_entries]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(timeout=5)
+                self.assertFalse(thread.is_alive())
+            self.assertTrue(blocked.is_alive())
+        blocked.join(timeout=5)
+        self.assertFalse(blocked.is_alive())
+        snapshot = x.snapshot()
+        snapshot.verify()
+        self.assertEqual(1 + len(other_entries), sum(len(ledger) for ledger in snapshot.ledgers.values()) // 2)
+
+    def test_different_stripes_do_not_wait(self):
+        x = self.declared(ConcurrentAccountingSystem(n_stripes=8))
+        names = [name for _, name in self.accounts]
+        held = names[0]
+        others = [name for name in names if x._stripe_index(name) != x._stripe_index(held)]
+        debit_account = others[0]
+        credit_account = next(name for name in others if x._stripe_index(name) != x._stripe_index(debit_account))
+        entry = JournalEntry(
+            date=datetime.date(2025, 1, 1),
+            amount=Amount.from_cents(100),
+            debit_account=debit_account,
+            credit_account=credit_account,
+            description='',
+            source='',
+            source_location='')
+        with x._stripes[x._stripe_index(held)].lock:
+            thread = threading.Thread(target=x.join, args=(entry,))
+            thread.start()
+            thread.join(timeout=5)
+            self.assertFalse(thread.is_alive())
+        self.assertEqual(100, x.snapshot().balances[debit_account].signed_cents())
+
+    def test_declarations(self):
+        x = ConcurrentAccountingSystem()
+        x.join(AccountDeclaration(category='Asset', name='cash'))
+        x.join(AccountDeclaration(category='Asset', name='cash'))
+        with self.assertRaises(AssertionError):
+            x.join(AccountDeclaration(category='Expense', name='cash'))
+        with self.assertRaisesRegex(ValueError, 'not previously defined'):
+            x.join(JournalEntry(
+                date=datetime.date(2025, 1, 1),
+                amount=Amount.from_cents(1),
+                debit_account='cash',
+                credit_account='rent',
+                description='',
+                source='',
+                source_location=''))
+        expected = AccountingSystem.empty().join(AccountDeclaration(category='Asset', name='cash'))
+        self.assertEqual(expected, x.snapshot())
+
+    def test_corrupted_balance(self):
+        x = self.declared(ConcurrentAccountingSystem(n_stripes=8))
+        feeds = self.make_feeds(n_feeds=1, n_entries=10)
+        for entry in feeds[0]:
+            x.join(entry)
+        entry = feeds[0][0]
+        stripe = x._stripes[x._stripe_index(entry.debit_account)]
+        stripe.balances[entry.debit_account] = {}
+        with self.assertRaises(AccountingSystemError):
+            x.join(entry)
+        self.assertEqual(10, sum(len(ledger) for ledger in x.snapshot().ledgers.values()) // 2)  # nothing was posted
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+# Detect journal entries repeated across files, as when bank exports covering overlapping periods are imported
+# Two entries are the same transaction when they have the same date, amount, accounts and normalized description
+# (see categorize.py). A file may legitimately hold several such entries, as for two coffees on one day, so the index
+# remembers, for each key, the most times it occurred in any one earlier file. The n-th occurrence of a key in a file
+# is a duplicate if an earlier file had the key at least n times. Checking an entry is a dictionary lookup; the
+# file's counts are merged into the index when the file ends.
+from dataclasses import dataclass
+from typing import Dict, List, Tuple, Union
+
+import datetime
+import unittest
+
+from amount import Amount
+from categorize import normalize
+from journalentry import JournalEntry
+
+Key = Tuple[int, int, str, str, str]  # date ordinal, cents, debit account, credit account, normalized description
+
+def key_of(journal_entry: JournalEntry) -> Key:
+    return (
+        journal_entry.date.toordinal(),
+        journal_entry.amount.to_cents(),
+        journal_entry.debit_account,
+        journal_entry.credit_account,
+        normalize(journal_entry.description))
+
+@dataclass(frozen=True)
+class Duplicate:
+    journal_entry: JournalEntry
+    earlier_source: str  # the first file with the entry
+
+class DuplicateIndex:
+    def __init__(self):
+        self._known: Dict[Key, Tuple[int, str]] = {}  # key: (most occurrences in one file, first file)
+        self._file_counts: Dict[Key, int] = {}
+        self._source: Union[str, None] = None
+        self.duplicates: List[Duplicate] = []
+
+    def start_file(self, source: str) -> None:
+        assert self._source is None, f'file {self._source} not ended'
+        self._source = source
+
+    # Return the earlier file with the entry if it is a duplicate, otherwise None
+    def check(self, journal_entry: JournalEntry) -> Union[str, None]:
+        assert self._source is not None, 'no file started'
+        key = key_of(journal_entry)
+        n = self._file_counts.get(key, 0) + 1
+        self._file_counts[key] = n
+        known = self._known.get(key, None)
+        if known is None or n > known[0]: return None
+        self.duplicates.append(Duplicate(journal_entry=journal_entry, earlier_source=known[1]))
+        return known[1]
+
+    def end_file(self) -> None:
+        for key, n in self._file_counts.items():
+            known = self._known.get(key, None)
+            if known is None:
+                self._known[key] = (n, self._source)
+            elif n > known[0]:
+                self._known[key] = (n, known[1])
+        self._file_counts = {}
+        self._source = None
+
+
+class Test(unittest.TestCase):
+    def test_overlapping_files(self):
+        def je(day, cents, description):
+            return JournalEntry(
+                date=datetime.date(2025, 1, day),
+                amount=Amount.from_cents(cents),
+                debit_account='Food',
+                credit_account='Cash',
+                description=description,
+                source='',
+                source_location='')
+        index = DuplicateIndex()
+        index.start_file('january-a.csv')
+        self.assertEqual([None, None, None], [index.check(x) for x in (je(1, 500, 'Coffee'), je(1, 500, 'Coffee'), je(2, 900, 'Lunch'))])
+        index.end_file()
+        index.start_file('january-b.csv')
+        self.assertEqual('january-a.csv', index.check(je(1, 500, 'COFFEE ')))
+        self.assertEqual('january-a.csv', index.check(je(1, 500, 'coffee')))
+        self.assertIsNone(index.check(je(1, 500, 'coffee')))  # a third coffee on the 1st is new
+        self.assertIsNone(index.check(je(2, 901, 'Lunch')))
+        self.assertEqual('january-a.csv', index.check(je(2, 900, 'Lunch')))
+        index.end_file()
+        index.start_file('january-c.csv')
+        self.assertEqual('january-a.csv', index.check(je(1, 500, 'Coffee')))
+        self.assertEqual('january-a.csv', index.check(je(1, 500, 'Coffee')))
+        self.assertEqual('january-a.csv', index.check(je(1, 500, 'Coffee')))
+        self.assertIsNone(index.check(je(1, 500, 'Coffee')))
+        index.end_file()
+        self.assertEqual(6, len(index.duplicates))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,227 @@
+# Close fiscal years, which are calendar years, and keep each closed year apart from the open books
+# Closing a year posts closing entries that move the balances of its Revenue and Expense accounts to a retained
+# earnings account, and makes opening entries for the next year that carry the balances of the Asset, Liability and
+# Equity accounts forward against an opening balances account. A closed year is written under _closed-years in
+# the directory of the book, as
+#   _closed-years/index.json          the Closing: the last closed year and the files read only for closed years
+#   _closed-years/opening.txt         declarations of every account and the opening entries of the open year
+#   _closed-years/{year}/year.json    the accounts and their balances in signed cents at the end of the year
+#   _closed-years/{year}/columns      the year's ledgers, including its opening and closing entries (see columnarledgers.py)
+# The open books start from opening.txt, so loading them reads only the open years. ClosedYears reads a closed year
+# only when a query reaches back into it.
+from dataclasses import dataclass
+from typing import Dict, List, Tuple, Union
+
+import bisect
+import dataclasses
+import datetime
+import json
+import os
+import tempfile
+import unittest
+
+from accountdeclaration import AccountDeclaration
+from accountingsystem import AccountingSystem
+from amount import Amount
+from journalentry import JournalEntry
+from ledgerentry import LedgerEntry
+
+import columnarledgers
+import parse
+
+closed_directory_name = '_closed-years'
+temporary_categories = ('Revenue', 'Expense')  # the categories that closing entries bring to zero
+
+@dataclass(frozen=True)
+class Closing:
+    closed_through: int                             # the last closed year
+    closed_sources: Tuple[Tuple[str, int, int], ...]  # (filename, size, mtime_ns) of files with no entries in open years
+    retained_earnings: str
+    opening_balances: str
+
+def make_journal_entry(date: datetime.date, signed_cents: int, account: str, other_account: str, description: str) -> JournalEntry:
+    # debit account for a positive amount and credit it for a negative one, against other_account
+    debit_account, credit_account = (account, other_account) if signed_cents > 0 else (other_account, account)
+    return JournalEntry(
+        date=date,
+        amount=Amount.from_cents(abs(signed_cents)),
+        debit_account=debit_account,
+        credit_account=credit_account,
+        description=description,
+        source='',
+        source_location='')
+
+# Return the entries dated December 31 that bring the Revenue and Expense accounts of a year's books to zero
+def closing_entries(accounting_system: AccountingSystem, year: int, retained_earnings: str) -> List[JournalEntry]:
+    r = []
+    for account, category in sorted(accounting_system.category_for.items()):
+        if category not in temporary_categories: continue
+        balance = accounting_system.balances.get(account, None)
+        cents = 0 if balance is None else balance.signed_cents()
+        if cents != 0:
+            r.append(make_journal_entry(datetime.date(year, 12, 31), -cents, account, retained_earnings, f'close {year}'))
+    return r
+
+# Return the entries dated January 1 that give each account with a nonzero balance in year_end_cents that balance
+def opening_entries(year_end_cents: Dict[str, int], year: int, opening_balances: str) -> List[JournalEntry]:
+    return [
+        make_journal_entry(datetime.date(year, 1, 1), cents, account, opening_balances, f'opening balance {year}')
+        for account, cents in sorted(year_end_cents.items())
+        if cents != 0 and account != opening_balances
+    ]
+
+# Return the balances of the accounts carried into the next year, in signed cents
+def year_end_cents(accounting_system: AccountingSystem) -> Dict[str, int]:
+    return {
+        account: accounting_system.balances[account].signed_cents()
+        for account, category in accounting_system.category_for.items()
+        if category not in temporary_categories and account in accounting_system.balances
+    }
+
+def render_opening(category_for: Dict[str, str], entries: List[JournalEntry]) -> str:
+    lines = ['# written by closing the books; declarations of every account and the opening entries']
+    for account, category in sorted(category_for.items()):
+        lines.append(f'{category}: {account}')
+    for entry in entries:
+        lines.append(parse.render_journal_entry(entry))
+    return '\n'.join(lines) + '\n'
+
+def root_of(directory: str) -> str:
+    return os.path.join(directory, closed_directory_name)
+
+# Write a closed year's books under the root
+def write_closed_year(directory: str, year: int, accounting_system: AccountingSystem) -> None:
+    year_directory = os.path.join(root_of(directory), f'{year}')
+    os.makedirs(year_directory, exist_ok=True)
+    columnarledgers.export(accounting_system, os.path.join(year_directory, 'columns'))
+    with open(os.path.join(year_directory, 'year.json'), 'w') as f:
+        json.dump({
+            'year': year,
+            'category_for': accounting_system.category_for,
+            'balance_cents': {account: balance.signed_cents() for account, balance in accounting_system.balances.items()},
+        }, f, indent=1, sort_keys=True)
+
+# Write opening.txt and then index.json, which makes the closing take effect
+def write_closing(directory: str, closing: Closing, opening_text: str) -> None:
+    root = root_of(directory)
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, 'opening.txt'), 'w') as f:
+        f.write(opening_text)
+    temp_path = os.path.join(root, 'index.json.tmp')
+    with open(temp_path, 'w') as f:
+        json.dump(dataclasses.asdict(closing), f, indent=1)
+    os.replace(temp_path, os.path.join(root, 'index.json'))
+
+# Return the closing of the books in a directory, or None if no year has been closed
+def load_closing(directory: str) -> Union[Closing, None]:
+    path = os.path.join(root_of(directory), 'index.json')
+    if not os.path.exists(path): return None
+    with open(path, 'r') as f:
+        x = json.load(f)
+    return Closing(
+        closed_through=x['closed_through'],
+        closed_sources=tuple(tuple(source) for source in x['closed_sources']),
+        retained_earnings=x['retained_earnings'],
+        opening_balances=x['opening_balances'])
+
+# The closed years of the books in a directory, each read when first needed
+class ClosedYears:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.closing = load_closing(directory)
+        self._ledgers: Dict[int, columnarledgers.ColumnarLedgers] = {}
+        self._years: Dict[int, dict] = {}
+
+    def years(self) -> List[int]:
+        root = root_of(self.directory)
+        if self.closing is None: return []
+        return sorted(int(name) for name in os.listdir(root) if name.isdigit())
+
+    def year(self, year: int) -> dict:
+        if year not in self._years:
+            with open(os.path.join(root_of(self.directory), f'{year}', 'year.json'), 'r') as f:
+                self._years[year] = json.load(f)
+        return self._years[year]
+
+    def ledgers(self, year: int) -> columnarledgers.ColumnarLedgers:
+        if year not in self._ledgers:
+            self._ledgers[year] = columnarledgers.ColumnarLedgers(os.path.join(root_of(self.directory), f'{year}', 'columns'))
+        return self._ledgers[year]
+
+    # Return the ledger entries of an account dated start through end in the closed years, in ledger order
+    # Only the years in the range are read. An account's rows are contiguous in the columns, so they are found by
+    # binary search on the account column.
+    def ledger(self, account: str, start: datetime.date, end: datetime.date) -> List[LedgerEntry]:
+        r = []
+        for year in self.years():
+            if year < start.year or year > end.year: continue
+            ledgers = self.ledgers(year)
+            account_ids = [i for i, (_, name) in enumerate(ledgers.accounts) if name == account]
+            if len(account_ids) == 0: continue
+            column = ledgers.columns['account']
+            lo = bisect.bisect_left(column, account_ids[0])
+            hi = bisect.bisect_right(column, account_ids[0])
+            for i in range(lo, hi):
+                _, _, ledger_entry = ledgers.row(i)
+                if start <= ledger_entry.date <= end:
+                    r.append(ledger_entry)
+        return r
+
+
+class Test(unittest.TestCase):
+    def test_close(self):
+        x = AccountingSystem.empty()
+        for category, name in (
+                ('Asset', 'cash'),
+                ('Equity', 'owners equity'),
+                ('Equity', 'retained earnings'),
+                ('Equity', 'opening balances'),
+                ('Revenue', 'sales'),
+                ('Expense', 'rent')):
+            x = x.join(AccountDeclaration(category=category, name=name))
+        def je(date, cents, debit_account, credit_account):
+            return JournalEntry(
+                date=date,
+                amount=Amount.from_cents(cents),
+                debit_account=debit_account,
+                credit_account=credit_account,
+                description='x',
+                source='',
+                source_location='')
+        x = x.join(je(datetime.date(2024, 1, 2), 1000_00, 'cash', 'owners equity'))
+        x = x.join(je(datetime.date(2024, 3, 1), 300_00, 'cash', 'sales'))
+        x = x.join(je(datetime.date(2024, 4, 1), 100_00, 'rent', 'cash'))
+        closing = closing_entries(x, 2024, 'retained earnings')
+        self.assertEqual(2, len(closing))
+        for entry in closing:
+            x = x.join(entry)
+        self.assertEqual(0, x.balances['sales'].signed_cents())
+        self.assertEqual(0, x.balances['rent'].signed_cents())
+        self.assertEqual(-200_00, x.balances['retained earnings'].signed_cents())
+        carried = year_end_cents(x)
+        self.assertEqual({'cash': 1200_00, 'owners equity': -1000_00, 'retained earnings': -200_00}, carried)
+        self.assertEqual(0, sum(carried.values()))
+
+        y = AccountingSystem.empty()
+        for account, category in x.category_for.items():
+            y = y.join(AccountDeclaration(category=category, name=account))
+        for entry in opening_entries(carried, 2025, 'opening balances'):
+            y = y.join(entry)
+        self.assertEqual(carried, {account: cents for account, cents in year_end_cents(y).items() if cents != 0 and account != 'opening balances'})
+        self.assertEqual(0, y.balances['opening balances'].signed_cents())
+
+        directory = tempfile.mkdtemp()
+        write_closed_year(directory, 2024, x)
+        write_closing(directory, Closing(2024, (('2024.txt', 1, 2),), 'retained earnings', 'opening balances'), render_opening(x.category_for, []))
+        self.assertEqual(('2024.txt', 1, 2), load_closing(directory).closed_sources[0])
+        closed_years = ClosedYears(directory)
+        self.assertEqual([2024], closed_years.years())
+        self.assertEqual({}, closed_years._ledgers)  # nothing is read until a query reaches back
+        self.assertEqual([], closed_years.ledger('cash', datetime.date(2025, 1, 1), datetime.date(2025, 12, 31)))
+        self.assertEqual({}, closed_years._ledgers)
+        cash = closed_years.ledger('cash', datetime.date(2024, 1, 1), datetime.date(2024, 3, 31))
+        self.assertEqual(x.ledgers['cash'][0:2], cash)
+        self.assertEqual(1200_00, closed_years.year(2024)['balance_cents']['cash'])
+
+if __name__ == '__main__':
+    unittest.main()
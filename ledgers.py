@@ -1,18 +1,27 @@
 # pipeline a csv file with journal entries to a csv file with ledger entries
-from typing import List, Union
+# usage: python3 ledgers.py [--workers N] [file ...]    read stdin if there are no files
+# With --workers N, the files are parsed by N worker processes, one file at a time, and the ledgers are built by N
+# worker processes, each owning the accounts that hash to it.
+from typing import Dict, List, Tuple, Union
 
+import argparse
 import collections
-import copy
+import concurrent.futures
 import csv
 import datetime
-import fileinput
+import io
 import os
+import pickle
 import sys
+import tempfile
+import zlib
 
 from sac import AccountDeclaration, Amount, JournalEntry, InputError, LedgerEntry
 import sac
 import utility as u
 
+# The join functions update the dicts of a state in place, so that joining a line does not copy the ledgers; keep the
+# state that join returns, as in state = join(state, line).
 State = collections.namedtuple('State', 'category_for_account ledger_entries_for_account previous_journal_entry line source location')
 
 verbose = False
@@ -55,13 +64,11 @@ def join_State_str(state: State, y: str) -> State:
     #breakpoint()
     if len(y) == 0: return state
     if y.startswith('#'): return state
-    front, _, _ = y.partition('#')
-    for row1 in csv.reader([front]):  # parse as a line in a CSV file
-        row = list(map(str.strip, row1))  # remove any leading or trailing white space
-        if len(row) == 1: return join_State_AccountDeclarationstr(state, row[0])
-        if len(row) > 5: raise InputError('line has more than five CSV columns')
-        if len(row) <= 5: return join_State_JournalEntrystr(state, row)
-    return state  # silence a type-checking error
+    row = u.split_csvline(y, comment='#')  # parse as a line in a CSV file, without leading or trailing white space
+    if len(row) == 0: return state
+    if len(row) == 1: return join_State_AccountDeclarationstr(state, row[0])
+    if len(row) > 5: raise InputError('line has more than five CSV columns')
+    return join_State_JournalEntrystr(state, row)
 
 def join_State_AccountDeclaration(state: State, ad: AccountDeclaration) -> State:
     assert isinstance(state, State)
@@ -69,9 +76,8 @@ def join_State_AccountDeclaration(state: State, ad: AccountDeclaration) -> State
     category, account = ad
     existing_category = state.category_for_account.get(account, None)
     if existing_category is None:
-        new_state = copy.deepcopy(state)
-        new_state.category_for_account[account] = category
-        return new_state
+        state.category_for_account[account] = category
+        return state
     if category == state.category_for_account[account]: 
         return state
     raise InputError(f'attempt to redefine category for account {account} from {existing_category} to {category}')
@@ -83,6 +89,10 @@ def join_State_AccountDeclarationstr(state: State, line: str) -> State:
     assert isinstance(ad, AccountDeclaration)
     return join_State_AccountDeclaration(state, ad)
 
+# ledgers are kept in date order; entries with the same date stay in the order they were read
+def ledger_date(ledger_entry: LedgerEntry) -> datetime.date:
+    return ledger_entry.date
+
 def join_State_JournalEntry(state: State, je: JournalEntry) -> State:
     assert isinstance(state, State)
     assert isinstance(je, JournalEntry)
@@ -90,12 +100,9 @@ def join_State_JournalEntry(state: State, je: JournalEntry) -> State:
         category = state.category_for_account[account]
         balance = sac.make('Balance', side, je.amount)
         return sac.make('LedgerEntry', category, account, je.date, balance, je.description, state.source, state.location)
-    new_ledgers = copy.deepcopy(state.ledger_entries_for_account)
-    new_ledgers[je.debit_account].append(ledger_entry('debit', je.debit_account))
-    new_ledgers[je.credit_account].append(ledger_entry('credit', je.credit_account))
-    return state._replace(
-        ledger_entries_for_account=new_ledgers,
-        previous_journal_entry=je)
+    u.insert_in_order(state.ledger_entries_for_account[je.debit_account], ledger_entry('debit', je.debit_account), key=ledger_date)
+    u.insert_in_order(state.ledger_entries_for_account[je.credit_account], ledger_entry('credit', je.credit_account), key=ledger_date)
+    return state._replace(previous_journal_entry=je)
 
 def join_State_JournalEntrystr(state: State, items: List[str]) -> State:
     assert len(items) > 1
@@ -133,28 +140,161 @@ def join_State_JournalEntrystr(state: State, items: List[str]) -> State:
     else:
         return join_State_JournalEntrystr(state, join(items, ''))
 
+ledger_header = ('category', 'account', 'date', 'side', 'amount', 'description', 'line', 'location')
+
+# the order of the accounts in the output
+def account_sort_key(account: str):
+    return account.split()
+
+# write the rows of one account's ledger, which is kept in date order as it is built (see utility.insert_in_order)
+def write_ledger_rows(writer, category: str, account: str, ledger_entries: List[LedgerEntry]) -> None:
+    for ledger_entry in ledger_entries:
+        assert isinstance(ledger_entry, LedgerEntry)
+        writer.writerow((
+            category,
+            account,
+            cast('str', ledger_entry.date),
+            ledger_entry.balance.side,
+            cast('str', ledger_entry.balance.amount),
+            ledger_entry.description,
+            ledger_entry.source,
+            ledger_entry.location,
+        ))
+
 # write ledgers to stdout formated as a CSV file
 def produce_output(state: State) -> None:
     vp(f'produce_output: n_accounts: {len(state.category_for_account)}, n_ledgers: {len(state.ledger_entries_for_account)}')
-    #breakpoint()
     writer = csv.writer(sys.stdout, quoting=csv.QUOTE_MINIMAL)
-    writer.writerow(('category', 'account', 'date', 'side', 'amount', 'description', 'line', 'location'))
+    writer.writerow(ledger_header)
     accounts_for_category = u.invert_dict(state.category_for_account)
     for category in ('Asset', 'Liability', 'Equity', 'Revenue', 'Expense'):
-        accounts = accounts_for_category[category]
-        for account in sorted(accounts, key=lambda account: account.split()):
-            for ledger_entry in sorted(state.ledger_entries_for_account[account], key=lambda ledger_entry: ledger_entry.date):
-                assert isinstance(ledger_entry, LedgerEntry)
-                writer.writerow((
-                    category,
-                    account,
-                    cast('str', ledger_entry.date),
-                    ledger_entry.balance.side,
-                    cast('str', ledger_entry.balance.amount),
-                    ledger_entry.description,
-                    ledger_entry.source,
-                    ledger_entry.location,
-                ))
+        accounts = accounts_for_category.get(category, set())
+        for account in sorted(accounts, key=account_sort_key):
+            write_ledger_rows(writer, category, account, state.ledger_entries_for_account[account])
+
+# Return the shard that owns an account; crc32 is used rather than hash() so that every process agrees
+def shard_of(account: str, n_shards: int) -> int:
+    return zlib.crc32(account.encode('utf-8')) % n_shards
+
+# Spill the ledger entries of each shard to its own file, in the order they are added, in pickled batches
+class ShardSpill:
+    def __init__(self, directory: str, n_shards: int, prefix: str = '', batch_size: int = 10_000):
+        self.paths = [os.path.join(directory, f'{prefix}shard-{i}.in') for i in range(n_shards)]
+        self._files = [open(path, 'wb') for path in self.paths]
+        self._batches = [[] for _ in range(n_shards)]
+        self._batch_size = batch_size
+
+    def add(self, ledger_entry: LedgerEntry) -> None:
+        i = shard_of(ledger_entry.account, len(self.paths))
+        batch = self._batches[i]
+        batch.append(ledger_entry)
+        if len(batch) >= self._batch_size:
+            pickle.dump(batch, self._files[i], protocol=pickle.HIGHEST_PROTOCOL)
+            batch.clear()
+
+    def close(self) -> None:
+        for f, batch in zip(self._files, self._batches):
+            if len(batch) > 0:
+                pickle.dump(batch, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.close()
+
+# Return the accounts declared in a journal file, in order, run in a worker process before the files are parsed
+# Reading stops at a line that cannot be read, which the parse of the file reports.
+def read_declarations(filename: str) -> List[AccountDeclaration]:
+    r = []
+    with u.open_text(filename) as f:
+        for line in f:
+            try:
+                row = u.split_csvline(line.strip(), comment='#')
+                if len(row) == 1: r.append(cast('AccountDeclaration', row[0]))
+            except Exception:
+                break
+    return r
+
+# Parse a journal file, run in a worker process, given the accounts declared in the files before it
+# Spill its ledger entries to a file per shard, named with prefix, and return the paths of those files.
+def parse_file(filename: str, category_for_account: Dict[str, str], directory: str, prefix: str, n_shards: int) -> List[str]:
+    spill = ShardSpill(directory, n_shards, prefix)
+    try:
+        state = State(dict(category_for_account), collections.defaultdict(list), None, None, filename, None)
+        with u.open_text(filename) as f:
+            process_lines(state, f, spill.add)
+    finally:
+        spill.close()
+    return spill.paths
+
+# Build the ledgers of the accounts in one shard, run in a worker process, from its spill files in the order read
+# Write the output rows of each account to out_path and return {account: (offset, length)} of its rows there.
+def build_shard(in_paths: List[str], out_path: str) -> Dict[str, Tuple[int, int]]:
+    ledgers = collections.defaultdict(list)
+    for in_path in in_paths:
+        with open(in_path, 'rb') as f:
+            while True:
+                try:
+                    batch = pickle.load(f)
+                except EOFError:
+                    break
+                for ledger_entry in batch:
+                    u.insert_in_order(ledgers[ledger_entry.account], ledger_entry, key=ledger_date)
+    index = {}
+    offset = 0
+    with open(out_path, 'wb') as f:
+        for account, ledger_entries in ledgers.items():
+            text = io.StringIO(newline='')
+            write_ledger_rows(csv.writer(text, quoting=csv.QUOTE_MINIMAL), ledger_entries[0].category, account, ledger_entries)
+            data = text.getvalue().encode('utf-8')
+            f.write(data)
+            index[account] = (offset, len(data))
+            offset += len(data)
+    return index
+
+# Parse the files and build their ledgers in worker processes, and write the ledgers to stdout in the order
+# produce_output does
+# The workers first read the accounts each file declares, and then each file is parsed by a worker given the accounts
+# declared in the files before it, as a file is parsed on its own but for those. A file is not split further, as an
+# abbreviated line takes what it leaves out from the line before it, so standard input is parsed here, by one process.
+# The ledger entries are spilled to a file per source and shard, and each shard's ledgers are built by a worker from
+# its spill files in the order of the sources, so that entries with the same date stay in the order they were read.
+def produce_output_sharded(filenames: List[str], n_workers: int) -> None:
+    with tempfile.TemporaryDirectory(prefix='ledgers-') as directory:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=n_workers) as executor:
+            if len(filenames) == 0:
+                spill = ShardSpill(directory, n_workers, 'stdin-')
+                try:
+                    state = State({}, collections.defaultdict(list), None, None, '(stdin)', None)
+                    category_for_account = process_lines(state, u.open_text('-'), spill.add).category_for_account
+                finally:
+                    spill.close()
+                spill_paths = [spill.paths]
+            else:
+                category_for_account = {}
+                declared_before = []  # the accounts declared in the files before each file
+                for declarations in executor.map(read_declarations, filenames):
+                    declared_before.append(dict(category_for_account))
+                    for category, account in declarations:
+                        category_for_account.setdefault(account, category)
+                futures = [
+                    executor.submit(parse_file, filename, declared_before[i], directory, f'file-{i}-', n_workers)
+                    for i, filename in enumerate(filenames)]
+                spill_paths = [future.result() for future in futures]  # the first error in the order of the files
+            out_paths = [os.path.join(directory, f'shard-{i}.out') for i in range(n_workers)]
+            futures = [executor.submit(build_shard, [paths[i] for paths in spill_paths], out_paths[i]) for i in range(n_workers)]
+            indexes = [future.result() for future in futures]
+        vp(f'produce_output_sharded: n_accounts: {len(category_for_account)}, n_shards: {n_workers}')
+        csv.writer(sys.stdout, quoting=csv.QUOTE_MINIMAL).writerow(ledger_header)
+        out_files = [open(out_path, 'rb') for out_path in out_paths]
+        try:
+            accounts_for_category = u.invert_dict(category_for_account)
+            for category in ('Asset', 'Liability', 'Equity', 'Revenue', 'Expense'):
+                for account in sorted(accounts_for_category.get(category, set()), key=account_sort_key):
+                    i = shard_of(account, n_workers)
+                    if account not in indexes[i]: continue
+                    offset, length = indexes[i][account]
+                    out_files[i].seek(offset)
+                    sys.stdout.write(out_files[i].read(length).decode('utf-8'))
+        finally:
+            for f in out_files:
+                f.close()
 
 # join line to state, raising any InputError
 def process_line(state: State, line: str) -> State:
@@ -166,26 +306,38 @@ def process_line(state: State, line: str) -> State:
         e.add_note(f'in file {state.source} line number {state.location}')
         raise
 
+# join the lines of a source to state
+# With sink, the ledger entries made by each line are passed to it and dropped from the state, so that the state holds
+# only the accounts and the previous journal entry.
+def process_lines(state: State, lines, sink=None) -> State:
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        state = state._replace(line=stripped, location=f'{i+1}')
+        state = process_line(state, stripped)
+        if sink is not None and len(state.ledger_entries_for_account) > 0:
+            for ledger_entries in state.ledger_entries_for_account.values():
+                for ledger_entry in ledger_entries:
+                    sink(ledger_entry)
+            state = state._replace(ledger_entries_for_account=collections.defaultdict(list))
+    return state
+
 def main():
-    #breakpoint()
+    parser = argparse.ArgumentParser(description='write the ledgers of journal files as a CSV file')
+    parser.add_argument('filenames', nargs='*', help='journal files; stdin if none')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes building the ledgers')
+    args = parser.parse_args()
+    if args.workers > 1:
+        produce_output_sharded(args.filenames, args.workers)
+        return
     state = State({}, collections.defaultdict(list), None, None, None, None)
-    assert isinstance(state, State)
-    if len(sys.argv) > 1:  # process files on the command line
-        # directory = '.'
-        for filename in sys.argv[1:]:
+    if len(args.filenames) > 0:  # process files on the command line
+        for filename in args.filenames:
             state = state._replace(source=filename, previous_journal_entry=None)
-            # path = os.path.join(directory, filename)
-            with open(filename, 'r') as f:
-                for i, line in enumerate(f):
-                    stripped = line.strip()
-                    state = state._replace(line=stripped, location=f'{i+1}')
-                    state = process_line(state, stripped)
+            with u.open_text(filename) as f:
+                state = process_lines(state, f)
     else:  # read from standard in
         state = state._replace(source='(stdin)')
-        for i, line in enumerate(fileinput.input()):
-            stripped = line.strip()
-            state = state._replace(line=stripped, location=f'{i+1}')
-            state = process_line(state, stripped)
+        state = process_lines(state, u.open_text('-'))
     assert isinstance(state, State)
     produce_output(state)
 
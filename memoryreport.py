@@ -0,0 +1,157 @@
+# Measure the memory used by an AccountingSystem and by the phases of a run
+# The structure sizes come from walking the objects with sys.getsizeof, counting each object once. The phase sizes
+# come from tracemalloc, which must be tracing while the phases run.
+from typing import Any, List, Tuple
+
+import contextlib
+import datetime
+import sys
+import tracemalloc
+import types
+import unittest
+
+from accountdeclaration import AccountDeclaration
+from accountingsystem import AccountingSystem
+from alignedcsv import AlignedCSV
+from amount import Amount
+from journalentry import JournalEntry
+
+import tokencache as tc
+
+# Sum sys.getsizeof over the objects reachable from the roots passed to walk, counting each object once
+# The bytes in str objects are tallied separately, as they are often shared between structures.
+class MemoryWalk:
+    def __init__(self):
+        self.seen = set()
+        self.string_bytes = 0
+
+    def walk(self, root: Any) -> int:
+        r = 0
+        stack = [root]
+        while len(stack) > 0:
+            x = stack.pop()
+            if id(x) in self.seen: continue
+            self.seen.add(id(x))
+            if isinstance(x, (type, types.ModuleType, types.FunctionType)): continue
+            if isinstance(x, str):
+                self.string_bytes += sys.getsizeof(x)
+                continue
+            r += sys.getsizeof(x)
+            if isinstance(x, dict):
+                stack.extend(x.keys())
+                stack.extend(x.values())
+            elif isinstance(x, (list, tuple, set, frozenset)):
+                stack.extend(x)
+            else:
+                if hasattr(x, '__dict__'): stack.append(vars(x))
+                for slot in getattr(type(x), '__slots__', ()):
+                    if hasattr(x, slot): stack.append(getattr(x, slot))
+        return r
+
+def count_postings(accounting_system: AccountingSystem) -> int:
+    return sum(len(ledger) for ledger in accounting_system.ledgers.values())
+
+# Approximate bytes held by the token cache: an lru_cache entry is a 4-item link, a key tuple and a dict slot
+# The cached values are mostly dates and amounts, whose size is estimated from a sample of each.
+def token_cache_bytes() -> int:
+    entry_bytes = sys.getsizeof([None, None, None, None]) + sys.getsizeof((None, None)) + 3 * 8
+    value_bytes = (sys.getsizeof(datetime.date.min) + MemoryWalk().walk(Amount.zero())) // 2
+    return tc.stats()['currsize'] * (entry_bytes + value_bytes)
+
+# Return [(structure name, bytes)] for an accounting system and the parse caches
+def structure_sizes(accounting_system: AccountingSystem) -> List[Tuple[str, int]]:
+    w = MemoryWalk()
+    r = [
+        ('category_for', w.walk(accounting_system.category_for)),
+        ('ledgers', w.walk(accounting_system.ledgers)),
+        ('balances', w.walk(accounting_system.balances)),
+        ('monthly activity', w.walk(accounting_system.monthly_activity)),
+        ('yearly activity', w.walk(accounting_system.yearly_activity)),
+        ('ledger hashes', w.walk(accounting_system.ledger_hashes)),
+        ('rollup', w.walk(accounting_system.rollup)),
+    ]
+    r.append(('strings', w.string_bytes))
+    r.append(('parse caches (estimated)', token_cache_bytes()))
+    return r
+
+# Record the memory allocated by and during each phase of a run
+# Each phase records the memory in use at its end and the peak while it ran. Tracing starts when the first
+# phase starts, if it is not already on.
+class PhaseTracker:
+    def __init__(self):
+        self.phases: List[Tuple[str, int, int]] = []  # (name, current bytes at end, peak bytes)
+        self._started_tracing = False
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            current, peak = tracemalloc.get_traced_memory()
+            self.phases.append((name, current, peak))
+
+    def stop(self) -> None:
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+# Return the memory report as an AlignedCSV with the header line
+def make_report(accounting_system: AccountingSystem, phase_tracker: PhaseTracker) -> AlignedCSV:
+    n_postings = count_postings(accounting_system)
+    def per_posting(n_bytes: int) -> str:
+        return '' if n_postings == 0 else f'{n_bytes / n_postings:.1f}'
+    r = AlignedCSV(alignments=('left', 'left', 'right', 'right'))
+    r = r.join(('kind', 'name', 'bytes', 'bytes per posting'))
+    r = r.join(('count', 'postings', n_postings, ''))
+    total = 0
+    for name, n_bytes in structure_sizes(accounting_system):
+        total += n_bytes
+        r = r.join(('structure', name, n_bytes, per_posting(n_bytes)))
+    r = r.join(('structure', 'total', total, per_posting(total)))
+    for name, current, peak in phase_tracker.phases:
+        r = r.join(('phase current', name, current, per_posting(current)))
+        r = r.join(('phase peak', name, peak, per_posting(peak)))
+    return r
+
+
+class Test(unittest.TestCase):
+    def test_make_report(self):
+        x = AccountingSystem.empty()
+        tracker = PhaseTracker()
+        with tracker.phase('join'):
+            x = x.join(AccountDeclaration(category='Asset', name='cash'))
+            for i in range(10):
+                x = x.join(AccountDeclaration(category='Revenue', name=f'revenue {i}'))
+                x = x.join(JournalEntry(
+                    date=datetime.date(2025, 1, 1),
+                    amount=Amount(dollars=i, cents=0),
+                    debit_account='cash',
+                    credit_account=f'revenue {i}',
+                    description=f'entry {i}',
+                    source='',
+                    source_location=''))
+        tracker.stop()
+        self.assertEqual(20, count_postings(x))
+        sizes = dict(structure_sizes(x))
+        self.assertTrue(sizes['ledgers'] > sizes['category_for'] > 0)
+        self.assertTrue(sizes['strings'] > 0)
+        self.assertTrue(sizes['ledger hashes'] > 0 and sizes['rollup'] > 0)
+        self.assertEqual(1, len(tracker.phases))
+        name, current, peak = tracker.phases[0]
+        self.assertTrue(peak >= current > 0)
+        rows = make_report(x, tracker).cast('tuple(tuple)')
+        self.assertEqual(1 + 1 + len(sizes) + 1 + 2, len(rows))
+
+    def test_walk_counts_shared_objects_once(self):
+        shared = [1, 2, 3]
+        w = MemoryWalk()
+        once = w.walk(shared)
+        self.assertEqual(0, w.walk([shared, shared]) - sys.getsizeof([shared, shared]))
+        self.assertTrue(once > 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,20 +1,24 @@
 # parse input file lines into acount declarations and journal entries
 
+import collections
+import concurrent.futures
 import copy
 import csv
 import dataclasses
 import datetime
 import io
+import itertools
 import unittest
 
 from dataclasses import dataclass
-from typing import List, Self, Union
+from typing import Iterable, List, Self, Union
 
-from accountdeclaration import AccountDeclaration
+from accountdeclaration import AccountDeclaration, account_separator
 from amount import Amount
 from journalentry import JournalEntry
 from line import Line
 
+import tokencache as tc
 import utility as u
 
 @dataclass(frozen=True)
@@ -45,6 +49,9 @@ class DateComponents:
         return dataclasses.replace(self, **kwargs)
 
 def make_amount(s: str) -> Amount:
+    return tc.cached(_make_amount, s)
+
+def _make_amount(s: str) -> Amount:
     splits = u.split_and_strip(s, ".")
     if len(splits) == 1: # ex: 123
         dollars = u.safe_cast(splits[0], int)
@@ -61,16 +68,40 @@ def make_amount(s: str) -> Amount:
         return Amount(dollars=dollars, cents=cents)
     raise ValueError(f's {s} is not like 123.45 (specifying dollars and cents)')
 
+def _make_date(s: str) -> datetime.date:
+    return datetime.date(int(s[0:4]), int(s[4:6]), int(s[6:8]))
+
+# Return the date for a YYYYMMDD string, or None for the abbreviated forms MMDD, DD and the empty string
+def make_date(s: str) -> Union[datetime.date, None]:
+    if len(s) == 8: return tc.cached(_make_date, s)
+    if len(s) == 4:
+        int(s[0:2]), int(s[2:4])  # check the abbreviation now, as DateComponents.from_string does
+        return None
+    if len(s) == 2:
+        int(s)
+        return None
+    if len(s) == 0: return None
+    raise ValueError(f'date {s} is not of form YYYYMMDD or MMDD or DD')
+
+# Return the date for an abbreviated date string, taking the missing components from the previous date
+def fill_date(s: str, previous: datetime.date) -> datetime.date:
+    if len(s) == 4: return datetime.date(previous.year, int(s[0:2]), int(s[2:4]))
+    if len(s) == 2: return datetime.date(previous.year, previous.month, int(s))
+    assert len(s) == 0
+    return previous
+
+# A sub-account is declared with its groups, as in Expense: Utilities: Electric, and is named Utilities:Electric
 def parse_account_declaration(s: str) -> AccountDeclaration:
     first_part, _, _ = s.partition('#')
     splits = u.split_and_strip(first_part, splitter=':')
-    if len(splits) == 2: return AccountDeclaration(category=splits[0], name=splits[1])
+    if len(splits) >= 2 and all(len(split) > 0 for split in splits[1:]):
+        return AccountDeclaration(category=splits[0], name=account_separator.join(splits[1:]))
     raise ValueError(f'account declaration not like Asset:cash; found: {s}')
 
 def make_journal_entry(splits: List[str]) -> JournalEntry:
     assert len(splits) == 5
     return JournalEntry(
-        date=datetime.date.fromisoformat(splits[0]),
+        date=tc.cached(datetime.date.fromisoformat, splits[0]),
         amount=make_amount(splits[1]),
         debit_account=splits[2],
         credit_account=splits[3],
@@ -83,49 +114,151 @@ def make_journal_entry(splits: List[str]) -> JournalEntry:
     new_splits.append('')
     return make_journal_entry(new_splits)
 
-def parse(line: Line, last_journal_entry: Union[JournalEntry, None]) -> Union[AccountDeclaration, JournalEntry]:
-    def complete(je: JournalEntry) -> JournalEntry:
-        return dataclasses.replace(je, source=line.source, source_location=line.source_location)
+# Return a journal line for a journal entry that needs nothing from the lines before it
+# The description must not be empty, as an empty description is filled in from the previous journal entry.
+def render_journal_entry(je: JournalEntry) -> str:
+    assert len(je.description) > 0
+    with io.StringIO(newline='') as f:
+        writer = csv.writer(f, lineterminator='')
+        writer.writerow((je.date.strftime('%Y%m%d'), f'{je.amount}', je.debit_account, je.credit_account, je.description))
+        return f.getvalue()
+
+# Return True if a stripped line holds neither an account declaration nor a journal entry
+def skip(line: str) -> bool:
+    if line.startswith('#'): return True
+    if line.isspace(): return True
+    if len(line) == 0: return True
+    return False
+
+# A journal entry line parsed without reference to the previous journal entry
+# Blank account and description columns are None. The date is None when date_s is abbreviated; the amount is
+# None when amount_s is blank or when it follows an abbreviated date, so that resolve reports errors in line order.
+@dataclass(frozen=True)
+class PartialJournalEntry:
+    date: Union[datetime.date, None]
+    date_s: str
+    amount: Union[Amount, None]
+    amount_s: str
+    debit_account: Union[str, None]
+    credit_account: Union[str, None]
+    description: Union[str, None]
+    source: str
+    source_location: str
+
+def parse_partial(line: Line) -> Union[AccountDeclaration, PartialJournalEntry]:
     splits = u._cast_liststr_csvline(line.text)  # allow quoting and other CSV file layout conventions
-    if len(splits) == 1: 
+    if len(splits) == 1:
         return parse_account_declaration(line.text)
-    else:
-        while len(splits) < 5:
-            splits.append('')
-        date_s, amount_s, debit_account_s, credit_account_s, description_s = splits
-        date_components = DateComponents.from_string(date_s)
-        if not date_components.is_complete():
-            if last_journal_entry is None:
-                raise ValueError(f'invalid date {date_s}')
-            def fill(x, y): return y if x is None else x
-            date_components = dataclasses.replace(
-                date_components,
-                year=fill(date_components.year, last_journal_entry.date.year),
-                month=fill(date_components.month, last_journal_entry.date.month),
-                day=fill(date_components.day, last_journal_entry.date.day)
-            )
-        date = date_components.to_date()
+    while len(splits) < 5:
+        splits.append('')
+    date_s, amount_s, debit_account_s, credit_account_s, description_s = splits
+    date = make_date(date_s)
+    def blank_to_none(x): return None if len(x) == 0 else x
+    return PartialJournalEntry(
+        date=date,
+        date_s=date_s,
+        amount=make_amount(amount_s) if date is not None and len(amount_s) > 0 else None,
+        amount_s=amount_s,
+        debit_account=blank_to_none(debit_account_s),
+        credit_account=blank_to_none(credit_account_s),
+        description=blank_to_none(description_s),
+        source=line.source,
+        source_location=line.source_location
+    )
 
+# Fill the blank columns of a partial journal entry from the previous journal entry
+def resolve(partial: PartialJournalEntry, last_journal_entry: Union[JournalEntry, None]) -> JournalEntry:
+    date = partial.date
+    if date is None:
         if last_journal_entry is None:
-            return JournalEntry(
-                date=date,
-                amount=make_amount(amount_s),
-                debit_account=debit_account_s,
-                credit_account=credit_account_s,
-                description=description_s,
-                source=line.source,
-                source_location=line.source_location
-            )
-        else:
-            return JournalEntry(
-                date=date,
-                amount=make_amount(amount_s) if len(amount_s) > 0 else last_journal_entry.amount,
-                debit_account=debit_account_s if len(debit_account_s) > 0 else last_journal_entry.debit_account,
-                credit_account=credit_account_s if len(credit_account_s) > 0 else last_journal_entry.credit_account,
-                description=description_s if len(description_s) >0 else last_journal_entry.description,
-                source=line.source,
-                source_location=line.source_location
-            )
+            raise ValueError(f'invalid date {partial.date_s}')
+        date = fill_date(partial.date_s, last_journal_entry.date)
+    amount = partial.amount
+    if amount is None and (len(partial.amount_s) > 0 or last_journal_entry is None):
+        amount = make_amount(partial.amount_s)
+
+    if last_journal_entry is None:
+        def or_blank(x): return '' if x is None else x
+        return JournalEntry(
+            date=date,
+            amount=amount,
+            debit_account=or_blank(partial.debit_account),
+            credit_account=or_blank(partial.credit_account),
+            description=or_blank(partial.description),
+            source=partial.source,
+            source_location=partial.source_location
+        )
+    else:
+        def fill(x, y): return y if x is None else x
+        return JournalEntry(
+            date=date,
+            amount=fill(amount, last_journal_entry.amount),
+            debit_account=fill(partial.debit_account, last_journal_entry.debit_account),
+            credit_account=fill(partial.credit_account, last_journal_entry.credit_account),
+            description=fill(partial.description, last_journal_entry.description),
+            source=partial.source,
+            source_location=partial.source_location
+        )
+
+def parse(line: Line, last_journal_entry: Union[JournalEntry, None]) -> Union[AccountDeclaration, JournalEntry]:
+    partial = parse_partial(line)
+    if isinstance(partial, AccountDeclaration): return partial
+    return resolve(partial, last_journal_entry)
+
+# Phase one of yield_parsed, run in a worker process
+# Return for each line None (a skipped line), an AccountDeclaration, a PartialJournalEntry, or the exception raised by parsing it.
+def _parse_chunk(source: str, first_line_index: int, texts: List[str]) -> List:
+    r = []
+    for line_index, text in enumerate(texts, start=first_line_index):
+        line = text.strip()
+        if skip(line):
+            r.append(None)
+            continue
+        try:
+            r.append(parse_partial(Line(line, source=source, source_location=f'line {line_index+1}')))
+        except Exception as e:
+            r.append(e)
+    return r
+
+# Yield (line_index, text, command) for each text line of a source; command is None for comment and blank lines
+# The lines are read and parsed chunk_lines at a time, so texts can be a stream. With n_workers > 1, the chunks are
+# parsed in worker processes and the columns carried forward from the previous journal entry are filled in here, in
+# line order. The commands and any exception raised are the same as when parsing serially.
+def yield_parsed(texts: Iterable[str], source: str, n_workers: int = 1, chunk_lines: int = 100_000):
+    last_journal_entry = None
+    def fix_up(first_line_index, chunk, results):
+        nonlocal last_journal_entry
+        for i, result in enumerate(results):
+            if isinstance(result, Exception): raise result
+            if isinstance(result, PartialJournalEntry):
+                result = resolve(result, last_journal_entry)
+                last_journal_entry = result
+            yield first_line_index + i, chunk[i], result
+    lines = iter(texts)
+    next_start = 0
+    def next_chunk():
+        nonlocal next_start
+        start = next_start
+        chunk = list(itertools.islice(lines, chunk_lines))
+        next_start += len(chunk)
+        return start, chunk
+    if n_workers <= 1:
+        while True:
+            start, chunk = next_chunk()
+            if len(chunk) == 0: return
+            yield from fix_up(start, chunk, _parse_chunk(source, start, chunk))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=n_workers) as executor:
+        pending = collections.deque()  # at most 2 * n_workers chunks are in flight
+        def submit():
+            start, chunk = next_chunk()
+            if len(chunk) > 0:
+                pending.append((start, chunk, executor.submit(_parse_chunk, source, start, chunk)))
+        for _ in range(2 * n_workers):
+            submit()
+        while len(pending) > 0:
+            start, chunk, future = pending.popleft()
+            submit()
+            yield from fix_up(start, chunk, future.result())
 
 class Test(unittest.TestCase):
     def test_parse_account_declaration_line(self):
@@ -138,9 +271,27 @@ class Test(unittest.TestCase):
         for line in tests:
             actual = parse_account_declaration(line)
             self.assertEqual(expected, actual)
+        expected = AccountDeclaration(category='Expense', name='Utilities:Electric')
+        self.assertEqual(expected, parse_account_declaration('Expense: Utilities : Electric # the power company'))
+        for line in ('Expense:', 'Expense: Utilities:', 'Expense::Electric'):
+            with self.assertRaises(ValueError):
+                parse_account_declaration(line)
 
 
 
+    def test_render_journal_entry(self):
+        je = JournalEntry(
+            date=datetime.date(2025, 1, 5),
+            amount=Amount(dollars=12, cents=5),
+            debit_account='Utilities:Electric',
+            credit_account='cash',
+            description='bill, "january"',
+            source='',
+            source_location='')
+        line = render_journal_entry(je)
+        self.assertEqual('20250105,12.05,Utilities:Electric,cash,"bill, ""january"""', line)
+        self.assertEqual(je, parse(Line(line), None))
+
     def test_parse_journal_entry_line(self):
         expected = JournalEntry(
             date=datetime.date(2025,12,25),
@@ -175,6 +326,62 @@ class Test(unittest.TestCase):
             self.assertEqual(expected.source, r.source)
             self.assertEqual(expected.source_location, r.source_location)
 
+    def test_make_date(self):
+        previous = datetime.date(2025, 12, 25)
+        tests = (
+            ('20240229', datetime.date(2024, 2, 29)),
+            ('0101', datetime.date(2025, 1, 1)),
+            ('31', datetime.date(2025, 12, 31)),
+            ('', previous),
+        )
+        for s, expected in tests:
+            date = make_date(s)
+            self.assertEqual(expected, fill_date(s, previous) if date is None else date)
+            if len(s) > 0:
+                components = DateComponents.from_string(s)
+                def fill(x, y): return y if x is None else x
+                self.assertEqual(expected, datetime.date(
+                    fill(components.year, previous.year),
+                    fill(components.month, previous.month),
+                    fill(components.day, previous.day)))
+        for s in ('2025010', '0x', 'abcd'):
+            with self.assertRaises(ValueError):
+                make_date(s)
+
+
+    def test_yield_parsed(self):
+        texts = [
+            '# chart of accounts',
+            'Asset: cash',
+            'Equity: owners equity',
+            '',
+            '20250101, 100, cash, owners equity, first',
+            '02, 50',
+            '0301, , , , march',
+            ',25.50',
+            '# a comment inside the entries',
+            '20251231, 1, owners equity, cash',
+            ',,',
+            '05,',
+        ]
+        serial = list(yield_parsed(texts, source='source'))
+        for chunk_lines in (1, 2, 3, 5, 100):
+            self.assertEqual(serial, list(yield_parsed(iter(texts), source='source', chunk_lines=chunk_lines)))
+            parallel = list(yield_parsed(iter(texts), source='source', n_workers=2, chunk_lines=chunk_lines))
+            self.assertEqual(serial, parallel)
+        last = None
+        for line_index, text, command in serial:
+            if command is None: continue
+            expected = parse(Line(text.strip(), source='source', source_location=f'line {line_index+1}'), last)
+            self.assertEqual(expected, command)
+            if isinstance(command, JournalEntry): last = command
+
+    def test_yield_parsed_errors(self):
+        # the first error in line order is raised, even when a later chunk failed first
+        texts = ['Asset: cash', '05, 100, cash, cash', '20250101, x']
+        for n_workers in (1, 2):
+            with self.assertRaisesRegex(ValueError, 'invalid date 05'):
+                list(yield_parsed(texts, source='source', n_workers=n_workers, chunk_lines=1))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,226 @@
+# Run the stages of a computation in threads connected by bounded queues, measuring how full the queues get and how
+# long each side waits
+# Each stage iterates its items, usually made from the items of the stage before it, in its own thread and puts them
+# into its queue; the last queue is read by the caller. A stage blocks when its queue is full, so at most maxsize items
+# are in flight between two stages, and throughput is set by the slowest stage. A producer that often waits on a full
+# queue is ahead of its consumer; a consumer that often waits on an empty queue is ahead of its producer.
+# An exception in a stage is raised by the consumer of the stage after the items put before it.
+# A consumer that must act on time while no items arrive, as a stream that flushes its summaries at intervals, reads
+# the last queue with a deadline, and is handed idle when the deadline passes before an item.
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, List, Union
+
+import queue
+import threading
+import time
+import unittest
+
+_end = object()
+idle = object()  # yielded by Pipeline.items when its deadline passes with no item
+
+@dataclass(frozen=True)
+class _Failed:
+    exception: BaseException
+
+class Cancelled(Exception):
+    pass
+
+@dataclass(frozen=True)
+class QueueMetrics:
+    name: str
+    maxsize: int
+    n_items: int
+    max_depth: int
+    mean_depth: float           # the depth seen by each put, averaged
+    put_wait_seconds: float     # the producer waiting on a full queue
+    get_wait_seconds: float     # the consumer waiting on an empty queue
+
+class MeteredQueue:
+    def __init__(self, name: str, maxsize: int, cancelled: threading.Event):
+        assert maxsize > 0
+        self.name = name
+        self._queue = queue.Queue(maxsize)
+        self._cancelled = cancelled
+        self._n_items = 0
+        self._max_depth = 0
+        self._depth_total = 0
+        self._put_wait_seconds = 0.0
+        self._get_wait_seconds = 0.0
+
+    def put(self, item: Any) -> None:
+        if self._cancelled.is_set(): raise Cancelled()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            start = time.perf_counter()
+            while True:
+                if self._cancelled.is_set(): raise Cancelled()
+                try:
+                    self._queue.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+            self._put_wait_seconds += time.perf_counter() - start
+        depth = self._queue.qsize()
+        self._n_items += 1
+        self._depth_total += depth
+        if depth > self._max_depth: self._max_depth = depth
+
+    # Return the next item, raising queue.Empty if deadline, a time.monotonic() time, passes first
+    def get(self, deadline: Union[float, None] = None) -> Any:
+        try:
+            return self._queue.get_nowait()
+        except queue.Empty:
+            start = time.perf_counter()
+            try:
+                while True:
+                    if self._cancelled.is_set(): raise Cancelled()
+                    timeout = 0.1 if deadline is None else min(0.1, deadline - time.monotonic())
+                    if timeout <= 0: raise queue.Empty()
+                    try:
+                        return self._queue.get(timeout=timeout)
+                    except queue.Empty:
+                        pass
+            finally:
+                self._get_wait_seconds += time.perf_counter() - start
+
+    # Discard the items in the queue, so that a producer blocked on it can see that it is cancelled
+    def discard(self) -> None:
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def metrics(self) -> QueueMetrics:
+        n_items = max(0, self._n_items - 1)  # not counting the end of the items
+        return QueueMetrics(
+            name=self.name,
+            maxsize=self._queue.maxsize,
+            n_items=n_items,
+            max_depth=self._max_depth,
+            mean_depth=0.0 if self._n_items == 0 else self._depth_total / self._n_items,
+            put_wait_seconds=self._put_wait_seconds,
+            get_wait_seconds=self._get_wait_seconds)
+
+class Pipeline:
+    def __init__(self):
+        self.queues: List[MeteredQueue] = []
+        self._threads: List[threading.Thread] = []
+        self._cancelled = threading.Event()
+
+    def __enter__(self) -> 'Pipeline':
+        return self
+
+    # A pipeline left early, as by an exception in the caller, cancels its stages
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.cancel()
+        for thread in self._threads:
+            thread.join()
+
+    # Cancel the stages without waiting for them, as when a stage may be blocked reading a stream that is still open;
+    # each stops at its next put
+    def cancel(self) -> None:
+        self._cancelled.set()
+        for q in self.queues:
+            q.discard()
+
+    # Start a stage that puts the items into a new queue of at most maxsize items, and return the queue
+    def stage(self, name: str, items: Iterable, maxsize: int) -> MeteredQueue:
+        q = MeteredQueue(name, maxsize, self._cancelled)
+        def run():
+            try:
+                for item in items:
+                    q.put(item)
+                q.put(_end)
+            except Cancelled:
+                pass
+            except BaseException as e:
+                try:
+                    q.put(_Failed(e))
+                except Cancelled:
+                    pass
+        thread = threading.Thread(target=run, name=f'pipeline-{name}', daemon=True)
+        self.queues.append(q)
+        self._threads.append(thread)
+        thread.start()
+        return q
+
+    # Yield the items of a stage's queue, raising the stage's exception if it failed
+    # With until, a function returning a time.monotonic() deadline, idle is yielded each time the deadline it returns
+    # passes before an item arrives; it is called again before each wait.
+    def items(self, q: MeteredQueue, until: Union[Callable[[], float], None] = None):
+        while True:
+            try:
+                item = q.get(None if until is None else until())
+            except queue.Empty:
+                yield idle
+                continue
+            if item is _end: return
+            if isinstance(item, _Failed): raise item.exception
+            yield item
+
+    def metrics(self) -> List[QueueMetrics]:
+        return [q.metrics() for q in self.queues]
+
+
+class Test(unittest.TestCase):
+    def test_pipeline(self):
+        with Pipeline() as pipeline:
+            numbers = pipeline.stage('numbers', range(100), maxsize=4)
+            squares = pipeline.stage('squares', (x * x for x in pipeline.items(numbers)), maxsize=2)
+            self.assertEqual([x * x for x in range(100)], list(pipeline.items(squares)))
+        metrics = {x.name: x for x in pipeline.metrics()}
+        self.assertEqual(100, metrics['numbers'].n_items)
+        self.assertTrue(1 <= metrics['squares'].max_depth <= 2)
+
+    def test_slow_consumer_stalls_producer(self):
+        with Pipeline() as pipeline:
+            numbers = pipeline.stage('numbers', range(10), maxsize=1)
+            for _ in pipeline.items(numbers):
+                time.sleep(0.01)
+        self.assertGreater(pipeline.metrics()[0].put_wait_seconds, 0.02)
+
+    def test_errors(self):
+        def fail_at_3():
+            for x in range(10):
+                if x == 3: raise ValueError('bad item')
+                yield x
+        with Pipeline() as pipeline:
+            numbers = pipeline.stage('numbers', fail_at_3(), maxsize=2)
+            doubled = pipeline.stage('doubled', (2 * x for x in pipeline.items(numbers)), maxsize=2)
+            seen = []
+            with self.assertRaisesRegex(ValueError, 'bad item'):
+                for x in pipeline.items(doubled):
+                    seen.append(x)
+            self.assertEqual([0, 2, 4], seen)
+
+    def test_deadline(self):
+        def late():
+            time.sleep(0.3)
+            yield 'late'
+        with Pipeline() as pipeline:
+            items = pipeline.stage('late', late(), maxsize=1)
+            deadlines = []
+            def until():
+                deadlines.append(time.monotonic() + 0.05)
+                return deadlines[-1]
+            seen = list(pipeline.items(items, until=until))
+        self.assertEqual('late', seen[-1])
+        self.assertTrue(len(seen) > 2 and all(x is idle for x in seen[:-1]))
+
+    def test_leaving_early_cancels_the_stages(self):
+        with self.assertRaises(KeyError):
+            with Pipeline() as pipeline:
+                def slowly():
+                    for x in range(1_000_000):
+                        time.sleep(0.001)
+                        yield x
+                numbers = pipeline.stage('numbers', slowly(), maxsize=2)
+                doubled = pipeline.stage('doubled', (2 * x for x in pipeline.items(numbers)), maxsize=2)
+                next(pipeline.items(doubled))
+                raise KeyError('the consumer fails')
+        self.assertFalse(any(thread.is_alive() for thread in pipeline._threads))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,238 @@
+# Reconcile a bank statement against the ledger of one account
+# usage: python3 reconcile.py BANK-FILE [--account Cash] [--tolerance-days 3] [--directory .] [--no-header]
+# The bank file is a CSV file with the columns date, amount, description. Dates are YYYY-MM-DD or YYYYMMDD; amounts
+# are signed, positive for deposits (debits to the account) and negative for withdrawals.
+# Write these files to the directory:
+#  _reconcile-matched.csv
+#  _reconcile-unmatched-ledger.csv
+#  _reconcile-unmatched-bank.csv
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+import argparse
+import bisect
+import datetime
+import importlib
+import os
+import random
+import unittest
+
+from alignedcsv import AlignedCSV
+from amount import Amount, parse_cents
+from balance import Balance
+from ledgerentry import LedgerEntry
+
+import tokencache as tc
+import utility as u
+
+@dataclass(frozen=True)
+class BankRow:
+    date: datetime.date
+    cents: int
+    description: str
+    source_location: str
+
+def read_bank_file(path: str, header: bool = True) -> List[BankRow]:
+    r = []
+    with u.open_text(path) as f:
+        for line_index, line in enumerate(f):
+            if header and line_index == 0: continue
+            line = line.strip()
+            if len(line) == 0 or line.startswith('#'): continue
+            fields = u.split_csvline(line)
+            if len(fields) < 2: raise ValueError(f'{path} line {line_index+1}: expected date, amount, description')
+            r.append(BankRow(
+                date=tc.cached(datetime.date.fromisoformat, fields[0]),
+                cents=parse_cents(fields[1]),
+                description=fields[2] if len(fields) > 2 else '',
+                source_location=f'line {line_index+1}'))
+    return r
+
+# The ledger entries with one signed cents, as (date ordinal, ledger entry index) in order, some of them consumed
+# Consuming an entry leaves it in place, and the unconsumed entry nearest a position in either direction is found by
+# following links past consumed entries, with the paths compressed as they are followed, so that recurring entries
+# with the same amount cost nearly constant time each rather than a removal from the middle of a list.
+class Bucket:
+    def __init__(self, entries: List[Tuple[int, int]]):
+        self.entries = sorted(entries)
+        self._next = list(range(len(self.entries) + 1))      # toward the first unconsumed position at or after
+        self._previous = list(range(len(self.entries) + 1))  # toward the last unconsumed position at or before, plus 1
+
+    # Return the first unconsumed position at or after position, or len(entries) if there is none
+    def next_unconsumed(self, position: int) -> int:
+        return _find(self._next, position)
+
+    # Return the last unconsumed position at or before position, or -1 if there is none
+    def previous_unconsumed(self, position: int) -> int:
+        return _find(self._previous, position + 1) - 1
+
+    def consume(self, position: int) -> None:
+        self._next[position] = position + 1
+        self._previous[position + 1] = position
+
+    def unconsumed(self) -> List[Tuple[int, int]]:
+        return [entry for position, entry in enumerate(self.entries) if self._next[position] == position]
+
+# Return the root that the links from i lead to, pointing each link on the way directly at it
+def _find(links: List[int], i: int) -> int:
+    root = i
+    while links[root] != root:
+        root = links[root]
+    while links[i] != root:
+        links[i], i = root, links[i]
+    return root
+
+# Match each bank row to an unmatched ledger entry with the same signed cents, dated within tolerance_days of it
+# Among the candidates, the one closest in date wins, then the earliest in the ledger, and the earlier date if two are
+# as close. The ledger entries are indexed by signed cents, and each index bucket is sorted by date, so a bank row
+# costs a dictionary lookup, binary searches and finding the unconsumed entries nearest its date in the bucket.
+# Return matched (bank row, ledger entry) pairs, the unmatched ledger entries and the unmatched bank rows.
+def reconcile(
+        ledger_entries: List[LedgerEntry],
+        bank_rows: List[BankRow],
+        tolerance_days: int) -> Tuple[List[Tuple[BankRow, LedgerEntry]], List[LedgerEntry], List[BankRow]]:
+    entries_for: Dict[int, List[Tuple[int, int]]] = {}  # signed cents: [(date ordinal, ledger entry index)]
+    for i, ledger_entry in enumerate(ledger_entries):
+        entries_for.setdefault(ledger_entry.balance.signed_cents(), []).append((ledger_entry.date.toordinal(), i))
+    index = {cents: Bucket(entries) for cents, entries in entries_for.items()}
+    matched = []
+    unmatched_bank = []
+    for bank_row in sorted(bank_rows, key=lambda x: x.date):
+        bucket = index.get(bank_row.cents, None)
+        ordinal = bank_row.date.toordinal()
+        best = None
+        if bucket is not None:
+            entries = bucket.entries
+            lo = bisect.bisect_left(entries, (ordinal - tolerance_days, -1))
+            hi = bisect.bisect_right(entries, (ordinal + tolerance_days, len(ledger_entries)))
+            at = bisect.bisect_left(entries, (ordinal, -1))
+            after = bucket.next_unconsumed(at)  # the earliest in the ledger of the nearest date on or after the row's
+            if after < hi: best = after
+            before = bucket.previous_unconsumed(at - 1)
+            if before >= lo:
+                before = bucket.next_unconsumed(bisect.bisect_left(entries, (entries[before][0], -1)))  # the earliest of its date
+                if best is None or ordinal - entries[before][0] <= entries[best][0] - ordinal:
+                    best = before
+        if best is None:
+            unmatched_bank.append(bank_row)
+        else:
+            bucket.consume(best)
+            matched.append((bank_row, ledger_entries[bucket.entries[best][1]]))
+    unmatched_ledger_indices = sorted(i for bucket in index.values() for _, i in bucket.unconsumed())
+    return matched, [ledger_entries[i] for i in unmatched_ledger_indices], unmatched_bank
+
+def render_bank_cents(cents: int) -> str:
+    return f'-{Amount.from_cents(-cents)}' if cents < 0 else f'{Amount.from_cents(cents)}'
+
+def write_reconciliation(
+        directory: str,
+        matched: List[Tuple[BankRow, LedgerEntry]],
+        unmatched_ledger: List[LedgerEntry],
+        unmatched_bank: List[BankRow]) -> None:
+    sac_pgm = importlib.import_module('sac-pgm')
+    def make_path(topic: str) -> str: return os.path.join(directory, f'_reconcile-{topic}.csv')
+
+    r = AlignedCSV(alignments=('left', 'right', 'left', 'left', 'left', 'left', 'left', 'right'))
+    r = r.join(('bank date', 'amount', 'bank description', 'bank location', 'ledger date', 'ledger description', 'source', 'days apart'))
+    for bank_row, ledger_entry in matched:
+        r = r.join((
+            bank_row.date, render_bank_cents(bank_row.cents), bank_row.description, bank_row.source_location,
+            ledger_entry.date, ledger_entry.description, f'{ledger_entry.source} {ledger_entry.source_location}',
+            (ledger_entry.date - bank_row.date).days))
+    sac_pgm.write_csv_from_AlignedCSV(make_path('matched'), r)
+
+    r = AlignedCSV(alignments=('left', 'right', 'right', 'left', 'left', 'left'))
+    r = r.join(('date', 'debit', 'credit', 'description', 'source', 'source_location'))
+    for ledger_entry in unmatched_ledger:
+        amount = f'{ledger_entry.balance.amount}'
+        debit, credit = (amount, '') if ledger_entry.balance.side == 'debit' else ('', amount)
+        r = r.join((ledger_entry.date, debit, credit, ledger_entry.description, ledger_entry.source, ledger_entry.source_location))
+    sac_pgm.write_csv_from_AlignedCSV(make_path('unmatched-ledger'), r)
+
+    r = AlignedCSV(alignments=('left', 'right', 'left', 'left'))
+    r = r.join(('date', 'amount', 'description', 'location'))
+    for bank_row in unmatched_bank:
+        r = r.join((bank_row.date, render_bank_cents(bank_row.cents), bank_row.description, bank_row.source_location))
+    sac_pgm.write_csv_from_AlignedCSV(make_path('unmatched-bank'), r)
+
+def main():
+    parser = argparse.ArgumentParser(description='reconcile a bank statement against an account ledger')
+    parser.add_argument('bank_file')
+    parser.add_argument('--account', default='Cash')
+    parser.add_argument('--tolerance-days', type=int, default=3)
+    parser.add_argument('--directory', default='.')
+    parser.add_argument('--no-header', action='store_true', help='the bank file has no header line')
+    args = parser.parse_args()
+    sac_pgm = importlib.import_module('sac-pgm')
+    accounting_system = sac_pgm.load_files(args.directory)
+    if args.account not in accounting_system.category_for:
+        raise SystemExit(f'account {args.account} not previously defined')
+    bank_rows = read_bank_file(args.bank_file, header=not args.no_header)
+    matched, unmatched_ledger, unmatched_bank = reconcile(
+        accounting_system.ledgers.get(args.account, []), bank_rows, args.tolerance_days)
+    write_reconciliation(args.directory, matched, unmatched_ledger, unmatched_bank)
+    print(f'{len(matched)} matched, {len(unmatched_ledger)} unmatched ledger entries, {len(unmatched_bank)} unmatched bank rows')
+
+
+class Test(unittest.TestCase):
+    def test_reconcile(self):
+        def le(day, side, cents, description):
+            return LedgerEntry(
+                date=datetime.date(2025, 1, day),
+                balance=Balance(side=side, amount=Amount.from_cents(cents)),
+                description=description,
+                source='book.txt',
+                source_location=f'line {day}')
+        def br(day, cents):
+            return BankRow(date=datetime.date(2025, 1, day), cents=cents, description='', source_location='')
+        ledger_entries = [
+            le(1, 'debit', 10000, 'deposit'),
+            le(5, 'credit', 2500, 'groceries'),
+            le(9, 'credit', 2500, 'groceries again'),
+            le(20, 'credit', 999, 'not on the statement'),
+        ]
+        bank_rows = [
+            br(2, 10000),   # one day after the deposit
+            br(10, -2500),  # closer to the second groceries entry
+            br(6, -2500),
+            br(15, -4200),  # not in the ledger
+            br(30, 10000),  # too far from the deposit, which is matched anyway
+        ]
+        matched, unmatched_ledger, unmatched_bank = reconcile(ledger_entries, bank_rows, tolerance_days=3)
+        pairs = {(bank_row.date.day, ledger_entry.description) for bank_row, ledger_entry in matched}
+        self.assertEqual({(2, 'deposit'), (6, 'groceries'), (10, 'groceries again')}, pairs)
+        self.assertEqual(['not on the statement'], [x.description for x in unmatched_ledger])
+        self.assertEqual([15, 30], [x.date.day for x in unmatched_bank])
+
+    def test_recurring_amounts(self):
+        # the same few amounts over and over, matched as a scan of every candidate in the window would match them
+        rng = random.Random(1)
+        def day(n):
+            return datetime.date(2025, 1, 1) + datetime.timedelta(days=n)
+        ledger_entries = [
+            LedgerEntry(
+                date=day(rng.randrange(60)),
+                balance=Balance(side='credit', amount=Amount.from_cents(rng.choice((1500, 2500)))),
+                description=f'entry {i}',
+                source='book.txt',
+                source_location=f'line {i+1}')
+            for i in range(600)]
+        bank_rows = [BankRow(date=day(rng.randrange(60)), cents=-rng.choice((1500, 2500, 999)), description='', source_location='') for _ in range(700)]
+        def scan(ledger_entries, bank_rows, tolerance_days):
+            unmatched = list(range(len(ledger_entries)))
+            matched = []
+            for bank_row in sorted(bank_rows, key=lambda x: x.date):
+                candidates = [
+                    (abs((ledger_entries[i].date - bank_row.date).days), ledger_entries[i].date, i) for i in unmatched
+                    if ledger_entries[i].balance.signed_cents() == bank_row.cents and abs((ledger_entries[i].date - bank_row.date).days) <= tolerance_days]
+                if len(candidates) > 0:
+                    i = min(candidates)[2]
+                    unmatched.remove(i)
+                    matched.append((bank_row, ledger_entries[i]))
+            return matched, [ledger_entries[i] for i in unmatched]
+        matched, unmatched_ledger, unmatched_bank = reconcile(ledger_entries, bank_rows, tolerance_days=2)
+        self.assertEqual(scan(ledger_entries, bank_rows, tolerance_days=2), (matched, unmatched_ledger))
+        self.assertEqual(len(bank_rows), len(matched) + len(unmatched_bank))
+
+if __name__ == '__main__':
+    main()
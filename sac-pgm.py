@@ -1,160 +1,721 @@
 # simply accounting system (version 2)
 # Read a directory of text files containing account declarations and journal entries. Skip certain files including those whose name start with "_".
 # Write a directory named _{datetime}-summary containing CSV files that balances, ledgers, an income statement, and a balance sheet.
+# usage: python3 sac-pgm.py [directory] [--duplicates flag|drop] [--pipeline] [--verify]    process the files in the directory (default .)
+#        python3 sac-pgm.py - [--flush-seconds N]   process the lines on stdin, writing the summaries to .
+#        python3 sac-pgm.py add [--directory D] ENTRY...   append journal entries to the directory's log (- reads stdin)
+#        python3 sac-pgm.py close YEAR [--directory D]     close the years through YEAR (see fiscalyears.py)
 from typing import Any, Dict, List, Self, Set, Union
 
+import argparse
 import collections
+import contextlib
 import copy
 import csv
 import dataclasses
 from dataclasses import dataclass
 import datetime
 import io
+import itertools
 import os
+import shutil
+import sys
+import time
 import unittest
 
-from accountdeclaration import AccountDeclaration, allowed_account_categories
-from accountingsystem import AccountingSystem
+from accountdeclaration import AccountDeclaration, account_separator, allowed_account_categories
+from accountingsystem import AccountingSystem, Builder
+from activity import month_str
 from journalentry import JournalEntry
 from ledgerentry import LedgerEntry
 from line import Line
 from alignedcsv import AlignedCSV
+from amount import Amount
+from balance import Balance
+from dedupe import DuplicateIndex
+from writerpool import WriterPool
 
+import columnarledgers
+import fiscalyears
+import memoryreport
 import parse
+import pipeline
+import tokencache as tc
 import utility as u
+import writerpool
+import writeaheadlog
 
 # Yield category, name in canonical order
 def yield_categories_nanes(accounting_system: AccountingSystem):
     map = u.invert_dict(accounting_system.category_for)
-    for account_category in allowed_account_categories:
+    for account_category in ('Asset', 'Liability', 'Equity', 'Revenue', 'Expense'):
         if account_category in map:
-            for account_name in map[account_category]:
+            for account_name in sorted(map[account_category]):
                 yield account_category, account_name
 
-def write_csv_from_AlignedCSV(path: str, aligned_csv: AlignedCSV) -> None:
-    with open(path, 'w', newline='') as f:
+def render_csv_from_AlignedCSV(aligned_csv: AlignedCSV) -> str:
+    with io.StringIO(newline='') as f:
         writer = csv.writer(f)
         for line in aligned_csv.cast('tuple(tuple)'):
             writer.writerow(line)
+        return f.getvalue()
 
-def write_summary_accounts(path: str, accounting_system: AccountingSystem) -> None:
+# Write the file now, or hand it to the pool to write in the background
+def write_csv_from_AlignedCSV(path: str, aligned_csv: AlignedCSV, pool: Union[WriterPool, None] = None) -> None:
+    writerpool.write_text(path, render_csv_from_AlignedCSV(aligned_csv), pool)
+
+def write_summary_accounts(path: str, accounting_system: AccountingSystem, pool: Union[WriterPool, None] = None) -> None:
     r = AlignedCSV(alignments=('left', 'left')).join(('account category', 'account name'))
     for account_category, account_name in yield_categories_nanes(accounting_system):
         r = r.join((account_category, account_name))
-    write_csv_from_AlignedCSV(path, r)
+    write_csv_from_AlignedCSV(path, r, pool)
 
-def write_summary_balances(path: str, accounting_system: AccountingSystem) -> None:
+def write_summary_balances(path: str, accounting_system: AccountingSystem, pool: Union[WriterPool, None] = None) -> None:
     r = AlignedCSV(alignments=('left', 'left', 'right', 'right'))
     r = r.join(('account category', 'account name', 'debit balance', 'credit balance'))
     for account_category, account_name in yield_categories_nanes(accounting_system):
-        ledger_entry = accounting_system.balances[account_name]
-        amount = f'{ledger_entry.amount}'
-        if ledger_entry.side == 'debit':
+        balance = accounting_system.balances.get(account_name, Balance(side='debit', amount=Amount.zero()))
+        amount = f'{balance.amount}'
+        if balance.side == 'debit':
             r = r.join((account_category, account_name, amount, ''))
         else:
             r = r.join((account_category, account_name, '', amount))
-    write_csv_from_AlignedCSV(path, r)
+    write_csv_from_AlignedCSV(path, r, pool)
 
-def write_summary_counts(path: str, counts:collections.Counter) -> None:
+def write_summary_counts(path: str, counts:collections.Counter, pool: Union[WriterPool, None] = None) -> None:
     r = AlignedCSV(alignments=('left', 'right'))
     r = r.join(('line type', 'count'))
     for line_type in sorted(counts.keys()):
         r = r.join((line_type, counts[line_type]))
-    write_csv_from_AlignedCSV(path, r)
+    write_csv_from_AlignedCSV(path, r, pool)
+
+# Write the debits, credits and number of postings of each account in each month in which it has postings
+# The rows come from the activity that AccountingSystem.join keeps, so the ledgers are not read.
+def write_summary_activity(path: str, accounting_system: AccountingSystem, pool: Union[WriterPool, None] = None) -> None:
+    months_for = {}
+    for account_name, year, month in accounting_system.monthly_activity.keys():
+        months_for.setdefault(account_name, []).append((year, month))
+    r = AlignedCSV(alignments=('left', 'left', 'left', 'right', 'right', 'right'))
+    r = r.join(('account category', 'account name', 'month', 'debits', 'credits', 'postings'))
+    for account_category, account_name in yield_categories_nanes(accounting_system):
+        for year, month in sorted(months_for.get(account_name, [])):
+            activity = accounting_system.monthly_activity[(account_name, year, month)]
+            r = r.join((
+                account_category,
+                account_name,
+                month_str((year, month)),
+                f'{Amount.from_cents(activity.debit_cents)}',
+                f'{Amount.from_cents(activity.credit_cents)}',
+                activity.n_postings))
+    write_csv_from_AlignedCSV(path, r, pool)
+
+# Write the balance of each category, group of sub-accounts and account down to max_depth, where a category has depth 1
+def write_summary_rollup(path: str, accounting_system: AccountingSystem, max_depth: Union[int, None] = None, pool: Union[WriterPool, None] = None) -> None:
+    r = AlignedCSV(alignments=('right', 'left', 'left', 'right', 'right'))
+    r = r.join(('depth', 'account category', 'group or account', 'debit balance', 'credit balance'))
+    for node, cents in accounting_system.rollup_rows(max_depth):
+        amount = f'{Amount.from_cents(abs(cents))}'
+        debit, credit = (amount, '') if cents >= 0 else ('', amount)
+        r = r.join((len(node), node[0], account_separator.join(node[1:]), debit, credit))
+    write_csv_from_AlignedCSV(path, r, pool)
+
+# Write the journal entries found to repeat entries in earlier files, whether they were ingested or dropped
+def write_summary_duplicates(path: str, duplicate_index: DuplicateIndex, dropped: bool, pool: Union[WriterPool, None] = None) -> None:
+    r = AlignedCSV(alignments=('left', 'right', 'left', 'left', 'left', 'left', 'left', 'left', 'left'))
+    r = r.join(('date', 'amount', 'debit account', 'credit account', 'description', 'source', 'source_location', 'earlier source', 'action'))
+    for duplicate in duplicate_index.duplicates:
+        je = duplicate.journal_entry
+        r = r.join((
+            f'{je.date}', f'{je.amount}', je.debit_account, je.credit_account, je.description, je.source, je.source_location,
+            duplicate.earlier_source, 'dropped' if dropped else 'flagged'))
+    write_csv_from_AlignedCSV(path, r, pool)
+
+ledger_header = ('date', 'debit', 'credit', 'description', 'source', 'source_location')
 
-def write_summary_ledger(path: str, ledger_entries: List[LedgerEntry]) -> None:
+def ledger_row(ledger_entry: LedgerEntry) -> tuple:
+    date = f'{ledger_entry.date}'
+    amount = f'{ledger_entry.balance.amount}'
+    debit, credit = (amount, '') if ledger_entry.balance.side == 'debit' else ('', amount)
+    return (date, debit, credit, ledger_entry.description, ledger_entry.source, ledger_entry.source_location)
+
+def write_summary_ledger(path: str, ledger_entries: List[LedgerEntry], pool: Union[WriterPool, None] = None) -> None:
     r = AlignedCSV(alignments=('left', 'right', 'right', 'left', 'left', 'left'))
-    r = r.join(('date', 'debit', 'credit', 'description', 'source', 'source_location'))
+    r = r.join(ledger_header)
     for ledger_entry in ledger_entries:
-        date = f'{ledger_entry.date}'
-        amount = f'{ledger_entry.amount}'
-        side = ledger_entry.side
-        description = ledger_entry.description
-        source = ledger_entry.source
-        source_location = ledger_entry.source_location
-        if side == 'debit':
-            r = r.join((date, amount, '', description, source, source_location))
-        else:
-            r = r.join((date, '', amount, description, source, source_location))
-    write_csv_from_AlignedCSV(path, r)
+        r = r.join(ledger_row(ledger_entry))
+    write_csv_from_AlignedCSV(path, r, pool)
 
-def write_summary_ledgers(directory: str, filename: str, accounting_system: AccountingSystem) -> None:
+def write_summary_ledgers(directory: str, filename: str, accounting_system: AccountingSystem, pool: Union[WriterPool, None] = None) -> None:
     for category, name in yield_categories_nanes(accounting_system):
         path = os.path.join(directory, f'_{filename}-ledger-{category}-{name}.csv')
-        write_summary_ledger(path, accounting_system.ledgers[name])
+        write_summary_ledger(path, accounting_system.ledgers.get(name, []), pool)
+
+
+log_filename = '_journal.wal'            # journal entries appended by add, one per line; read after the other files
+snapshot_filename = '_journal.snapshot'  # the accounting system, less its saved ledgers, as of an offset in the log
+ledgers_dirname = '_journal.ledgers'     # the saved ledgers, a file per account that each checkpoint appends to
+snapshot_version = 6  # 2: ledgers in date order, with order-independent ledger hashes; 4: AccountingSystem without a join marker; 5: ledgers saved apart; 6: flushed ledgers marked
+
+# Yield (line_index, line, command) for each line in a file; command is None for comment and blank lines
+# Compressed files are decompressed as they are read. With n_workers > 1, the lines are parsed in chunks by that many
+# worker processes. A partial last line of the log, left by a crash, is not read.
+def yield_commands(directory: str, filename: str, n_workers: int = 1):
+    yield from parse.yield_parsed(yield_file_lines(directory, filename), source=filename, n_workers=n_workers)
+
+def yield_file_lines(directory: str, filename: str):
+    with u.open_text(os.path.join(directory, filename)) as file:
+        yield from writeaheadlog.yield_committed_lines(file) if filename == log_filename else u.yield_lines(file)
+
+# Yield (filename, chunk) for the items of a file in chunks of at most chunk_size, then (filename, None)
+def yield_chunks(filename: str, items, chunk_size: int):
+    items = iter(items)
+    while True:
+        chunk = list(itertools.islice(items, chunk_size))
+        if len(chunk) == 0: break
+        yield filename, chunk
+    yield filename, None
 
+# Yield (filename, items) for each file in a stream made by yield_chunks; a file's items are read before the next file
+def yield_files_of_chunks(chunks):
+    chunks = iter(chunks)
+    for filename, chunk in chunks:
+        def items(chunk=chunk):
+            while chunk is not None:
+                yield from chunk
+                _, chunk = next(chunks)
+        yield filename, items()
+
+# Yield (filename, commands) for each file, where commands are as from yield_commands
+# With stages, a pipeline (see pipeline.py), a reader thread reads the files ahead and a parser thread parses them, so
+# that reading, parsing and the joins made by the caller overlap. chunk_lines lines pass between stages at a time.
+def yield_files_to_process(
+        directory: str,
+        filenames: List[str],
+        n_workers: int = 1,
+        stages: Union[pipeline.Pipeline, None] = None,
+        chunk_lines: int = 10_000,
+        queue_chunks: int = 8):
+    if stages is None:
+        for filename in filenames:
+            yield filename, yield_commands(directory, filename, n_workers)
+        return
+    def read():
+        for filename in filenames:
+            yield from yield_chunks(filename, yield_file_lines(directory, filename), chunk_lines)
+    def parse_files(chunks):
+        for filename, lines in yield_files_of_chunks(chunks):
+            yield from yield_chunks(filename, parse.yield_parsed(lines, source=filename, n_workers=n_workers), chunk_lines)
+    read_queue = stages.stage('read', read(), maxsize=queue_chunks)
+    parse_queue = stages.stage('parse', parse_files(stages.items(read_queue)), maxsize=queue_chunks)
+    yield from yield_files_of_chunks(stages.items(parse_queue))
+
+# Yield the names of the files in a directory that contain account declarations and journal entries
+# The log of added entries comes last, if there is one and include_log is set.
+def yield_filenames(directory: str, include_log: bool = True):
+    for objname in sorted(os.listdir(directory)):
+        if objname == log_filename: continue
+        if objname.startswith('.') or objname.startswith('_') or objname.endswith('.py'):
+            print(f'skipping {objname}')
+            continue
+        name = u.strip_compressed_suffix(objname)  # archived journals may be compressed, as in 2019.csv.gz
+        if not (name.endswith('.txt') or name.endswith('.csv')):
+            print(f'skipping {objname}')
+            continue
+        path = os.path.join(directory, objname)
+        if not os.path.isfile(path):
+            print(f'skipping directory {objname}')
+            continue
+        yield objname
+    if include_log and os.path.isfile(os.path.join(directory, log_filename)):
+        yield log_filename
 
 # Process a file, producing these summary files
 #  _{filename}-accounts.csv
 #  _{filename}-counts.csv
 #  _{filename}-balances.csv
 #  _{filename}-ledgers.csv
-def process_file(directory: str, filename: str, accounting_system: AccountingSystem) -> AccountingSystem:
-    def skip(line: str) -> bool:
-        line = line.strip()
-        if line.startswith('#'): return True
-        if line.isspace(): return True
-        if len(line) == 0: return True
-        return False
-    file_accounting_system = AccountingSystem.empty()
+def process_file(
+        directory: str,
+        filename: str,
+        accounting_system: AccountingSystem,
+        n_workers: int = 1,
+        pool: Union[WriterPool, None] = None,
+        closing: Union[fiscalyears.Closing, None] = None,
+        duplicate_index: Union[DuplicateIndex, None] = None,
+        drop_duplicates: bool = False,
+        commands=None) -> AccountingSystem:
+    books = Builder(accounting_system)
+    file_books = Builder()
     counts = collections.Counter()
     print(f'processing file {filename}')
-    path = os.path.join(directory, filename)
-    last_journal_entry = None
-    with open(path, 'r') as file:
-        contents = file.read()
-        for line_index, line in enumerate(contents.split('\n')):
-            print(f'  {line}')
-            counts['lines read'] += 1
-            line = line.strip()
-            if skip(line): continue
-            counts['lines processed'] += 1
-            command = parse.parse(
-                line=Line(line, source=filename, source_location=f'line {line_index+1}'),
-                last_journal_entry=last_journal_entry
-            )
-            file_accounting_system = file_accounting_system.join(command)
-            accounting_system = accounting_system.join(command)
-            if isinstance(command, AccountDeclaration): counts['account declarations'] += 1
-            if isinstance(command, JournalEntry): counts['journal entries'] += 1
-            if isinstance(command, JournalEntry): last_journal_entry = command
-        # write the summaries
-        def make_path(topic: str) -> str: return os.path.join(directory, f'_{filename}-{topic}.csv')
-        write_summary_counts(make_path('counts'), counts=counts)
-        write_summary_accounts(make_path('accounts'), accounting_system=file_accounting_system)
-        write_summary_balances(make_path('balances'), accounting_system=file_accounting_system)
-        write_summary_ledgers(directory=directory, filename=filename, accounting_system=file_accounting_system)
-        return accounting_system
-    
-# process files in a directory
-def process_files(directory='.') -> None:
-    r = AccountingSystem.empty()
-    for objname in sorted(os.listdir(directory)):
-        if objname.startswith('.') or objname.startswith('_') or objname.endswith('.py'):
-            print(f'skipping {objname}')
+    if duplicate_index is not None: duplicate_index.start_file(filename)
+    if commands is None: commands = yield_commands(directory, filename, n_workers)
+    for line_index, line, command in commands:
+        print(f'  {line}')
+        counts['lines read'] += 1
+        if command is None: continue
+        if is_closed(command, closing):
+            counts['journal entries in closed years'] += 1
             continue
-        if not (objname.endswith('.txt') or objname.endswith('.csv')):
-            print('skipping {objname}')
+        if duplicate_index is not None and isinstance(command, JournalEntry) and duplicate_index.check(command) is not None:
+            counts['duplicate journal entries'] += 1
+            if drop_duplicates: continue
+        counts['lines processed'] += 1
+        books.join(command)
+        if isinstance(command, JournalEntry):  # the accounts may be declared in an earlier file, as for the log
+            for account in (command.debit_account, command.credit_account):
+                if account not in file_books.category_for:
+                    file_books.join(AccountDeclaration(category=books.category_for[account], name=account))
+        file_books.join(command)
+        if isinstance(command, AccountDeclaration): counts['account declarations'] += 1
+        if isinstance(command, JournalEntry): counts['journal entries'] += 1
+    if duplicate_index is not None: duplicate_index.end_file()
+    # write the summaries
+    def make_path(topic: str) -> str: return os.path.join(directory, f'_{filename}-{topic}.csv')
+    file_accounting_system = file_books.freeze()
+    write_summary_counts(make_path('counts'), counts=counts, pool=pool)
+    write_summary_accounts(make_path('accounts'), accounting_system=file_accounting_system, pool=pool)
+    write_summary_balances(make_path('balances'), accounting_system=file_accounting_system, pool=pool)
+    write_summary_ledgers(directory=directory, filename=filename, accounting_system=file_accounting_system, pool=pool)
+    return books.freeze()
+
+# Return True if a command is a journal entry in a closed year, which is read from the closed years instead
+def is_closed(command, closing: Union[fiscalyears.Closing, None]) -> bool:
+    return closing is not None and isinstance(command, JournalEntry) and command.date.year <= closing.closed_through
+
+# Return the names of the files in a directory that hold entries in open years
+# A file is skipped if, when its year was closed, it had no entries in later years and it has not changed since.
+def open_filenames(directory: str, closing: Union[fiscalyears.Closing, None], include_log: bool = True) -> List[str]:
+    closed_sources = set() if closing is None else set(closing.closed_sources)
+    r = []
+    for filename in yield_filenames(directory, include_log):
+        stat = os.stat(os.path.join(directory, filename))
+        if (filename, stat.st_size, stat.st_mtime_ns) in closed_sources: continue
+        r.append(filename)
+    return r
+
+# Yield (filename, command) for the open books in a directory: the opening entries of the first open year, if a year
+# has been closed, then the account declarations and the journal entries in open years of the open files
+def yield_open_commands(directory: str, closing: Union[fiscalyears.Closing, None], filenames: List[str], n_workers: int = 1):
+    if closing is not None:
+        for _, _, command in yield_commands(fiscalyears.root_of(directory), 'opening.txt'):
+            if command is not None:
+                yield 'opening.txt', command
+    for filename in filenames:
+        for _, _, command in yield_commands(directory, filename, n_workers):
+            if command is not None and not is_closed(command, closing):
+                yield filename, command
+
+# Return the accounting system for the open years of the files in a directory, without writing any summary files
+# With drop_duplicates, journal entries repeating entries in earlier files are left out (see dedupe.py).
+def load_files(directory='.', n_workers: int = 1, drop_duplicates: bool = False) -> AccountingSystem:
+    closing = fiscalyears.load_closing(directory)
+    duplicate_index = DuplicateIndex() if drop_duplicates else None
+    source = None
+    r = Builder()
+    for filename, command in yield_open_commands(directory, closing, open_filenames(directory, closing), n_workers):
+        if duplicate_index is not None and filename != source:
+            if source is not None: duplicate_index.end_file()
+            duplicate_index.start_file(filename)
+            source = filename
+        if duplicate_index is not None and isinstance(command, JournalEntry) and duplicate_index.check(command) is not None:
             continue
-        path = os.path.join(directory, objname)
-        if not os.path.isfile(path):
-            print('skipping directory {filename}')
-        r = process_file(directory=directory, filename=objname, accounting_system=r)
-    write_summary_accounts(os.path.join(directory, f'_summary-accounts.csv'), r)
-    write_summary_balances(os.path.join(directory, f'_summary-balances.csv'), r)
-    for category, name in yield_categories_nanes(r):
-        write_summary_ledger(os.path.join(directory, f'_summary-ledger-{category}-{name}.csv'), r.ledgers[name])
+        r.join(command)
+    return r.freeze()
+
+# process files in a directory
+# Once years have been closed, only the open years are read; they start from the opening entries.
+# With memory_report, also write _summary-memory.csv with the memory used by each structure and phase.
+# With columnar, also write the ledgers as column files in the directory _summary-columns (see columnarledgers.py).
+# With rollup_depth, _summary-rollup.csv stops at that depth of the account hierarchy.
+# Journal entries repeating entries in earlier files are listed in _summary-duplicates.csv; with drop_duplicates they
+# are also left out of the books.
+# With pipelined, the files are read and parsed ahead of the joins (see yield_files_to_process), and
+# _summary-pipeline.csv reports how full the queues between the stages got and how long each stage waited.
+# Each join checks the balances it changes; with verify, the books are also checked against every posting in their
+# ledgers (see AccountingSystem.verify) before the summaries are written.
+def process_files(
+        directory='.',
+        n_workers: int = 1,
+        memory_report: bool = False,
+        columnar: bool = False,
+        rollup_depth: Union[int, None] = None,
+        drop_duplicates: bool = False,
+        pipelined: bool = False,
+        verify: bool = False) -> None:
+    phase_tracker = memoryreport.PhaseTracker() if memory_report else None
+    def phase(name: str):
+        return contextlib.nullcontext() if phase_tracker is None else phase_tracker.phase(name)
+    closing = fiscalyears.load_closing(directory)
+    opening = Builder()
+    for _, command in yield_open_commands(directory, closing, []):  # the opening entries
+        opening.join(command)
+    r = opening.freeze()
+    duplicate_index = DuplicateIndex()
+    stages = pipeline.Pipeline() if pipelined else None
+    with WriterPool() as pool, contextlib.nullcontext() if stages is None else stages:
+        for objname, commands in yield_files_to_process(directory, open_filenames(directory, closing), n_workers, stages):
+            with phase(f'process file {objname}'):
+                r = process_file(
+                    directory=directory,
+                    filename=objname,
+                    accounting_system=r,
+                    n_workers=n_workers,
+                    pool=pool,
+                    closing=closing,
+                    duplicate_index=duplicate_index,
+                    drop_duplicates=drop_duplicates,
+                    commands=commands)
+        if verify:
+            with phase('verify'):
+                r.verify()
+        with phase('write summaries'):
+            write_summary_accounts(os.path.join(directory, f'_summary-accounts.csv'), r, pool)
+            write_summary_duplicates(os.path.join(directory, f'_summary-duplicates.csv'), duplicate_index, drop_duplicates, pool)
+            write_summary_balances(os.path.join(directory, f'_summary-balances.csv'), r, pool)
+            write_summary_activity(os.path.join(directory, f'_summary-activity.csv'), r, pool)
+            write_summary_rollup(os.path.join(directory, f'_summary-rollup.csv'), r, rollup_depth, pool)
+            for category, name in yield_categories_nanes(r):
+                write_summary_ledger(os.path.join(directory, f'_summary-ledger-{category}-{name}.csv'), r.ledgers.get(name, []), pool)
+    if columnar:
+        with phase('write columns'):
+            columnarledgers.export(r, os.path.join(directory, '_summary-columns'))
+    if phase_tracker is not None:
+        phase_tracker.stop()
+        write_csv_from_AlignedCSV(os.path.join(directory, '_summary-memory.csv'), memoryreport.make_report(r, phase_tracker))
+    if stages is not None:
+        write_summary_pipeline(os.path.join(directory, '_summary-pipeline.csv'), stages.metrics(), pool)
     return
 
-def main():
-    directory = '.'
-    process_files(directory)
+# Write the metrics of the queues of a pipeline and of the writer pool that the summaries went through
+# The wait of a queue's producer is time it spent blocked on a full queue; that of its consumer, on an empty one. The
+# writer pool's producer is the join stage, which renders the summaries.
+def write_summary_pipeline(path: str, metrics: List[pipeline.QueueMetrics], pool: WriterPool) -> None:
+    r = AlignedCSV(alignments=('left', 'right', 'right', 'right', 'right', 'right', 'right'))
+    r = r.join(('queue', 'capacity', 'items', 'max depth', 'mean depth', 'producer wait seconds', 'consumer wait seconds'))
+    for x in metrics:
+        r = r.join((x.name, x.maxsize, x.n_items, x.max_depth, f'{x.mean_depth:.1f}', f'{x.put_wait_seconds:.3f}', f'{x.get_wait_seconds:.3f}'))
+    r = r.join(('write', pool.max_pending, pool.n_writes, pool.max_depth, '', f'{pool.wait_seconds:.3f}', ''))
+    write_csv_from_AlignedCSV(path, r)
 
-if __name__ == '__main__':
-    main()
+# Append ledger entries to the _summary-ledger-*.csv files of a stream
+# A file is truncated and given its header the first time it is written in a run, then appended to. The rows are
+# plain CSV rather than aligned, as aligning a column needs all of its values.
+class LedgerAppender:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.started: Set[str] = set()
 
+    def append(self, category: str, name: str, ledger_entries: List[LedgerEntry]) -> None:
+        path = os.path.join(self.directory, f'_summary-ledger-{category}-{name}.csv')
+        started = path in self.started
+        with open(path, 'a' if started else 'w', newline='') as f:
+            writer = csv.writer(f)
+            if not started: writer.writerow(ledger_header)
+            for ledger_entry in ledger_entries:
+                writer.writerow(ledger_row(ledger_entry))
+        self.started.add(path)
 
+# Process a stream of account declarations and journal entries, such as stdin, producing these summary files
+#  _summary-accounts.csv
+#  _summary-activity.csv
+#  _summary-balances.csv
+#  _summary-counts.csv
+#  _summary-ledger-{category}-{name}.csv
+#  _summary-rollup.csv
+# The summaries are written at the end of the stream and, with flush_seconds, each time that interval has passed since
+# they were last written, whether or not a line has arrived since, so a long-lived feed that goes quiet can be
+# watched. The stream is read and parsed in a thread of a pipeline, so the joins can wait for a line and the next
+# flush at once. At each flush the accounts, activity, balances, counts and rollup files
+# are rewritten, and the ledger entries since the previous flush are appended to the ledger files and then dropped, so
+# memory is bounded by the number of accounts and months rather than the length of the stream.
+def process_stream(
+        file,
+        source: str = '-',
+        directory: str = '.',
+        flush_seconds: Union[float, None] = None,
+        rollup_depth: Union[int, None] = None) -> AccountingSystem:
+    books = Builder()
+    counts = collections.Counter()
+    ledger_appender = LedgerAppender(directory)
+    def flush():
+        nonlocal books
+        r = books.freeze()
+        def make_path(topic: str) -> str: return os.path.join(directory, f'_summary-{topic}.csv')
+        write_summary_counts(make_path('counts'), counts=counts)
+        write_summary_accounts(make_path('accounts'), accounting_system=r)
+        write_summary_balances(make_path('balances'), accounting_system=r)
+        write_summary_activity(make_path('activity'), accounting_system=r)
+        write_summary_rollup(make_path('rollup'), accounting_system=r, max_depth=rollup_depth)
+        for category, name in yield_categories_nanes(r):
+            ledger_appender.append(category, name, r.ledgers.get(name, []))
+        books = Builder(r.flush_ledgers())
+    def join_line(line_index: int, line: str, command) -> None:
+        counts['lines read'] += 1
+        if command is not None:
+            counts['lines processed'] += 1
+            books.join(command)
+            if isinstance(command, AccountDeclaration): counts['account declarations'] += 1
+            if isinstance(command, JournalEntry): counts['journal entries'] += 1
+    last_flush = time.monotonic()
+    def until() -> float: return last_flush + flush_seconds
+    stages = pipeline.Pipeline()  # not left through with, which would wait for a read of a stream that is still open
+    try:
+        # parse one line at a time, so that each line is joined as soon as it arrives
+        lines = stages.stage('parse', parse.yield_parsed(u.yield_lines(file), source=source, chunk_lines=1), maxsize=64)
+        for item in stages.items(lines, until=None if flush_seconds is None else until):
+            if item is not pipeline.idle:
+                join_line(*item)
+            if flush_seconds is not None and time.monotonic() - last_flush >= flush_seconds:
+                flush()
+                last_flush = time.monotonic()
+    finally:
+        stages.cancel()
+    flush()
+    return books.freeze()
+
+def parse_log_record(record: str, line_number: int) -> Union[JournalEntry, None]:
+    line = record.strip()
+    if parse.skip(line): return None
+    return parse.parse(Line(line, source=log_filename, source_location=f'line {line_number}'), None)
+
+# Identify the files a snapshot was built from, so that a changed file or closing a year invalidates it
+def book_sources(directory: str, closing: Union[fiscalyears.Closing, None]) -> tuple:
+    r = [('closing', closing)]
+    for filename in open_filenames(directory, closing, include_log=False):
+        stat = os.stat(os.path.join(directory, filename))
+        r.append((filename, stat.st_size, stat.st_mtime_ns))
+    return tuple(r)
+
+# Return the snapshot of the book in a directory, with every committed record in its log applied
+# The saved snapshot is used if the files it was built from are unchanged; otherwise the files are read again and the
+# snapshot is saved. Only the records logged after the snapshot are replayed, and a partial last record is removed.
+# A snapshot is a dict with the keys version, sources, log_offset, log_lines, ledger_files, accounting_system and, here
+# only, saved_log_lines, the log_lines of the saved snapshot, and closing. The saved ledgers are not read: the
+# accounting system has the balances, hashes, activity and totals of the whole book, but its ledgers hold only the
+# postings not yet saved, and ledger_files maps an account to the name and length of the file its saved ledger is in.
+def open_book(directory: str) -> Dict[str, Any]:
+    snapshot_path = os.path.join(directory, snapshot_filename)
+    log_path = os.path.join(directory, log_filename)
+    closing = fiscalyears.load_closing(directory)
+    sources = book_sources(directory, closing)
+    snapshot = writeaheadlog.load_snapshot(snapshot_path)
+    log_size = os.path.getsize(log_path) if os.path.exists(log_path) else 0
+    rebuilt = snapshot is None or \
+        snapshot['version'] != snapshot_version or \
+        snapshot['sources'] != sources or \
+        snapshot['log_offset'] > log_size
+    if rebuilt:
+        shutil.rmtree(os.path.join(directory, ledgers_dirname), ignore_errors=True)
+        books = Builder()
+        for _, command in yield_open_commands(directory, closing, [filename for filename, *_ in sources[1:]]):
+            books.join(command)
+        snapshot = {
+            'version': snapshot_version,
+            'sources': sources,
+            'log_offset': 0,
+            'log_lines': 0,
+            'ledger_files': {},
+            'accounting_system': books.freeze()}
+    r = Builder(snapshot['accounting_system'])
+    log_offset = snapshot['log_offset']
+    log_lines = saved_log_lines = snapshot['log_lines']
+    for log_offset, record in writeaheadlog.recover(log_path, log_offset):
+        log_lines += 1
+        command = parse_log_record(record, log_lines)
+        if command is not None and not is_closed(command, closing):
+            r.join(command)
+    snapshot = {**snapshot, 'log_offset': log_offset, 'log_lines': log_lines, 'accounting_system': r.freeze()}
+    if rebuilt:
+        snapshot = save_book(directory, snapshot)
+        saved_log_lines = log_lines
+    return {**snapshot, 'saved_log_lines': saved_log_lines, 'closing': closing}
+
+# Save a snapshot as from open_book and return it as saved: the postings in the ledgers of its accounting system are
+# appended to the files of their accounts, and then the snapshot is replaced by one whose ledgers are empty, so saving
+# costs the postings since the last save, not the book. A crash in between leaves the previous snapshot, which reads
+# its files only through the lengths it recorded.
+def save_book(directory: str, snapshot: Dict[str, Any]) -> Dict[str, Any]:
+    ledgers_path = os.path.join(directory, ledgers_dirname)
+    os.makedirs(ledgers_path, exist_ok=True)
+    x = snapshot['accounting_system']
+    ledger_files = dict(snapshot['ledger_files'])
+    for account, ledger in x.ledgers.items():
+        if len(ledger) == 0: continue
+        filename, length = ledger_files.get(account, (f'{len(ledger_files)}.ledger', 0))
+        ledger_files[account] = (filename, writeaheadlog.append_items(os.path.join(ledgers_path, filename), length, ledger))
+    r = {key: snapshot[key] for key in ('version', 'sources', 'log_offset', 'log_lines')}
+    r = {**r, 'ledger_files': ledger_files, 'accounting_system': x.flush_ledgers()}
+    writeaheadlog.save_snapshot(os.path.join(directory, snapshot_filename), r)
+    return r
 
+# Return the book in a directory with its whole ledgers: the saved postings of each account, in the order they were
+# saved, then those not yet saved, sorted by date, which leaves the postings of a date in the order they were joined
+def load_book(directory: str) -> AccountingSystem:
+    book = open_book(directory)
+    x = book['accounting_system']
+    ledgers = {}
+    for account, (filename, length) in book['ledger_files'].items():
+        ledgers[account] = writeaheadlog.load_items(os.path.join(directory, ledgers_dirname, filename), length)
+    for account, ledger in x.ledgers.items():
+        ledgers[account] = ledgers.get(account, []) + ledger
+    for ledger in ledgers.values():
+        ledger.sort(key=lambda ledger_entry: ledger_entry.date)
+    return dataclasses.replace(x, ledgers=ledgers, ledgers_flushed=False)
 
+# Append journal entries, given as journal lines, to the log of the book in a directory and print the new balances
+# Each entry is checked by joining it before it is logged. The log is committed, with one fsync, every group_size
+# entries and at the end, and the balances of the accounts posted to are printed after each commit. The snapshot is
+# saved again once checkpoint_every records have been logged since it was saved. The saved ledgers are neither read
+# nor rewritten, so adding costs the new entries and the records logged since the snapshot was saved.
+def add_entries(directory: str, texts, group_size: int = 64, checkpoint_every: int = 100) -> None:
+    book = open_book(directory)
+    r = Builder(book['accounting_system'])
+    log_lines = book['log_lines']
+    last_journal_entry = None
+    posted_to = []  # accounts posted to since the last commit
+    with writeaheadlog.WriteAheadLog(os.path.join(directory, log_filename)) as log:
+        assert log.offset == book['log_offset']
+        def commit():
+            log.commit()
+            for account in dict.fromkeys(posted_to):
+                balance = r.balances[account]
+                print(f'{r.category_for[account]}: {account} {balance.side} {balance.amount}')
+            posted_to.clear()
+        try:
+            for text in texts:
+                line = text.strip()
+                if parse.skip(line): continue
+                location = f'line {log_lines + 1}'
+                command = parse.parse(Line(line, source=log_filename, source_location=location), last_journal_entry)
+                if not isinstance(command, JournalEntry):
+                    raise ValueError(f'{line}: add takes journal entries; declare accounts in a journal file')
+                if len(command.description) == 0:
+                    raise ValueError(f'{line}: a description is required')
+                if is_closed(command, book['closing']):
+                    raise ValueError(f'{line}: {command.date.year} is closed')
+                r.join(command)
+                log.append(parse.render_journal_entry(command))
+                log_lines += 1
+                last_journal_entry = command
+                posted_to.extend((command.debit_account, command.credit_account))
+                if log.n_pending >= group_size: commit()
+        finally:
+            commit()
+        log_offset = log.offset
+    if log_lines - book['saved_log_lines'] >= checkpoint_every:
+        save_book(directory, {**book, 'log_offset': log_offset, 'log_lines': log_lines, 'accounting_system': r.freeze()})
+
+def main_add(argv: List[str]):
+    parser = argparse.ArgumentParser(prog='sac-pgm.py add', description='append journal entries to the log of a book')
+    parser.add_argument('entries', nargs='+', help='journal lines such as 20250105,12.50,Supplies,Cash,paper; - reads stdin')
+    parser.add_argument('--directory', default='.')
+    parser.add_argument('--group-size', type=int, default=64, help='entries committed by each fsync')
+    parser.add_argument('--checkpoint-every', type=int, default=100, help='entries logged between snapshots')
+    args = parser.parse_args(argv)
+    def yield_texts():
+        for entry in args.entries:
+            if entry == '-':
+                yield from sys.stdin
+            else:
+                yield entry
+    add_entries(args.directory, yield_texts(), group_size=args.group_size, checkpoint_every=args.checkpoint_every)
+
+# Close the years of the books in a directory through year, writing them under _closed-years (see fiscalyears.py)
+# The journal entries of the open years are read and each year through year is closed in turn: its books start from
+# the opening entries carried from the year before, and its closing entries move its revenue and expenses to
+# retained_earnings. The opening entries of the next year are written to opening.txt, and the files with no entries
+# in later years are recorded so that they are not read again until they change.
+def close_books(directory: str, year: int, retained_earnings: str, opening_balances: str) -> None:
+    closing = fiscalyears.load_closing(directory)
+    if closing is not None and year <= closing.closed_through:
+        raise ValueError(f'the books are closed through {closing.closed_through}')
+    filenames = open_filenames(directory, closing)
+    category_for = {}
+    entries_for_year = collections.defaultdict(list)
+    last_year_for = {filename: None for filename in filenames}  # the last year with an entry in each file
+    for filename, command in yield_open_commands(directory, closing, filenames):
+        if isinstance(command, AccountDeclaration):
+            if category_for.setdefault(command.name, command.category) != command.category:
+                raise ValueError(f'account {command.name} is declared as both {category_for[command.name]} and {command.category}')
+        else:
+            entries_for_year[command.date.year].append(command)
+            if filename in last_year_for:
+                last_year_for[filename] = max(last_year_for[filename] or command.date.year, command.date.year)
+    for account in (retained_earnings, opening_balances):
+        if category_for.setdefault(account, 'Equity') != 'Equity':
+            raise ValueError(f'account {account} is not an Equity account')
+    first_year = closing.closed_through + 1 if closing is not None else min(min(entries_for_year.keys(), default=year), year)
+    carried = None  # the balances at the end of the previous year, once it has been closed here
+    for closing_year in range(first_year, year + 1):
+        books = Builder()
+        for account, category in sorted(category_for.items()):
+            books.join(AccountDeclaration(category=category, name=account))
+        if carried is not None:
+            for entry in fiscalyears.opening_entries(carried, closing_year, opening_balances):
+                books.join(entry)
+        for entry in entries_for_year.get(closing_year, []):
+            books.join(entry)
+        for entry in fiscalyears.closing_entries(books.freeze(), closing_year, retained_earnings):
+            books.join(entry)
+        x = books.freeze()
+        x.verify()
+        fiscalyears.write_closed_year(directory, closing_year, x)
+        carried = fiscalyears.year_end_cents(x)
+        print(f'closed {closing_year}')
+    closed_sources = [] if closing is None else list(closing.closed_sources)
+    for filename, last_year in last_year_for.items():
+        if filename != log_filename and (last_year is None or last_year <= year):
+            stat = os.stat(os.path.join(directory, filename))
+            closed_sources.append((filename, stat.st_size, stat.st_mtime_ns))
+    fiscalyears.write_closing(
+        directory,
+        fiscalyears.Closing(
+            closed_through=year,
+            closed_sources=tuple(closed_sources),
+            retained_earnings=retained_earnings,
+            opening_balances=opening_balances),
+        fiscalyears.render_opening(category_for, fiscalyears.opening_entries(carried, year + 1, opening_balances)))
 
+def main_close(argv: List[str]):
+    parser = argparse.ArgumentParser(prog='sac-pgm.py close', description='close the years of a book through a year')
+    parser.add_argument('year', type=int)
+    parser.add_argument('--directory', default='.')
+    parser.add_argument('--retained-earnings', default='Retained Earnings', help='Equity account that takes the net income')
+    parser.add_argument('--opening-balances', default='Opening Balances', help='Equity account the opening entries are made against')
+    args = parser.parse_args(argv)
+    close_books(args.directory, args.year, args.retained_earnings, args.opening_balances)
 
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'add':  # a directory named add is ./add
+        return main_add(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == 'close':
+        return main_close(sys.argv[2:])
+    parser = argparse.ArgumentParser(description='simple accounting system')
+    parser.add_argument('directory', nargs='?', default='.', help='directory of journal files, or - to read stdin')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes parsing each file')
+    parser.add_argument('--memory-report', action='store_true', help='write _summary-memory.csv')
+    parser.add_argument('--columnar', action='store_true', help='write the ledgers as column files in _summary-columns')
+    parser.add_argument('--flush-seconds', type=float, default=None, help='with -, also write the summaries this often')
+    parser.add_argument('--rollup-depth', type=int, default=None, help='deepest level of _summary-rollup.csv; categories are level 1')
+    parser.add_argument('--duplicates', choices=('flag', 'drop'), default='flag', help='list entries repeated across files, or also drop them')
+    parser.add_argument('--pipeline', action='store_true', help='read and parse files ahead of the joins; write _summary-pipeline.csv')
+    parser.add_argument('--verify', action='store_true', help='check the books against every posting in their ledgers')
+    args = parser.parse_args()
+    if args.directory == '-':
+        with u.open_text('-') as file:
+            process_stream(file, source='-', directory='.', flush_seconds=args.flush_seconds, rollup_depth=args.rollup_depth)
+    else:
+        process_files(
+            args.directory,
+            n_workers=args.workers,
+            memory_report=args.memory_report,
+            columnar=args.columnar,
+            rollup_depth=args.rollup_depth,
+            drop_duplicates=args.duplicates == 'drop',
+            pipelined=args.pipeline,
+            verify=args.verify)
+    print(tc.render_stats())
+
+if __name__ == '__main__':
+    main()
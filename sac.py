@@ -4,6 +4,7 @@ import datetime
 
 from typing import List
 
+import tokencache as tc
 import utility as u
 
 AccountDeclaration = collections.namedtuple('AccountDeclaration', 'category name')
@@ -54,7 +55,7 @@ def make(kind, *args):
         assert isinstance(dollars, int)
         assert isinstance(cents, int)
         if cents >= 0 and cents < 100: return Amount(dollars, cents)
-        if cents > 100: return make('Amount', dollars+1, cents-100)
+        if cents >= 100: return make('Amount', dollars+1, cents-100)
         if cents < 0: return make('Amount', dollars-1, cents+100)
     if kind == 'Balance':
         side, amount = args
@@ -88,12 +89,7 @@ def make(kind, *args):
 # For Q's definition, see https://code.kx.com/q/ref/cast/
 def cast(kind, value):
     if kind == 'Amount' and isinstance(value, str):
-        dollars, _, cents = value.partition('.')
-        return make(
-            'Amount',
-            0 if dollars == '' else int(dollars),
-            0 if cents == '' else int(cents)
-        )
+        return tc.cached(_cast_Amount_str, value)
     if kind == 'AccountDeclaration' and isinstance(value, str):
         error_msg = 'Account Declaration was not like: Asset Accounts Receivable'
         splits = u.split_and_strip(value)
@@ -119,13 +115,21 @@ def cast(kind, value):
         balance = make('Balance', side, cast('Amount', amount))
         return make('LedgerEntry', category, account, datetime_date, balance, description, line, location)
     if kind == 'datetime.date' and isinstance(value, str):
-        return datetime.date.fromisoformat(value)
+        return tc.cached(datetime.date.fromisoformat, value)
     if kind == 'str' and isinstance(value, Amount): 
         return f'{value.dollars}.{str(value.cents).zfill(2)}'
     if kind == 'str' and isinstance(value, datetime.date):
         return f'{value.year}{str(value.month).zfill(2)}{str(value.day).zfill(2)}'
     raise NotImplementedError(f'cast({kind}: {value})')
 
+def _cast_Amount_str(value: str) -> Amount:
+    dollars, _, cents = value.partition('.')
+    return make(
+        'Amount',
+        0 if dollars == '' else int(dollars),
+        0 if cents == '' else int(cents)
+    )
+
 # Return x combined with y
 # For Q's definition, see https://code.kx.com/q/ref/join/
 def join(x, y):
@@ -0,0 +1,56 @@
+# Thin client for the query server in sacserver.py
+from typing import Any, Dict, List, Union
+
+import json
+import socket
+
+from accountingsystemerror import AccountingSystemError
+
+class SacClient:
+    def __init__(self, socket_path: str):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(socket_path)
+        self._file = self._socket.makefile('rwb')
+
+    def __enter__(self) -> 'SacClient':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._file.close()
+        self._socket.close()
+
+    # send one request and wait for its response, raising AccountingSystemError if the server rejected it
+    def request(self, op: str, **kwargs) -> Any:
+        kwargs['op'] = op
+        self._file.write(json.dumps(kwargs).encode() + b'\n')
+        self._file.flush()
+        line = self._file.readline()
+        if len(line) == 0: raise AccountingSystemError('server closed the connection')
+        response = json.loads(line)
+        if not response['ok']: raise AccountingSystemError(response['error'])
+        return response['result']
+
+    def ping(self) -> str:
+        return self.request('ping')
+
+    def accounts(self) -> Dict[str, str]:
+        return self.request('accounts')
+
+    def balance(self, account: str) -> Dict[str, str]:
+        return self.request('balance', account=account)
+
+    def balances(self) -> Dict[str, Dict[str, str]]:
+        return self.request('balances')
+
+    # start and end are ISO dates (YYYY-MM-DD) or None
+    def ledger(self, account: str, start: Union[str, None] = None, end: Union[str, None] = None) -> List[Dict[str, str]]:
+        return self.request('ledger', account=account, start=start, end=end)
+
+    def category_totals(self) -> Dict[str, Dict[str, str]]:
+        return self.request('category_totals')
+
+    def trial_balance(self) -> Dict[str, Any]:
+        return self.request('trial_balance')
@@ -0,0 +1,212 @@
+# Serve queries against an AccountingSystem that is loaded once and kept in memory
+# Clients connect to a Unix domain socket and exchange newline-delimited JSON messages (see sacclient.py).
+# usage: python3 sacserver.py [directory] [socket-path]
+from typing import Any, Dict, List, Union
+
+import asyncio
+import datetime
+import importlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+from accountdeclaration import AccountDeclaration
+from accountingsystem import AccountingSystem
+from accountingsystemerror import AccountingSystemError
+from amount import Amount
+from balance import Balance
+from journalentry import JournalEntry
+from ledgerentry import LedgerEntry
+
+import fiscalyears
+import utility as u
+
+default_socket_filename = '_sac.sock'
+
+def render_balance(balance: Balance) -> Dict[str, str]:
+    return {'side': balance.side, 'amount': f'{balance.amount}'}
+
+def render_ledger_entry(ledger_entry: LedgerEntry) -> Dict[str, str]:
+    return {
+        'date': ledger_entry.date.isoformat(),
+        'side': ledger_entry.balance.side,
+        'amount': f'{ledger_entry.balance.amount}',
+        'description': ledger_entry.description,
+        'source': ledger_entry.source,
+        'source_location': ledger_entry.source_location,
+    }
+
+# Answer queries against a loaded accounting system
+# The accounting system is never changed, so requests can be served concurrently without locking. The accounting
+# system holds the open years; a ledger query that reaches back into closed years reads them from closed_years.
+class QueryHandler:
+    def __init__(self, accounting_system: AccountingSystem, closed_years: Union[fiscalyears.ClosedYears, None] = None):
+        self.accounting_system = accounting_system
+        self.closed_years = closed_years
+        self._category_totals = None
+        self._trial_balance = None
+
+    def handle(self, request: Dict[str, Any]) -> Any:
+        op = request.get('op', None)
+        if op == 'ping': return 'pong'
+        if op == 'accounts': return self.accounts()
+        if op == 'balance': return self.balance(request['account'])
+        if op == 'balances': return self.balances()
+        if op == 'ledger': return self.ledger(request['account'], request.get('start', None), request.get('end', None))
+        if op == 'category_totals': return self.category_totals()
+        if op == 'trial_balance': return self.trial_balance()
+        raise AccountingSystemError(f'unknown op {op}')
+
+    def _check_account(self, account: str) -> None:
+        if account not in self.accounting_system.category_for:
+            raise AccountingSystemError(f'account {account} not previously defined')
+
+    def accounts(self) -> Dict[str, str]:
+        return dict(self.accounting_system.category_for)
+
+    def balance(self, account: str) -> Dict[str, str]:
+        self._check_account(account)
+        return render_balance(self._balance(account))
+
+    def _balance(self, account: str) -> Balance:
+        return self.accounting_system.balances.get(account, Balance(side='debit', amount=Amount.zero()))
+
+    def balances(self) -> Dict[str, Dict[str, str]]:
+        return {account: render_balance(self._balance(account)) for account in self.accounting_system.category_for}
+
+    # ledger entries with start <= date <= end; start and end are ISO dates or None
+    def ledger(self, account: str, start: Union[str, None], end: Union[str, None]) -> List[Dict[str, str]]:
+        self._check_account(account)
+        start_date = datetime.date.min if start is None else datetime.date.fromisoformat(start)
+        end_date = datetime.date.max if end is None else datetime.date.fromisoformat(end)
+        closed = []
+        if self.closed_years is not None and self.closed_years.closing is not None:
+            closed_through = self.closed_years.closing.closed_through
+            if start_date.year <= closed_through:
+                closed = self.closed_years.ledger(account, start_date, min(end_date, datetime.date(closed_through, 12, 31)))
+        return [render_ledger_entry(ledger_entry) for ledger_entry in closed] + [
+            render_ledger_entry(ledger_entry)
+            for ledger_entry in self.accounting_system.ledger_between(account, start_date, end_date)
+        ]
+
+    # the totals are computed on first use and then reused, as the accounting system does not change
+    def category_totals(self) -> Dict[str, Dict[str, str]]:
+        if self._category_totals is None:
+            totals = {}
+            for account, category in self.accounting_system.category_for.items():
+                total = totals.get(category, Balance(side='debit', amount=Amount.zero()))
+                totals[category] = total.add(self._balance(account))
+            self._category_totals = {category: render_balance(total) for category, total in totals.items()}
+        return self._category_totals
+
+    def trial_balance(self) -> Dict[str, Any]:
+        if self._trial_balance is None:
+            rows = []
+            debit_total = Amount.zero()
+            credit_total = Amount.zero()
+            accounts_for_category = u.invert_dict(self.accounting_system.category_for)
+            for category in ('Asset', 'Liability', 'Equity', 'Revenue', 'Expense'):
+                for account in sorted(accounts_for_category.get(category, set())):
+                    balance = self._balance(account)
+                    if balance.side == 'debit':
+                        debit_total = debit_total.add(balance.amount)
+                        rows.append({'category': category, 'account': account, 'debit': f'{balance.amount}', 'credit': ''})
+                    else:
+                        credit_total = credit_total.add(balance.amount)
+                        rows.append({'category': category, 'account': account, 'debit': '', 'credit': f'{balance.amount}'})
+            self._trial_balance = {'rows': rows, 'debit_total': f'{debit_total}', 'credit_total': f'{credit_total}'}
+        return self._trial_balance
+
+    # return the response line for a request line
+    def respond(self, line: bytes) -> bytes:
+        try:
+            result = self.handle(json.loads(line))
+            response = {'ok': True, 'result': result}
+        except AccountingSystemError as e:
+            response = {'ok': False, 'error': e.message}
+        except (KeyError, ValueError, TypeError) as e:
+            response = {'ok': False, 'error': f'bad request: {e!r}'}
+        return json.dumps(response).encode() + b'\n'
+
+async def serve_client(handler: QueryHandler, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        while True:
+            line = await reader.readline()
+            if len(line) == 0: break
+            writer.write(handler.respond(line))
+            await writer.drain()
+    finally:
+        writer.close()
+
+async def serve(
+        accounting_system: AccountingSystem,
+        socket_path: str,
+        started: Union[threading.Event, None] = None,
+        closed_years: Union[fiscalyears.ClosedYears, None] = None) -> None:
+    handler = QueryHandler(accounting_system, closed_years)
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = await asyncio.start_unix_server(
+        lambda reader, writer: serve_client(handler, reader, writer),
+        path=socket_path)
+    if started is not None: started.set()
+    async with server:
+        await server.serve_forever()
+
+def main():
+    sac_pgm = importlib.import_module('sac-pgm')
+    directory = sys.argv[1] if len(sys.argv) > 1 else '.'
+    socket_path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(directory, default_socket_filename)
+    accounting_system = sac_pgm.load_files(directory)
+    u.eprint(f'serving {len(accounting_system.category_for)} accounts on {socket_path}')
+    try:
+        asyncio.run(serve(accounting_system, socket_path, closed_years=fiscalyears.ClosedYears(directory)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if os.path.exists(socket_path): os.remove(socket_path)
+
+
+class Test(unittest.TestCase):
+    def test_serve(self):
+        from sacclient import SacClient
+        x = AccountingSystem.empty()
+        for category, name in (('Asset', 'cash'), ('Asset', 'supplies'), ('Equity', 'owners equity')):
+            x = x.join(AccountDeclaration(category=category, name=name))
+        def je(date, dollars, debit_account, credit_account):
+            return JournalEntry(
+                date=date,
+                amount=Amount(dollars=dollars, cents=0),
+                debit_account=debit_account,
+                credit_account=credit_account,
+                description='',
+                source='',
+                source_location='')
+        x = x.join(je(datetime.date(2025, 1, 1), 100, 'cash', 'owners equity'))
+        x = x.join(je(datetime.date(2025, 2, 1), 10, 'supplies', 'cash'))
+
+        socket_path = os.path.join(tempfile.mkdtemp(), default_socket_filename)
+        started = threading.Event()
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_until_complete, args=(serve(x, socket_path, started),), daemon=True)
+        thread.start()
+        started.wait(timeout=10)
+        with SacClient(socket_path) as client:
+            self.assertEqual('pong', client.ping())
+            self.assertEqual({'side': 'debit', 'amount': '90.00'}, client.balance('cash'))
+            self.assertEqual(2, len(client.ledger('cash')))
+            self.assertEqual(1, len(client.ledger('cash', start='2025-01-15')))
+            self.assertEqual('2025-01-01', client.ledger('cash', end='2025-01-31')[0]['date'])
+            with self.assertRaises(AccountingSystemError):
+                client.balance('no such account')
+            self.assertEqual({'side': 'credit', 'amount': '100.00'}, client.category_totals()['Equity'])
+            trial_balance = client.trial_balance()
+            self.assertEqual('100.00', trial_balance['debit_total'])
+            self.assertEqual('100.00', trial_balance['credit_total'])
+            self.assertEqual(['cash', 'supplies', 'owners equity'], [row['account'] for row in trial_balance['rows']])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+# Complexity regression tests for the hot paths that build books one item at a time
+# Each path is timed building from nothing at growing sizes, and the exponent k in seconds ~ n**k is fitted by least
+# squares to the logarithms of the sizes and times. A join that copies what has been built so far makes building
+# quadratic, with k near 2; a test fails when k is over max_exponent. The inputs are generated, so the tests read no
+# files and need no network, and each size is timed several times and the fastest kept. As timings depend on the
+# machine and its load, a path whose exponent is over max_exponent is timed again and the faster time of each size
+# kept, so a burst of load fails a test only if it recurs.
+# The books are built with Builder.join. AccountingSystem.join leaves the books it joins to unchanged, so it copies
+# their dicts and the two ledgers posted to, and building with it is quadratic; it is for keeping a version of the
+# books, and every loop that builds books, in sac-pgm.py and elsewhere, uses a Builder. test_value_join checks that
+# AccountingSystem.join copies no more than that.
+from typing import Any, Callable, List, Sequence
+
+import collections
+import datetime
+import math
+import random
+import timeit
+import unittest
+
+from accountdeclaration import AccountDeclaration
+from accountingsystem import AccountingSystem, Builder
+from alignedcsv import AlignedCSV
+from amount import Amount
+from journalentry import JournalEntry
+
+import balances
+import ledgers
+import sac
+
+sizes = (2_000, 8_000, 32_000)
+max_exponent = 1.5  # halfway from linear to quadratic, so that noise in the timings does not fail a linear path
+verbose = False
+
+accounts = (
+    ('Asset', 'Bank:Checking'),
+    ('Asset', 'Cash'),
+    ('Liability', 'Card'),
+    ('Equity', 'Owners Equity'),
+    ('Revenue', 'Sales'),
+    ('Expense', 'Utilities:Electric'),
+    ('Expense', 'Utilities:Water'),
+    ('Expense', 'Food'))
+
+# Return the slope of the least-squares line through (log n, log seconds)
+def fit_exponent(sizes: Sequence[int], seconds: Sequence[float]) -> float:
+    xs = [math.log(n) for n in sizes]
+    ys = [math.log(s) for s in seconds]
+    x_mean = sum(xs) / len(xs)
+    y_mean = sum(ys) / len(ys)
+    return sum((x - x_mean) * (y - y_mean) for x, y in zip(xs, ys)) / sum((x - x_mean) ** 2 for x in xs)
+
+# Return the fastest of repeat timings of build(make_input(n)) for each size; the inputs are made outside the timing
+def time_builds(make_input: Callable[[int], Any], build: Callable[[Any], Any], sizes: Sequence[int], repeat: int = 3) -> List[float]:
+    r = []
+    for n in sizes:
+        items = make_input(n)
+        r.append(min(timeit.repeat(lambda: build(items), number=1, repeat=repeat)))
+    return r
+
+# Yield (date, cents, debit account, credit account) for n postings over two years, in date order
+def yield_postings(n: int):
+    rng = random.Random(n)
+    names = [name for _, name in accounts]
+    for i in range(n):
+        debit_account, credit_account = rng.sample(names, 2)
+        yield datetime.date(2024, 1, 1) + datetime.timedelta(days=i * 730 // n), rng.randrange(1, 100_000), debit_account, credit_account
+
+def make_journal_entries(n: int) -> List[JournalEntry]:
+    return [
+        JournalEntry(
+            date=date,
+            amount=Amount.from_cents(cents),
+            debit_account=debit_account,
+            credit_account=credit_account,
+            description=f'entry {i}',
+            source='generated',
+            source_location=f'line {i+1}')
+        for i, (date, cents, debit_account, credit_account) in enumerate(yield_postings(n))]
+
+def build_accounting_system(journal_entries: List[JournalEntry]) -> AccountingSystem:
+    books = Builder()
+    for category, name in accounts:
+        books.join(AccountDeclaration(category=category, name=name))
+    for journal_entry in journal_entries:
+        books.join(journal_entry)
+    return books.freeze()
+
+def make_rows(n: int) -> List[tuple]:
+    return [(date, cents, debit_account, credit_account, f'entry {i}') for i, (date, cents, debit_account, credit_account) in enumerate(yield_postings(n))]
+
+def build_aligned_csv(rows: List[tuple]) -> AlignedCSV:
+    r = AlignedCSV(alignments=('left', 'right', 'left', 'left', 'left'))
+    for row in rows:
+        r = r.join(row)
+    return r
+
+def make_sac_journal_entries(n: int) -> list:
+    return [
+        sac.make('JournalEntry', date, sac.make('Amount', cents // 100, cents % 100), debit_account, credit_account, f'entry {i}')
+        for i, (date, cents, debit_account, credit_account) in enumerate(yield_postings(n))]
+
+def build_ledgers(journal_entries: list) -> ledgers.State:
+    state = ledgers.State({}, collections.defaultdict(list), None, None, 'generated', '1')
+    for category, name in accounts:
+        state = ledgers.join(state, sac.make('AccountDeclaration', category, name))
+    for journal_entry in journal_entries:
+        state = ledgers.join(state, journal_entry)
+    return state
+
+def make_sac_ledger_entries(n: int) -> list:
+    category_for = {name: category for category, name in accounts}
+    r = []
+    for i, (date, cents, debit_account, credit_account) in enumerate(yield_postings(n)):
+        amount = sac.make('Amount', cents // 100, cents % 100)
+        for side, account in (('debit', debit_account), ('credit', credit_account)):
+            r.append(sac.make('LedgerEntry', category_for[account], account, date, sac.make('Balance', side, amount), f'entry {i}', 'generated', f'{i+1}'))
+    return r
+
+def build_balances(ledger_entries: list) -> balances.State:
+    state = balances.empty_state()
+    for ledger_entry in ledger_entries:
+        state = balances.join_state_ledger_entry(state, ledger_entry)
+    return state
+
+
+class Test(unittest.TestCase):
+    def assert_linear(self, name: str, make_input: Callable[[int], Any], build: Callable[[Any], Any]) -> None:
+        seconds = time_builds(make_input, build, sizes)
+        exponent = fit_exponent(sizes, seconds)
+        if exponent > max_exponent:
+            seconds = [min(s, t) for s, t in zip(seconds, time_builds(make_input, build, sizes))]
+            exponent = fit_exponent(sizes, seconds)
+        timings = ', '.join(f'{n}: {s:.4f}s' for n, s in zip(sizes, seconds))
+        if verbose: print(f'{name}: exponent {exponent:.2f} ({timings})')
+        self.assertLessEqual(exponent, max_exponent, f'{name} scales as n**{exponent:.2f} ({timings})')
+
+    def test_fit_exponent(self):
+        self.assertAlmostEqual(1.0, fit_exponent((10, 100, 1000), (0.5, 5, 50)))
+        self.assertAlmostEqual(2.0, fit_exponent((10, 100, 1000), (0.01, 1, 100)))
+        self.assertAlmostEqual(1.0, fit_exponent(sizes, [n * (1.2 if i == 1 else 1.0) for i, n in enumerate(sizes)]), places=1)
+
+    def test_quadratic_is_caught(self):
+        def copy_on_each_join(items):
+            r = []
+            for item in items:
+                r = r + [item]
+            return r
+        quadratic_sizes = (2_000, 4_000, 8_000)
+        seconds = time_builds(range, copy_on_each_join, quadratic_sizes)
+        self.assertGreater(fit_exponent(quadratic_sizes, seconds), max_exponent)
+
+    def test_builder_join(self):
+        self.assert_linear('Builder.join', make_journal_entries, build_accounting_system)
+
+    def test_aligned_csv_join(self):
+        self.assert_linear('AlignedCSV.join', make_rows, build_aligned_csv)
+
+    def test_ledgers_join_journal_entry(self):
+        self.assert_linear('ledgers.join_State_JournalEntry', make_sac_journal_entries, build_ledgers)
+
+    def test_balances_join_ledger_entry(self):
+        self.assert_linear('balances.join_state_ledger_entry', make_sac_ledger_entries, build_balances)
+
+    def test_value_join(self):
+        x = build_accounting_system(make_journal_entries(100))
+        debit_account, credit_account = accounts[0][1], accounts[1][1]
+        y = x.join(JournalEntry(
+            date=datetime.date(2026, 1, 1),
+            amount=Amount.from_cents(1),
+            debit_account=debit_account,
+            credit_account=credit_account,
+            description='',
+            source='',
+            source_location=''))
+        copied = [name for name in x.ledgers if y.ledgers[name] is not x.ledgers[name]]
+        self.assertEqual(sorted((debit_account, credit_account)), sorted(copied))
+
+    def test_builds(self):
+        journal_entries = make_journal_entries(100)
+        x = build_accounting_system(journal_entries)
+        x.verify()
+        self.assertEqual(200, sum(len(ledger) for ledger in x.ledgers.values()))
+        self.assertEqual(100, len(build_aligned_csv(make_rows(100)).cast('tuple(tuple)')))
+        state = build_ledgers(make_sac_journal_entries(100))
+        self.assertEqual(200, sum(len(ledger) for ledger in state.ledger_entries_for_account.values()))
+        state = build_balances(make_sac_ledger_entries(100))
+        for name, balance in state.balance_for_account.items():
+            self.assertEqual(x.balances[name].signed_cents(), (1 if balance.side == 'debit' else -1) * (balance.amount.dollars * 100 + balance.amount.cents))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,3 +6,19 @@ python3 ledgerentry.py
 python3 line.py
 python3 parse.py
 python3 utility.py
+python3 -m unittest sacserver
+python3 tokencache.py
+python3 memoryreport.py
+python3 columnarledgers.py
+python3 -m unittest reconcile
+python3 accountdiff.py
+python3 writerpool.py
+python3 activity.py
+python3 writeaheadlog.py
+python3 fiscalyears.py
+python3 categorize.py
+python3 dedupe.py
+python3 pipeline.py
+python3 concurrentaccountingsystem.py
+python3 scaling.py
+python3 -m unittest bankimport
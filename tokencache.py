@@ -0,0 +1,63 @@
+# Bounded LRU cache of the values made from input tokens, shared by the parsers in parse.py and sac.py
+# Journals repeat the same dates and amounts, so each distinct token is converted once. Caching is valid because
+# the values (dates and amounts) are never mutated after they are made.
+from typing import Any, Callable, Dict
+
+import datetime
+import functools
+import unittest
+
+default_maxsize = 65536
+
+def _make(make: Callable[[str], Any], token: str) -> Any:
+    return make(token)
+
+_cached = functools.lru_cache(maxsize=default_maxsize)(_make)
+
+# Return make(token), reusing the value made for an earlier identical token
+# Exceptions raised by make are not cached.
+def cached(make: Callable[[str], Any], token: str) -> Any:
+    return _cached(make, token)
+
+# Discard the cache contents and statistics, and bound the cache to maxsize entries
+def set_maxsize(maxsize: int) -> None:
+    global _cached
+    _cached = functools.lru_cache(maxsize=maxsize)(_make)
+
+def clear() -> None:
+    _cached.cache_clear()
+
+def stats() -> Dict[str, Any]:
+    info = _cached.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        'hits': info.hits,
+        'misses': info.misses,
+        'maxsize': info.maxsize,
+        'currsize': info.currsize,
+        'hit_ratio': 0.0 if lookups == 0 else info.hits / lookups,
+    }
+
+def render_stats() -> str:
+    x = stats()
+    return f'token cache: {x["hits"]} hits, {x["misses"]} misses, {x["currsize"]} of {x["maxsize"]} entries, hit ratio {x["hit_ratio"]:.3f}'
+
+
+class Test(unittest.TestCase):
+    def test_cached(self):
+        set_maxsize(2)
+        a = cached(datetime.date.fromisoformat, '2025-01-01')
+        b = cached(datetime.date.fromisoformat, '2025-01-01')
+        self.assertIs(a, b)
+        self.assertEqual(1, stats()['hits'])
+        self.assertEqual(1, stats()['misses'])
+        cached(int, '1')
+        cached(str.upper, '1')  # a different maker is a different key
+        self.assertEqual(2, stats()['currsize'])
+        self.assertEqual(3, stats()['misses'])
+        with self.assertRaises(ValueError):
+            cached(int, 'x')
+        set_maxsize(default_maxsize)
+
+if __name__ == '__main__':
+    unittest.main()
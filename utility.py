@@ -1,12 +1,18 @@
 # utility functions
+import bisect
+import bz2
 import copy
 import csv
+import gzip
 import io
+import lzma
+import os
 import sys
+import tempfile
 import typing
 import unittest
 
-from typing import Any, Dict, List, Set
+from typing import Any, Dict, List, Set, Union
 
 # convert value to an instance of kind
 def cast(kind, value):
@@ -17,8 +23,7 @@ def cast(kind, value):
             r: str = file.getvalue().strip()
             return r
     if kind == 'list[str]' and isinstance(value, str):  # return a list of str
-        # ref: https://stackoverflow.com/questions/3305926/python-csv-string-to-array
-        return list(map(str.strip, next(csv.reader([value]))))
+        return split_csvline(value)
 
 # ref: https://stackoverflow.com/questions/3305926/python-csv-string-to-array
 # Deprecated; instead cast('csvline', row)
@@ -27,10 +32,88 @@ def _cast_csvline_listrow(row: List[str]) -> str:
         csv.writer(line).writerow(row)
         return line.getvalue().strip()
 
-# ref: https://stackoverflow.com/questions/3305926/python-csv-string-to-array
 # Deprecated: instead cast('liststr', line)
 def _cast_liststr_csvline(line: str) -> List[str]:
-    return list(map(str.strip, next(csv.reader([line]))))
+    return split_csvline(line)
+
+# Return the stripped fields of a line in a CSV file, first removing anything after the comment character
+# Most lines have no quotes, so they are split directly; lines that may need full CSV semantics go to csv.reader.
+# ref: https://stackoverflow.com/questions/3305926/python-csv-string-to-array
+def split_csvline(line: str, comment: Union[str, None] = None) -> List[str]:
+    if comment is not None:
+        line, _, _ = line.partition(comment)
+    if len(line) == 0: return []
+    if '"' in line or '\r' in line or '\n' in line:
+        return [field.strip() for field in next(csv.reader([line]), [])]
+    return [field.strip() for field in line.split(',')]
+
+# Compressed inputs are recognized by their first bytes, not their names
+compressed_suffixes = ('.gz', '.bz2', '.xz')
+_openers_for_magic = (
+    (b'\x1f\x8b', gzip.open),
+    (b'BZh', bz2.open),
+    (b'\xfd7zXZ\x00', lzma.open),
+)
+
+def _opener_for_magic(magic: bytes):
+    for prefix, opener in _openers_for_magic:
+        if magic.startswith(prefix): return opener
+    return None
+
+# Return the first bytes of a binary stream, read one at a time until they begin no magic or are one, or it ends
+# A pipe can hold fewer bytes than a magic, so they are read rather than peeked, and a line of text stops the reading
+# at its first byte or two, without waiting for more input.
+def _read_magic(stream) -> bytes:
+    r = b''
+    while any(len(r) < len(prefix) and prefix.startswith(r) for prefix, _ in _openers_for_magic):
+        byte = stream.read(1)
+        if len(byte) == 0: break
+        r += byte
+    return r
+
+# A binary stream of prefix and then the rest of stream, which reads what stream has as it arrives and leaves stream
+# open when it is closed
+class _PrefixedStream(io.RawIOBase):
+    def __init__(self, prefix: bytes, stream):
+        self._prefix = prefix
+        self._stream = stream
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        data = self._prefix[:len(b)] if len(self._prefix) > 0 else self._stream.read1(len(b))
+        self._prefix = self._prefix[len(data):]
+        b[:len(data)] = data
+        return len(data)
+
+# Open a file for reading text, decompressing gzip, bz2 and xz files as a stream; the path - is standard input
+# Closing the file opened for - leaves standard input open.
+def open_text(path: str) -> typing.TextIO:
+    if path == '-':
+        magic = _read_magic(sys.stdin.buffer)
+        stream = io.BufferedReader(_PrefixedStream(magic, sys.stdin.buffer))
+        opener = _opener_for_magic(magic)
+        if opener is None: return io.TextIOWrapper(stream, encoding=sys.stdin.encoding, errors=sys.stdin.errors)
+        return opener(stream, 'rt')
+    with open(path, 'rb') as f:
+        opener = _opener_for_magic(f.read(6))
+    return open(path, 'r') if opener is None else opener(path, 'rt')
+
+# Return the file name without any compression suffix
+def strip_compressed_suffix(filename: str) -> str:
+    for suffix in compressed_suffixes:
+        if filename.endswith(suffix): return filename[:-len(suffix)]
+    return filename
+
+# Yield the lines of a text file without their line endings, as file.read().split('\n') would
+def yield_lines(file: typing.TextIO):
+    ended_with_newline = True
+    for line in file:
+        ended_with_newline = line.endswith('\n')
+        yield line[:-1] if ended_with_newline else line
+    if ended_with_newline:
+        yield ''
 
 # Write to stderr
 # ref: https://stackoverflow.com/questions/5574702/how-do-i-print-to-stderr-in-python
@@ -44,6 +127,18 @@ def invert_dict(d: Dict[Any, Any]) -> Dict[Any, Set]:
         r.setdefault(v, set()).add(k)
     return r
 
+# Insert item into items, which are in order of key, after the items whose key equals its key
+# Appending is O(1) when the items arrive in order; an item that arrives late is placed by binary search.
+def insert_in_order(items: list, item, key) -> None:
+    if len(items) == 0 or key(items[-1]) <= key(item):
+        items.append(item)
+    else:
+        bisect.insort_right(items, item, key=key)
+
+# Return the items, which are in order of key, whose key is lo through hi
+def slice_in_order(items: list, lo, hi, key) -> list:
+    return items[bisect.bisect_left(items, lo, key=key):bisect.bisect_right(items, hi, key=key)]
+
 # ref: https://stackoverflow.com/questions/2937114/python-check-if-an-object-is-a-sequence
 def is_sequence(obj) -> bool:
     try:
@@ -98,5 +193,64 @@ class Test(unittest.TestCase):
             x, expected = test
             self.assertEqual(expected, _cast_liststr_csvline(x))
 
+    def test_insert_in_order(self):
+        items = []
+        for item in ((3, 'a'), (5, 'b'), (1, 'c'), (3, 'd'), (5, 'e'), (2, 'f')):
+            insert_in_order(items, item, key=lambda x: x[0])
+        self.assertEqual(['c', 'f', 'a', 'd', 'b', 'e'], [x[1] for x in items])
+        self.assertEqual(['f', 'a', 'd'], [x[1] for x in slice_in_order(items, 2, 4, key=lambda x: x[0])])
+        self.assertEqual([], slice_in_order(items, 6, 9, key=lambda x: x[0]))
+
+    def test_split_csvline(self):
+        tests = (
+            '',
+            'Asset: Cash',
+            '20190102, 20000, Cash, Common Stock, issuance of common stock',
+            ',,,,',
+            ' , a ,',
+            '1, "2, 3", 4',
+            '"a ""quoted"" field", b',
+            'a,"b',
+            'a\tb, c ',
+        )
+        for test in tests:
+            expected = list(map(str.strip, next(csv.reader([test]), [])))
+            self.assertEqual(expected, split_csvline(test))
+        self.assertEqual(['a', 'b'], split_csvline('a, b # comment, c', comment='#'))
+        self.assertEqual([], split_csvline('# comment', comment='#'))
+
+    def test_open_text(self):
+        text = 'Asset: Cash\n20250101, 1, Cash, Cash\n'
+        directory = tempfile.mkdtemp()
+        for name, opener in (('plain.txt', open), ('a.txt.gz', gzip.open), ('a.txt.bz2', bz2.open), ('a.txt.xz', lzma.open), ('misnamed.txt', gzip.open)):
+            path = os.path.join(directory, name)
+            with opener(path, 'wt') as f:
+                f.write(text)
+            with open_text(path) as f:
+                self.assertEqual(text.split('\n'), list(yield_lines(f)))
+        self.assertEqual('a.txt', strip_compressed_suffix('a.txt.xz'))
+
+        # standard input, from a pipe that delivers one byte at a time, is left open
+        class Trickle(io.RawIOBase):
+            def __init__(self, data):
+                self.data = data
+            def readable(self):
+                return True
+            def readinto(self, b):
+                n = min(1, len(b), len(self.data))
+                b[:n], self.data = self.data[:n], self.data[n:]
+                return n
+        stdin = sys.stdin
+        try:
+            for data, expected in ((text.encode(), text), (gzip.compress(text.encode()), text), (lzma.compress(text.encode()), text), (b'B\n', 'B\n'), (b'', '')):
+                sys.stdin = io.TextIOWrapper(io.BufferedReader(Trickle(data)))
+                with open_text('-') as f:
+                    self.assertEqual(expected, f.read())
+                self.assertFalse(sys.stdin.closed)
+        finally:
+            sys.stdin = stdin
+        self.assertEqual(['a', 'b'], list(yield_lines(io.StringIO('a\nb'))))
+        self.assertEqual([''], list(yield_lines(io.StringIO(''))))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,176 @@
+# An append-only log of text records, made durable in groups, atomically replaced snapshots of state derived from it,
+# and append-only files of pickled items, so that a snapshot can record what it has saved as the lengths of such files.
+# Each record is one line. A record is committed once its line, including the newline, has been written and fsynced;
+# a crash can leave a partial last line, which readers ignore and recover removes.
+from typing import Any, List, Tuple, Union
+
+import os
+import pickle
+import tempfile
+import unittest
+
+class WriteAheadLog:
+    # Records are buffered by append and made durable by commit, which writes every record appended since the previous
+    # commit and then fsyncs the file once, so a group of records costs one fsync.
+    def __init__(self, path: str):
+        created = not os.path.exists(path)
+        self.path = path
+        self._file = open(path, 'ab')
+        if created:
+            _fsync_directory(os.path.dirname(os.path.abspath(path)))
+        self.offset = self._file.tell()  # bytes committed
+        self._pending: List[bytes] = []
+
+    def __enter__(self) -> 'WriteAheadLog':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    @property
+    def n_pending(self) -> int:
+        return len(self._pending)
+
+    def append(self, record: str) -> None:
+        assert '\n' not in record and '\r' not in record, f'record {record!r} is not a single line'
+        self._pending.append(record.encode('utf-8') + b'\n')
+
+    def commit(self) -> None:
+        if len(self._pending) == 0: return
+        data = b''.join(self._pending)
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.offset += len(data)
+        self._pending = []
+
+    def close(self) -> None:
+        if self._file.closed: return
+        self.commit()
+        self._file.close()
+
+def _fsync_directory(directory: str) -> None:
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+# Return the committed records after offset, as (offset after the record, record), and remove any partial last line
+def recover(path: str, offset: int = 0) -> List[Tuple[int, str]]:
+    if not os.path.exists(path): return []
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    r = []
+    start = 0
+    while True:
+        end = data.find(b'\n', start)
+        if end < 0: break
+        r.append((offset + end + 1, data[start:end].decode('utf-8')))
+        start = end + 1
+    if start < len(data):
+        with open(path, 'r+b') as f:
+            f.truncate(offset + start)
+            os.fsync(f.fileno())
+    return r
+
+# Yield the lines of a log opened as text, without their newlines, ignoring a partial last line
+def yield_committed_lines(file):
+    for line in file:
+        if line.endswith('\n'):
+            yield line[:-1]
+
+# Replace the snapshot at path with state, so that a reader sees either the old snapshot or the new one
+def save_snapshot(path: str, state: Any) -> None:
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.snapshot-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    _fsync_directory(directory)
+
+# Return the state saved by save_snapshot, or None if there is no snapshot
+def load_snapshot(path: str) -> Union[Any, None]:
+    if not os.path.exists(path): return None
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+# Append items to the file at path as one pickled record after its first length bytes, which are the records already
+# recorded, fsync it and return its new length. Anything after length, left by a crash before the new length was
+# recorded, is overwritten.
+def append_items(path: str, length: int, items: list) -> int:
+    created = not os.path.exists(path)
+    with open(path, 'wb' if created else 'r+b') as f:
+        f.truncate(length)
+        f.seek(length)
+        pickle.dump(items, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+        r = f.tell()
+    if created:
+        _fsync_directory(os.path.dirname(os.path.abspath(path)))
+    return r
+
+# Return the items of the records in the first length bytes of the file at path, in the order they were appended
+def load_items(path: str, length: int) -> list:
+    r = []
+    with open(path, 'rb') as f:
+        while f.tell() < length:
+            r.extend(pickle.load(f))
+    return r
+
+
+class Test(unittest.TestCase):
+    def test_log(self):
+        path = os.path.join(tempfile.mkdtemp(), 'x.wal')
+        with WriteAheadLog(path) as log:
+            log.append('a,1')
+            log.append('b,2')
+            self.assertEqual(2, log.n_pending)
+            self.assertEqual(0, log.offset)
+            log.commit()
+            self.assertEqual(8, log.offset)
+            log.append('ç,3')
+        records = recover(path)
+        self.assertEqual([(4, 'a,1'), (8, 'b,2'), (13, 'ç,3')], records)
+        self.assertEqual([(13, 'ç,3')], recover(path, 8))
+
+    def test_recover_partial_record(self):
+        path = os.path.join(tempfile.mkdtemp(), 'x.wal')
+        with open(path, 'wb') as f:
+            f.write(b'a,1\nb,2\nc,')  # a crash while writing the third record
+        with open(path, 'r') as f:
+            self.assertEqual(['a,1', 'b,2'], list(yield_committed_lines(f)))
+        self.assertEqual([(4, 'a,1'), (8, 'b,2')], recover(path))
+        self.assertEqual(8, os.path.getsize(path))
+        with WriteAheadLog(path) as log:
+            log.append('c,3')
+        self.assertEqual([(12, 'c,3')], recover(path, 8))
+
+    def test_snapshot(self):
+        path = os.path.join(tempfile.mkdtemp(), 'x.snapshot')
+        self.assertIsNone(load_snapshot(path))
+        save_snapshot(path, {'offset': 1})
+        save_snapshot(path, {'offset': 2})
+        self.assertEqual({'offset': 2}, load_snapshot(path))
+        self.assertEqual(['x.snapshot'], os.listdir(os.path.dirname(path)))
+
+    def test_items(self):
+        path = os.path.join(tempfile.mkdtemp(), 'x.items')
+        length = append_items(path, 0, ['a', 'b'])
+        self.assertEqual(['a', 'b'], load_items(path, length))
+        append_items(path, length, ['c'])  # a crash before this length was recorded
+        longer = append_items(path, length, ['d', 'e'])
+        self.assertEqual(['a', 'b', 'd', 'e'], load_items(path, longer))
+        self.assertEqual(['a', 'b'], load_items(path, length))
+        self.assertEqual([], load_items(path, 0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+# Write files from a bounded pool of threads, so that rendering the next file overlaps writing the previous ones
+from typing import List, Union
+
+import concurrent.futures
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+class WriterPool:
+    # At most max_pending files are rendered but not yet written; write blocks until one finishes.
+    # n_writes, wait_seconds (spent blocked in write) and max_depth (most files pending at once) measure the pool.
+    def __init__(self, max_workers: int = 4, max_pending: int = 16, buffering: int = 1 << 20):
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='writer')
+        self._pending = threading.BoundedSemaphore(max_pending)
+        self._buffering = buffering
+        self._futures: List[concurrent.futures.Future] = []
+        self.max_pending = max_pending
+        self.n_writes = 0
+        self.wait_seconds = 0.0
+        self.max_depth = 0
+        self._depth = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> 'WriterPool':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close(raise_errors=exc_type is None)
+
+    # Write text to path in the background, as open(path, 'w', newline='').write(text) would
+    def write(self, path: str, text: str) -> None:
+        if not self._pending.acquire(blocking=False):
+            start = time.perf_counter()
+            self._pending.acquire()
+            self.wait_seconds += time.perf_counter() - start
+        with self._lock:
+            self.n_writes += 1
+            self._depth += 1
+            self.max_depth = max(self.max_depth, self._depth)
+        try:
+            self._futures.append(self._executor.submit(self._write, path, text))
+        except BaseException:
+            with self._lock:
+                self._depth -= 1
+            self._pending.release()
+            raise
+
+    def _write(self, path: str, text: str) -> None:
+        try:
+            with open(path, 'w', newline='', buffering=self._buffering) as f:
+                f.write(text)
+        finally:
+            with self._lock:
+                self._depth -= 1
+            self._pending.release()
+
+    # Wait for every write to finish, then raise the first error, if any
+    def close(self, raise_errors: bool = True) -> None:
+        self._executor.shutdown(wait=True)
+        futures, self._futures = self._futures, []
+        if raise_errors:
+            for future in futures:
+                future.result()
+
+# Write text to path, through the pool if there is one
+def write_text(path: str, text: str, pool: Union[WriterPool, None] = None) -> None:
+    if pool is None:
+        with open(path, 'w', newline='') as f:
+            f.write(text)
+    else:
+        pool.write(path, text)
+
+
+class Test(unittest.TestCase):
+    def test_write(self):
+        directory = tempfile.mkdtemp()
+        texts = {os.path.join(directory, f'{i}.csv'): f'a,b\r\n{i},{"x" * i}\r\n' for i in range(50)}
+        with WriterPool(max_workers=3, max_pending=2) as pool:
+            for path, text in texts.items():
+                pool.write(path, text)
+        for path, text in texts.items():
+            with open(path, 'r', newline='') as f:
+                self.assertEqual(text, f.read())
+        self.assertEqual(50, pool.n_writes)
+        self.assertTrue(1 <= pool.max_depth <= 2)
+
+    def test_errors_are_raised(self):
+        path = os.path.join(tempfile.mkdtemp(), 'no such directory', 'x.csv')
+        with self.assertRaises(FileNotFoundError):
+            with WriterPool() as pool:
+                pool.write(path, 'x')
+
+if __name__ == '__main__':
+    unittest.main()